@@ -0,0 +1,381 @@
+""" Benchmarks for the components of the LiveMind framework. Use `python benchmark.py -h` for more information. """
+import argparse
+import itertools
+import random
+import time
+import timeit
+import tracemalloc
+from live_mind import LMController
+from live_mind.abc import BaseModel
+from live_mind.action.abc import Action, CacheEntry
+from live_mind.action.actions import Inference, Wait
+from live_mind.action.cache import SegmentActionCache
+from live_mind.formatter import LMFormatter, LMFormat, PrefixStats
+from live_mind.formatter.functions import FORMATTER_MAP
+from live_mind.text import get_segmenter
+from live_mind.text.streamer import TextStreamer
+
+FORMAT_MAP = {
+    "u-pi"  : LMFormat.U_PI,
+    "u-pli" : LMFormat.U_PLI,
+    "ua-pil": LMFormat.UA_PIL,
+    "u-spi" : LMFormat.U_SPI,
+    "ua-spi": LMFormat.UA_SPI,
+    "ua-spa": LMFormat.UA_SPA,
+}
+# the formats whose message of a step is a prefix of the message of the next step
+APPEND_ONLY_FORMATS = ["ua-spa"]
+GRAUNLARITIES = ["char", "word", "sent", "clause", "sent-fast", "clause-fast", "token"]
+
+SAMPLE_TEXTS = [
+    "A tank is in the shape of a cylinder with a radius of 3 meters and a height of 10 meters. "
+    "Water is pumped into the tank at a rate of 2 cubic meters per minute, while it leaks at 0.5 cubic meters per minute. "
+    "How long does it take to fill the empty tank, in minutes?",
+    "Mr. Smith bought 3 apples, 4 oranges and 5 pears for his family. "
+    "The apples cost $1.20 each, the oranges cost $0.80 each, and the pears cost twice as much as the oranges. "
+    "If he paid with a $20 bill, how much change did he receive?",
+    "In the U.S. legal system, a contract signed by a minor is generally voidable. "
+    "Which of the following best describes the rights of the adult party to the contract, "
+    "assuming the minor has not yet reached the age of majority?",
+]
+
+
+# texts for the parity of the regex segmenters against the NLTK segmenters:
+# abbreviations, initials, numbers, ellipses, quotes and brackets, commas in numbers
+PARITY_TEXTS = SAMPLE_TEXTS + [
+    "Dr. Smith went to Washington D.C. on Jan. 5th, 2020. He met Mr. Jones, who said \"hello!\" It cost $1,250.50 in total.",
+    "The U.S. economy grew 3.5% in Q2. Prices rose by 1,000 units, 2,000 units, and 3,000 units. \"Why?\" she asked.",
+    "It's John's car, isn't it? We'd've gone; they'll come. (See Fig. 3 for details.) Items: a, b, c.",
+    "J. R. R. Tolkien wrote the book. It was published in 1954. The sequel came later... Nobody expected it!",
+    "Apples, oranges, etc. are fruits. Vegetables, e.g. carrots, are not. What about tomatoes, i.e. the red ones?",
+    "The meeting is at 3 p.m. tomorrow. Please bring the report, the slides, and the budget for Q3, 2024.",
+    "Which of the following is correct? (A) 1,000 (B) 2,500 (C) 3,750 (D) none of the above.",
+    "A train leaves at 9:30 a.m. and travels at 60 mph. Another train leaves at 10:00 a.m. at 80 mph. When does the second train catch up?",
+    "She said, \"I will come.\" Then she left. He replied: 'Fine.' The door closed.",
+    "Step 1. Mix the flour and water. Step 2. Add 2.5 cups of sugar. Step 3. Bake for 30 min. at 180 degrees.",
+]
+
+
+class ScriptedModel(BaseModel):
+    """ A deterministic stand-in for the LLM: cycles through the scripted responses, the messages can be recorded. """
+    def __init__(self, responses: list[str], stats: PrefixStats|None = None):
+        self.responses = itertools.cycle(responses)
+        self.stats = stats
+
+    def chat_complete(self, message: list[dict[str, str]]) -> str:
+        if self.stats is not None:
+            self.stats.update(message)
+        return next(self.responses)
+
+
+class ExtensionCache(SegmentActionCache):
+    """ An action cache which records whether the prompts of a read extend the prompts of the last written entry,
+    i.e. the segmenter did not revise the segments since the last inference. """
+    def __init__(self):
+        super().__init__()
+        self.num_written = 0
+        self.extends = True
+
+    def read_action(self, prompts: list[str]) -> tuple[list[CacheEntry], list[str]]:
+        cache_entries, new_prompts = super().read_action(prompts)
+        self.extends = len(cache_entries) >= self.num_written
+        return cache_entries, new_prompts
+
+    def write_action(self, actions: list[Action]):
+        self.num_written = self.saved_index + 1
+        super().write_action(actions)
+
+    def clear_cache(self):
+        super().clear_cache()
+        self.num_written = 0
+        self.extends = True
+
+
+class PrefixCheckModel(ScriptedModel):
+    """ A scripted model which counts the steps breaking the prefix of the previous message although the prompts are only extended """
+    def __init__(self, responses: list[str], stats: PrefixStats, cache: ExtensionCache):
+        super().__init__(responses, stats)
+        self.cache = cache
+        self.num_revised = 0
+        self.num_broken = 0
+
+    def chat_complete(self, message: list[dict[str, str]]) -> str:
+        assert self.stats is not None
+        num_steps, num_stable = self.stats.num_steps, self.stats.num_stable
+        response = super().chat_complete(message)
+        if self.stats.num_steps > num_steps and self.stats.num_stable == num_stable:
+            if self.cache.extends:
+                self.num_broken += 1
+            else:
+                self.num_revised += 1
+        return response
+
+
+def load_texts(text_file: str|None) -> list[str]:
+    if text_file is None:
+        return SAMPLE_TEXTS
+    with open(text_file, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def run_typing(controller: LMController, text: str):
+    """ Feed the text to the controller character by character """
+    for i in range(1, len(text) + 1):
+        for _ in controller(text[:i], stream_end=(i == len(text))):
+            pass
+    controller.reset()
+
+
+def bench_prefix(args):
+    """ Report the shared-prefix ratio between consecutive inference messages for each prompt format.
+    A format is append-only if every unstable step follows a revision of the segments (e.g. a word completed by a period),
+    which is asserted for `APPEND_ONLY_FORMATS`. """
+    texts = load_texts(args.text_file)
+    seg_kwargs = {"min_len": args.min_len} if args.granularity in ["sent", "clause", "sent-fast", "clause-fast"] else {}
+    responses = ["action inference. The quantities given so far are noted.", "action wait."]
+    print(f"{'format':<8} {'steps':>6} {'prefix ratio':>13} {'stable steps':>13} {'revised':>8} {'append-only':>12}")
+    for name in args.formats:
+        stats = PrefixStats()
+        cache = ExtensionCache()
+        infer_model = PrefixCheckModel(responses, stats, cache)
+        output_model = ScriptedModel(["The answer is (A)."])
+        controller = LMController(get_segmenter(args.granularity, **seg_kwargs), LMFormatter(FORMAT_MAP[name]), infer_model, output_model, action_cache=cache)
+        for text in texts:
+            stats.new_conversation()
+            run_typing(controller, text)
+        append_only = infer_model.num_broken == 0
+        print(f"{name:<8} {stats.num_steps:>6} {stats.ratio:>13.3f} {stats.stable_ratio:>13.3f} {infer_model.num_revised:>8} {'yes' if append_only else 'no':>12}")
+        assert append_only or name not in APPEND_ONLY_FORMATS, f"{name} is not append-only: {infer_model.num_broken} steps break the prefix of the previous message"
+
+
+def linear_get_index(cache_entries: list[CacheEntry], prompts: list[str]) -> tuple[int, int]:
+    """ The reference lookup of `SegmentActionCache._get_index` which compares the entries one by one """
+    p_index = 0
+    e_index = 0
+    for entry in cache_entries:
+        if len(prompts) - p_index < len(entry.prompts):
+            break
+        if prompts[p_index: p_index + len(entry.prompts)] == entry.prompts:
+            p_index += len(entry.prompts)
+            e_index += 1
+        else:
+            break
+    return e_index, p_index
+
+
+def bench_index(args):
+    """ Report the per-call cost of the prompt lookup of the action cache as the conversation grows """
+    print(f"{'segments':>9} {'strings':>8} {'linear (us)':>12} {'indexed (us)':>13} {'speedup':>8}")
+    for num_segments in args.segments:
+        segments = [f"segment {i} of the input, " for i in range(num_segments)]
+        cache = SegmentActionCache()
+        for i in range(0, num_segments, args.entry_len):
+            cache.read_action(segments[:i + args.entry_len])
+            cache.write_action([Action(Inference, f"inference {i}") if i % 2 else Action(Wait, "")])
+        # a keystroke: the cached prompts followed by a new incomplete segment
+        for strings in ["shared", "copied"]:
+            if strings == "shared":
+                # the segmenter keeps the committed segments (e.g. IncrementalSegmenter)
+                prompts = segments + ["new"]
+            else:
+                # the segmenter re-creates every segment
+                prompts = [("_" + segment)[1:] for segment in segments] + ["new"]
+            assert cache._get_index(prompts) == linear_get_index(cache.cached_entries, prompts)
+            linear = min(timeit.repeat(lambda: linear_get_index(cache.cached_entries, prompts), number=args.number, repeat=5)) / args.number
+            indexed = min(timeit.repeat(lambda: cache._get_index(prompts), number=args.number, repeat=5)) / args.number
+            print(f"{num_segments:>9} {strings:>8} {linear * 1e6:>12.2f} {indexed * 1e6:>13.2f} {linear / indexed:>7.1f}x")
+
+
+def bench_segment(args):
+    """ Report the parity of the regex segmenters with the NLTK segmenters on the typed prefixes and the per-call cost """
+    texts = load_texts(args.text_file) if args.text_file else PARITY_TEXTS
+    # all the prefixes that end with a complete word, as seen by the controller while typing
+    prefixes = [text[:i] for text in texts for i in range(1, len(text) + 1) if i == len(text) or text[i] == " "]
+    print(f"{'segmenter':<12} {'full texts':>11} {'prefixes':>9} {'nltk (us)':>10} {'fast (us)':>10} {'speedup':>8}")
+    for name in ["sent", "clause"]:
+        nltk_segmenter = get_segmenter(name, min_len=args.min_len)
+        fast_segmenter = get_segmenter(f"{name}-fast", min_len=args.min_len)
+        start = time.perf_counter()
+        nltk_segmenter(texts[0])
+        first_call = time.perf_counter() - start
+        full_match = sum(nltk_segmenter(text) == fast_segmenter(text) for text in texts)
+        prefix_match = 0
+        for prefix in prefixes:
+            nltk_segs, fast_segs = nltk_segmenter(prefix), fast_segmenter(prefix)
+            if nltk_segs == fast_segs:
+                prefix_match += 1
+            elif args.show_mismatches and prefix in texts:
+                print(f"  nltk: {nltk_segs}\n  fast: {fast_segs}")
+        nltk_time = min(timeit.repeat(lambda: [nltk_segmenter(text) for text in texts], number=args.number, repeat=3)) / args.number / len(texts)
+        fast_time = min(timeit.repeat(lambda: [fast_segmenter(text) for text in texts], number=args.number, repeat=3)) / args.number / len(texts)
+        print(f"{name + '-fast':<12} {full_match:>5}/{len(texts):<5} {prefix_match / len(prefixes):>9.1%} {nltk_time * 1e6:>10.1f} {fast_time * 1e6:>10.1f} {nltk_time / fast_time:>7.1f}x")
+    print(f"first call of the NLTK segmenter (import and model loading): {first_call * 1e3:.1f} ms")
+
+
+def bench_spans(args):
+    """ Report the per-keystroke cost (segmentation and cache lookup) and the memory of the cached prompts
+    with string segments and with span segments """
+    text = " ".join(load_texts(args.text_file)) * args.repeat
+    print(f"{'segments':<9} {'keystrokes':>10} {'time (s)':>9} {'us/key':>7} {'cache (KiB)':>12}")
+    for spans in [False, True]:
+        segmenter = get_segmenter(args.granularity, min_len=args.min_len, incremental=True, spans=spans)
+        cache = SegmentActionCache()
+        tracemalloc.start()
+        start = time.perf_counter()
+        for i in range(1, len(text) + 1):
+            prompts = segmenter(text[:i])[:-1]
+            _, new_prompts = cache.read_action(prompts)
+            if new_prompts:
+                cache.write_action([Action(Wait, "")])
+        elapsed = time.perf_counter() - start
+        # the cache holds the prompts, the input text is held by the caller in both cases
+        entries = cache.cached_entries
+        cache_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del entries
+        name = "span" if spans else "str"
+        print(f"{name:<9} {len(text):>10} {elapsed:>9.2f} {elapsed / len(text) * 1e6:>7.1f} {cache_size / 1024:>12.1f}")
+
+
+def bench_format(args):
+    """ Report the per-call cost of formatting the inference message against the number of cached entries,
+    re-rendering all the entries (the functions of `FORMATTER_MAP`) and rendering the new entries only (`LMFormatter`) """
+    print(f"{'format':<8} {'entries':>8} {'full (us)':>10} {'incr. (us)':>11} {'speedup':>8}")
+    for name in args.formats:
+        format = FORMAT_MAP[name]
+        for num_entries in args.entries:
+            formatter = LMFormatter(format)
+            entries = []
+            for i in range(num_entries):
+                action = Action(Inference, f"inference {i} of the input.") if i % 3 == 0 else Action(Wait, "")
+                entries.append(CacheEntry([action], [f"segment {i}, ", "of the input "]))
+            new_prompts = ["new segment"]
+            assert formatter._format_user(entries, new_prompts) == FORMATTER_MAP[format](entries, new_prompts)
+            # a keystroke: the entries are unchanged, the new prompts differ
+            full = min(timeit.repeat(lambda: FORMATTER_MAP[format](entries, new_prompts), number=args.number, repeat=5)) / args.number
+            incremental = min(timeit.repeat(lambda: formatter._format_user(entries, new_prompts), number=args.number, repeat=5)) / args.number
+            print(f"{name:<8} {num_entries:>8} {full * 1e6:>10.1f} {incremental * 1e6:>11.1f} {full / incremental:>7.1f}x")
+
+
+class LoopTextStreamer(TextStreamer):
+    """ The reference streamer which calls `delay_fn` for every piece in `wait`, `next` and `flush` """
+    def next(self) -> str|None:
+        if self.index >= self.max_index:
+            return None
+        next_text = self.text[self.index]
+        self.index += 1
+        if self.index == self.max_index and self.final_text:
+            next_text += self.final_text
+        self.last_gen_time += self.delay_fn(self.text[self.index - 1])
+        self.current_time = self.last_gen_time
+        return next_text
+
+
+    def wait(self, delay: float) -> str|None:
+        assert delay >= 0
+        texts = []
+        while self.index < self.max_index:
+            next_text = self.text[self.index]
+            next_time = self.last_gen_time - self.current_time + self.delay_fn(next_text)
+            if delay < next_time:
+                break
+            self.index += 1
+            delay -= next_time
+            self.current_time += next_time
+            self.last_gen_time = self.current_time
+            if self.index == self.max_index and self.final_text:
+                next_text += self.final_text
+            texts.append(next_text)
+        self.current_time += delay
+        return "".join(texts) if texts else None
+
+
+    def flush(self) -> str|None:
+        if self.index >= self.max_index:
+            return None
+        remaining_text = "".join(self.text[self.index:])
+        self.index = self.max_index
+        self.last_gen_time += self.delay_fn(remaining_text)
+        self.current_time = self.last_gen_time
+        return remaining_text + (self.final_text or "")
+
+
+def run_stream(streamer: TextStreamer, gen_times: list[float]) -> list[tuple[str, float, float]]:
+    """ Drive the streamer like `run_solver`: wait for the generation time of each step, or for the next piece """
+    steps = []
+    for gen_time in itertools.cycle(gen_times):
+        next_text = streamer.wait(gen_time)
+        if next_text is None:
+            next_text = streamer.next()
+            if next_text is None:
+                break
+        steps.append((next_text, streamer.current_time, streamer.last_gen_time))
+    return steps
+
+
+def bench_streamer(args):
+    """ Report the parity and the cost of simulating the typing of the texts with the precomputed arrival times
+    against the reference streamer """
+    texts = [text * args.repeat for text in load_texts(args.text_file)]
+    rng = random.Random(0)
+    gen_times = [rng.choice([0.0, 0.1, 0.5, 2.0, 8.0]) for _ in range(97)]
+    delay_fn = lambda text: len(text) / args.speed * 60
+    num_chars = sum(len(text) for text in texts)
+    print(f"{'streamer':<9} {'chars':>8} {'time (ms)':>10} {'us/char':>8}")
+    results = {}
+    for name, streamer_class in [("loop", LoopTextStreamer), ("array", TextStreamer)]:
+        start = time.perf_counter()
+        results[name] = [run_stream(streamer_class(text, delay_fn, final_text="?"), gen_times) for text in texts]
+        elapsed = time.perf_counter() - start
+        print(f"{name:<9} {num_chars:>8} {elapsed * 1e3:>10.1f} {elapsed / num_chars * 1e6:>8.2f}")
+    # the times can differ in the last digits, as the reference accumulates the delays step by step
+    same_texts = all([step[0] for step in loop] == [step[0] for step in array] for loop, array in zip(results["loop"], results["array"]))
+    max_error = max(abs(a - b) for loop, array in zip(results["loop"], results["array"]) for x, y in zip(loop, array) for a, b in zip(x[1:], y[1:]))
+    print(f"same texts: {same_texts}, max time difference: {max_error:.2e} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the LiveMind framework")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    prefix_parser = subparsers.add_parser("prefix", help="shared-prefix ratio of consecutive inference messages (KV-cache reuse) per prompt format")
+    prefix_parser.add_argument("-pf", "--formats", metavar="FMT", type=str, nargs="+", default=list(FORMAT_MAP.keys()), choices=FORMAT_MAP.keys(), help=f"prompt formats, can be {', '.join(FORMAT_MAP.keys())}")
+    prefix_parser.add_argument("-g", "--granularity", metavar="G", type=str, default="clause", choices=GRAUNLARITIES, help=f"granularity of the segmenter, can be {', '.join(GRAUNLARITIES)}, default: clause")
+    prefix_parser.add_argument("--min-len", metavar="N", type=int, default=10, help="minimum length of the segment if using sent or clause granularity (or the -fast versions), default: 10")
+    prefix_parser.add_argument("--text-file", metavar="File", type=str, default=None, help="file with one input text per line, default: built-in samples")
+    prefix_parser.set_defaults(func=bench_prefix)
+
+    index_parser = subparsers.add_parser("index", help="per-call cost of the prompt lookup of the action cache against the number of cached segments")
+    index_parser.add_argument("--segments", metavar="N", type=int, nargs="+", default=[10, 100, 1000, 5000], help="numbers of cached segments, default: 10 100 1000 5000")
+    index_parser.add_argument("--entry-len", metavar="N", type=int, default=1, help="number of segments per cache entry, default: 1")
+    index_parser.add_argument("--number", metavar="N", type=int, default=200, help="number of lookups per measurement, default: 200")
+    index_parser.set_defaults(func=bench_index)
+
+    segment_parser = subparsers.add_parser("segment", help="parity and per-call cost of the regex segmenters (sent-fast, clause-fast) against the NLTK segmenters")
+    segment_parser.add_argument("--min-len", metavar="N", type=int, default=10, help="minimum length of the segment, default: 10")
+    segment_parser.add_argument("--text-file", metavar="File", type=str, default=None, help="file with one input text per line, default: built-in parity texts")
+    segment_parser.add_argument("--number", metavar="N", type=int, default=20, help="number of runs per measurement, default: 20")
+    segment_parser.add_argument("--show-mismatches", action="store_true", help="print the full texts segmented differently")
+    segment_parser.set_defaults(func=bench_segment)
+
+    spans_parser = subparsers.add_parser("spans", help="per-keystroke cost and cache memory of string segments against span segments")
+    spans_parser.add_argument("-g", "--granularity", metavar="G", type=str, default="clause-fast", choices=["sent-fast", "clause-fast"], help="granularity of the segmenter, can be sent-fast, clause-fast, default: clause-fast")
+    spans_parser.add_argument("--min-len", metavar="N", type=int, default=10, help="minimum length of the segment, default: 10")
+    spans_parser.add_argument("--text-file", metavar="File", type=str, default=None, help="file with one input text per line, default: built-in samples")
+    spans_parser.add_argument("--repeat", metavar="N", type=int, default=20, help="number of times the texts are repeated as one input, default: 20")
+    spans_parser.set_defaults(func=bench_spans)
+
+    format_parser = subparsers.add_parser("format", help="per-call cost of the prompt formatting against the number of cached entries")
+    format_parser.add_argument("-pf", "--formats", metavar="FMT", type=str, nargs="+", default=list(FORMAT_MAP.keys()), choices=FORMAT_MAP.keys(), help=f"prompt formats, can be {', '.join(FORMAT_MAP.keys())}")
+    format_parser.add_argument("--entries", metavar="N", type=int, nargs="+", default=[10, 100, 1000], help="numbers of cached entries, default: 10 100 1000")
+    format_parser.add_argument("--number", metavar="N", type=int, default=100, help="number of calls per measurement, default: 100")
+    format_parser.set_defaults(func=bench_format)
+
+    streamer_parser = subparsers.add_parser("streamer", help="cost of the typing simulation with precomputed arrival times against the per-piece loop")
+    streamer_parser.add_argument("--text-file", metavar="File", type=str, default=None, help="file with one input text per line, default: built-in samples")
+    streamer_parser.add_argument("--repeat", metavar="N", type=int, default=20, help="number of times each text is repeated, default: 20")
+    streamer_parser.add_argument("--speed", metavar="CPM", type=float, default=240, help="typing speed in characters per minute, default: 240")
+    streamer_parser.set_defaults(func=bench_streamer)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,6 +1,7 @@
 """ Configuration file """
 from abc import ABC, abstractmethod
-from live_mind.models.ollama_adapter import OllamaAdapter
+from live_mind.models.ollama import OllamaModel
+from live_mind.models.simulated import SimulatedModel
 
 # the dataset path should contain the `.parquet` files
 # path to the MMLU-PRO dataset
@@ -11,78 +12,33 @@ MMLU_PATH = "/home/hendrix/LiveMind/mmlu"
 # the model path should contain a `config.json` file
 
 LLAMA_MODELS = ["llama-3.2:1b"]
+# the models served by Ollama, by their Ollama names
+OLLAMA_MODELS = LLAMA_MODELS + ["llama3.2:1b"]
+# simulated models with the latency of a small (fast) and a large (slow) model, to benchmark without model weights
+SIMULATED_MODELS = ["sim-fast", "sim-slow"]
 
 def get_model(name: str):
+    if name in SIMULATED_MODELS:
+        return get_model_simulated(name)
     return get_model_ollama_example(name)
 
 
+def get_model_simulated(name: str) -> 'BaseModel':
+    """ Simulated model (see `live_mind.models.simulated`), the responses are deterministic and the timings are simulated """
+    assert name in SIMULATED_MODELS, f"Model {name} is not supported."
+    if name == "sim-fast":
+        return SimulatedModel(ttft=0.03, prefill_per_token=0.0001, decode_rate=80.0)
+    return SimulatedModel(ttft=0.2, prefill_per_token=0.0005, decode_rate=20.0, answers="ABCDEFGHIJ")
+
+
 def get_model_ollama_example(name: str) -> 'BaseModel':
     """
-    Minimal Ollama adapter implementing the same BaseModel interface as the OpenAI/Anthropic examples.
+    Model served by Ollama, implementing the BaseModel interface (and BaseStreamModel for the stream controllers).
+    The requests share a keep-alive connection pool, set OLLAMA_URL to use another server.
     Expects `message` in chat_complete to be a list of {"role": "...", "content": "..."}.
     """
-    import requests
     assert name in OLLAMA_MODELS, f"Model {name} is not supported."
-
-    OLLAMA_URL = "http://localhost:11434/api/chat"
-    TIMEOUT = 120  # seconds
-
-    class Model(BaseModel):
-        def chat_complete(self, message):
-            """
-            message: list[dict], e.g. [{"role":"system","content":"..."},
-                                       {"role":"user","content":"..."}]
-            Returns: response text (string)
-            """
-            # Basic payload: forward messages as-is (Ollama uses the same role keys)
-            payload = {
-                "model": name,
-                "messages": message,
-                # you can add other options here if desired, e.g. temperature, stop, etc.
-                "temperature": 0.0,
-            }
-
-            try:
-                resp = requests.post(OLLAMA_URL, json=payload, timeout=TIMEOUT)
-                resp.raise_for_status()
-                j = resp.json()
-            except Exception as e:
-                # Keep failure mode similar to other adapters: return empty string on failure
-                # Optionally you can log/print e for debugging
-                print(f"[OllamaAdapter] request error: {e}")
-                return ""
-
-            # Try common shapes for Ollama responses
-            # 1) {"choices":[{"message":{"content":"..."}}]}
-            try:
-                return j["choices"][0]["message"]["content"] or ""
-            except Exception:
-                pass
-
-            # 2) {"choices":[{"content":"..."}]} or {"choices":[{"text":"..."}]}
-            try:
-                choice0 = j.get("choices", [{}])[0]
-                if "content" in choice0 and isinstance(choice0["content"], str):
-                    return choice0["content"]
-                if "text" in choice0 and isinstance(choice0["text"], str):
-                    return choice0["text"]
-            except Exception:
-                pass
-
-            # 3) fallback: try top-level 'output' or just stringify JSON
-            try:
-                if "output" in j and isinstance(j["output"], str):
-                    return j["output"]
-            except Exception:
-                pass
-
-            # nothing matched: return stringified json (or empty)
-            try:
-                return str(j)
-            except Exception:
-                return ""
-
-    return Model()
+    return OllamaModel(name, options={"temperature": 0.0})
 
 
 class BaseModel(ABC):
@@ -4,10 +4,14 @@ __all__ = [
     'formatter',
     'text',
     'utils',
+    'models',
     'LMController',
     'LMStreamController',
     'CompleteController',
-    'CompleteStreamController'
+    'CompleteStreamController',
+    'AsyncLMController',
+    'AsyncCompleteController',
+    'LMPipeline'
 ]
 
 from . import controller
@@ -15,9 +19,13 @@ from . import action
 from . import formatter
 from . import text
 from . import utils
+from . import models
 from .controller import (
     LMController,
     LMStreamController,
     CompleteController,
-    CompleteStreamController
+    CompleteStreamController,
+    AsyncLMController,
+    AsyncCompleteController,
+    LMPipeline
 )
\ No newline at end of file
@@ -1,5 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Iterator
+from typing import Iterator, AsyncIterator
 
 class BaseModel(ABC):
     """ Base model class """
@@ -7,6 +8,12 @@ class BaseModel(ABC):
     def chat_complete(self, message: list[dict[str, str]]) -> str:
         pass
 
+    def batch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        """ Complete a batch of messages, the responses are in the same order as the messages.
+        Models that support batched inference should override this method, by default the messages are completed one by one.
+        """
+        return [self.chat_complete(message) for message in messages]
+
 class BaseStreamModel(BaseModel):
     """ Base stream model class """
     @abstractmethod
@@ -18,3 +25,25 @@ class BaseStreamModel(BaseModel):
             - `Iterator[str]`: the response of the model
         """
         pass
+
+class AsyncBaseModel(ABC):
+    """ Base model class with non-blocking calls, used by the async controllers """
+    @abstractmethod
+    async def achat_complete(self, message: list[dict[str, str]]) -> str:
+        pass
+
+    async def abatch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        """ Complete a batch of messages, by default the messages are completed concurrently """
+        return list(await asyncio.gather(*(self.achat_complete(message) for message in messages)))
+
+class AsyncBaseStreamModel(AsyncBaseModel):
+    """ Base stream model class with non-blocking calls """
+    @abstractmethod
+    def astream(self, message: list[dict[str, str]]) -> AsyncIterator[str]:
+        """ Stream the response of the model asynchronously
+        - args:
+            - message (`list[dict[str, str]]`): the message to be sent to the model
+        - returns:
+            - `AsyncIterator[str]`: the response of the model
+        """
+        pass
@@ -3,6 +3,8 @@ __all__ = [
     'Inference',
     'Wait',
     'Response',
+    'Summarize',
+    'ACTION_TYPES',
 ]
 
 from .abc import ActionType
@@ -21,3 +23,13 @@ Response = ActionType(
     name="response",
     inst="response to the user's prompt based on the available information.",
 )
+
+Summarize = ActionType(
+    name="summarize",
+    inst="summarize the available information and the previous inferences.",
+)
+
+# the action types by name, used to restore the actions from the serialized cache
+ACTION_TYPES: dict[str, ActionType] = {
+    action_type.name: action_type for action_type in [Inference, Wait, Response, Summarize]
+}
@@ -1,7 +1,15 @@
 """ Action cache based on the segmentation scheme. """
-__all__ = ['SegmentActionCache']
+__all__ = ['SegmentActionCache', 'TreeActionCache']
 
-from .abc import CacheEntry, Action
+import heapq
+from bisect import bisect_right
+from itertools import accumulate
+from collections.abc import Iterable
+from .abc import CacheEntry, Action, ActionType
+from .actions import ACTION_TYPES
+
+# version of the serialized cache
+STATE_VERSION = 1
 
 class SegmentActionCache():
     """ Action cache based on the segmentation scheme.
@@ -10,6 +18,11 @@ class SegmentActionCache():
         - `read_action`: read the cached actions and new prompt based on the prompt
         - `write_action`: write new actions to the cache
         - `clear_cache`: clear the cache
+        - `snapshot`/`restore`: save and roll back the cached entries
+        - `to_dict`/`load_dict`: serialize and deserialize the cached entries
+
+        The prompts of the cached entries are indexed as a flattened list with the end offset of each entry,
+        which is maintained on every write, so the lookup does not walk the entries one by one.
        """
     def __init__(
         self,
@@ -17,6 +30,9 @@ class SegmentActionCache():
         self.cached_entries: list[CacheEntry] = []
         self.saved_prompts: list[str] = []
         self.saved_index = -1
+        # index of the cached prompts
+        self._flat_prompts: list[str] = []
+        self._entry_ends: list[int] = []
 
 
     def read_action(
@@ -54,6 +70,56 @@ class SegmentActionCache():
         self.cached_entries = []
         self.saved_prompts = []
         self.saved_index = -1
+        self._flat_prompts = []
+        self._entry_ends = []
+
+
+    def snapshot(self) -> list[CacheEntry]:
+        """ Return a snapshot of the cached entries, which can be restored with `restore` """
+        return list(self.cached_entries)
+
+
+    def restore(self, snapshot: list[CacheEntry]):
+        """ Roll back the cache to a snapshot, e.g. to discard the actions of a preempted inference """
+        self.cached_entries = list(snapshot)
+        self.saved_prompts = []
+        self.saved_index = -1
+        self._rebuild_index()
+
+
+    def to_dict(self) -> dict:
+        """ Serialize the cached entries to a JSON-compatible dict, the action types are saved by name:
+        `{"version": 1, "entries": [[[prompt, ...], [[action_name, content], ...]], ...]}`
+        The prompts are saved as strings (spans are materialized), the spans compare equal to them after loading.
+        """
+        entries = [
+            [[str(prompt) for prompt in entry.prompts], [[action.type.name, action.content] for action in entry.actions]]
+            for entry in self.cached_entries
+        ]
+        return {"version": STATE_VERSION, "entries": entries}
+
+
+    def load_dict(self, state: dict, action_types: Iterable[ActionType]|None = None):
+        """ Restore the cached entries from a dict created by `to_dict`.
+        The action types are looked up by name in `action_types` and the built-in action types (`ACTION_TYPES`).
+        """
+        if state.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported cache state version: {state.get('version')}")
+        types_by_name = dict(ACTION_TYPES)
+        if action_types is not None:
+            types_by_name.update({action_type.name: action_type for action_type in action_types})
+
+        cached_entries = []
+        for prompts, actions in state["entries"]:
+            entry_actions = []
+            for name, content in actions:
+                if name not in types_by_name:
+                    raise ValueError(f"Unknown action type: {name}")
+                entry_actions.append(Action(type=types_by_name[name], content=content))
+            cached_entries.append(CacheEntry(entry_actions, list(prompts)))
+        self.clear_cache()
+        self.cached_entries = cached_entries
+        self._rebuild_index()
 
 
     def reset_action(self, actions: list[Action]):
@@ -61,6 +127,7 @@ class SegmentActionCache():
         cached_prompts = [prompt for entry in self.cached_entries for prompt in entry.prompts]
         self.clear_cache()
         self.cached_entries = [CacheEntry(actions, cached_prompts),]
+        self._rebuild_index()
 
 
     def _write_action(self, new_entry: CacheEntry, e_index: int):
@@ -75,6 +142,20 @@ class SegmentActionCache():
             # update the entry
             self.cached_entries[e_index] = new_entry
             self.cached_entries = self.cached_entries[: e_index + 1]
+            # drop the prompts of the replaced entries from the index
+            start = self._entry_ends[e_index - 1] if e_index > 0 else 0
+            del self._flat_prompts[start:]
+            del self._entry_ends[e_index:]
+        else:
+            return
+        self._flat_prompts.extend(new_entry.prompts)
+        self._entry_ends.append(len(self._flat_prompts))
+
+
+    def _rebuild_index(self):
+        """ Rebuild the prompt index after the cached entries are replaced """
+        self._flat_prompts = [prompt for entry in self.cached_entries for prompt in entry.prompts]
+        self._entry_ends = list(accumulate(len(entry.prompts) for entry in self.cached_entries))
 
 
     def _get_index(self, prompts: list[str]) -> tuple[int, int]:
@@ -85,20 +166,208 @@ class SegmentActionCache():
         If all entries match the prompts, `e_index` is the length of the cached actions.
         If all prompts match the cached prompts, `p_index` is the length of the prompts.
         """
-        # initialize the index
-        prompt_len = len(prompts)
-        p_index = 0
-        e_index = 0
-        # Retrieve cached actions
-        for action in self.cached_entries:
-            prompts_of_action = action.prompts
-            if prompt_len - p_index < len(prompts_of_action):
-                # The prompts of the action is longer than the remaining prompts
-                break
-            if prompts[p_index: p_index + len(prompts_of_action)] == prompts_of_action:
-                p_index += len(prompts_of_action)
-                e_index += 1
+        flat_prompts = self._flat_prompts
+        entry_ends = self._entry_ends
+        num_cached = len(flat_prompts)
+        # Fast path: all cached prompts match, i.e. only new prompts are appended.
+        # The list comparison runs in C and compares the identical strings by identity.
+        if len(prompts) >= num_cached and prompts[:num_cached] == flat_prompts:
+            return len(entry_ends), num_cached
+
+        # Otherwise, binary search the last entry whose prompts (and all the prompts before) match.
+        # The entries are checked from the end of the matched range, so only the mismatched tail is compared again.
+        low, high = 0, bisect_right(entry_ends, len(prompts))
+        matched = 0
+        while low < high:
+            mid = (low + high + 1) // 2
+            start = entry_ends[low - 1] if low > 0 else 0
+            end = entry_ends[mid - 1]
+            if prompts[start:end] == flat_prompts[start:end]:
+                low = mid
+                matched = end
             else:
-                # The prompts of the action do not match the given prompts
+                high = mid - 1
+        return low, matched
+
+
+class _Node():
+    """ Node of the `TreeActionCache`, the root node has no entry """
+    def __init__(self, entry: CacheEntry|None, parent: '_Node|None'):
+        self.entry = entry
+        self.parent = parent
+        self.children: list[_Node] = []
+        self.last_visit = 0
+
+
+class TreeActionCache(SegmentActionCache):
+    """ Action cache that keeps the divergent branches of the conversation.
+
+        `SegmentActionCache` drops all the entries after a mismatched entry, so the inferences are made again
+        when the user edits the input and retypes it. This cache keeps the entries as a tree: the current path is
+        `cached_entries`, and the branches off the path are kept, so the prompts that match a kept branch are read from it.
+
+        - args:
+            - `max_nodes`: the maximum number of entries in the tree, the least recently visited branches are evicted
+       """
+    def __init__(
+        self,
+        max_nodes: int = 1024,
+    ):
+        assert max_nodes > 0
+        self.max_nodes = max_nodes
+        self._root = _Node(None, None)
+        self._path: list[_Node] = []
+        self._num_nodes = 0
+        self._clock = 0
+        super().__init__()
+
+
+    def read_action(
+        self,
+        prompts: list[str],
+    ) -> tuple[list[CacheEntry], list[str]]:
+        """ Read the cached entries and new prompts based on the prompts, the kept branches are followed
+        after the current path is mismatched. """
+        if len(prompts) == 0:
+            return [], []
+
+        e_index, p_index = self._get_index(prompts)
+        path = self._path[:e_index]
+        node = path[-1] if path else self._root
+        while True:
+            child = self._match_child(node, prompts, p_index)
+            if child is None:
                 break
-        return e_index, p_index
+            path.append(child)
+            p_index += len(child.entry.prompts)
+            node = child
+        if len(path) > e_index:
+            self._set_path(path)
+            e_index = len(path)
+
+        retrieved_entries = self.cached_entries[:e_index]
+        new_prompts = prompts[p_index:]
+        self.saved_prompts = new_prompts
+        self.saved_index = e_index
+        return retrieved_entries, new_prompts
+
+
+    def clear_cache(self):
+        """ Clear the cache, including all the branches """
+        super().clear_cache()
+        self._root = _Node(None, None)
+        self._path = []
+        self._num_nodes = 0
+
+
+    def _write_action(self, new_entry: CacheEntry, e_index: int):
+        """ Write a new entry with the action index to the cache, the branches after the entry are kept """
+        if e_index < 0 or e_index > len(self.cached_entries):
+            raise ValueError("Invalid index to write action")
+        if e_index < len(self._path) and self._path[e_index].entry == new_entry:
+            return
+        parent = self._path[e_index - 1] if e_index > 0 else self._root
+        self._set_path(self._path[:e_index] + [self._add_child(parent, new_entry)])
+        self._evict()
+
+
+    def _rebuild_index(self):
+        """ Rebuild the prompt index and attach the replaced cached entries to the tree """
+        super()._rebuild_index()
+        path: list[_Node] = []
+        node = self._root
+        for entry in self.cached_entries:
+            node = self._add_child(node, entry)
+            path.append(node)
+        self._path = path
+        self._visit(path)
+        self._evict()
+
+
+    def _set_path(self, path: list[_Node]):
+        """ Set the current path and update the cached entries and the prompt index from the first changed node """
+        old_path = self._path
+        common = 0
+        for old_node, new_node in zip(old_path, path):
+            if old_node is not new_node:
+                break
+            common += 1
+        # the nodes that leave the path are visited until now
+        self._visit(old_path[common:])
+        self._visit(path[common:])
+        self._path = path
+
+        new_entries = [node.entry for node in path[common:]]
+        self.cached_entries = self.cached_entries[:common] + new_entries
+        start = self._entry_ends[common - 1] if common > 0 else 0
+        del self._flat_prompts[start:]
+        del self._entry_ends[common:]
+        for entry in new_entries:
+            self._flat_prompts.extend(entry.prompts)
+            self._entry_ends.append(len(self._flat_prompts))
+
+
+    def _add_child(self, parent: _Node, entry: CacheEntry) -> _Node:
+        """ Return the child of the parent with the entry. A child with the same prompts but different actions is replaced
+        with its branch, since the actions after it are inferred based on the replaced actions. """
+        for i, child in enumerate(parent.children):
+            if child.entry.prompts == entry.prompts:
+                if child.entry == entry:
+                    return child
+                self._num_nodes -= _count_nodes(child)
+                del parent.children[i]
+                break
+        node = _Node(entry, parent)
+        parent.children.append(node)
+        self._num_nodes += 1
+        return node
+
+
+    def _match_child(self, node: _Node, prompts: list[str], p_index: int) -> _Node|None:
+        """ Return the child with the most prompts that match the prompts from `p_index`, or None """
+        matched = None
+        for child in node.children:
+            child_prompts = child.entry.prompts
+            if not child_prompts or (matched is not None and len(child_prompts) <= len(matched.entry.prompts)):
+                continue
+            if prompts[p_index: p_index + len(child_prompts)] == child_prompts:
+                matched = child
+        return matched
+
+
+    def _visit(self, nodes: list[_Node]):
+        self._clock += 1
+        for node in nodes:
+            node.last_visit = self._clock
+
+
+    def _evict(self):
+        """ Evict the least recently visited leaves off the current path until the tree fits in `max_nodes` """
+        if self._num_nodes <= self.max_nodes:
+            return
+        on_path = {id(node) for node in self._path}
+        leaves = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children)
+            if not node.children and node.entry is not None and id(node) not in on_path:
+                leaves.append((node.last_visit, id(node), node))
+        heapq.heapify(leaves)
+        while self._num_nodes > self.max_nodes and leaves:
+            _, _, leaf = heapq.heappop(leaves)
+            parent = leaf.parent
+            parent.children.remove(leaf)
+            self._num_nodes -= 1
+            if not parent.children and parent.entry is not None and id(parent) not in on_path:
+                heapq.heappush(leaves, (parent.last_visit, id(parent), parent))
+
+
+def _count_nodes(node: _Node) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        count += 1
+    return count
@@ -16,6 +16,11 @@ while not stream_end:
         print(response)
 
 controller.reset()
+
+The async controllers are used the same way in a coroutine, with `async for`:
+
+    async for response in async_controller(input_stream.text, stream_end=stream_end):
+        print(response)
 """
 
 __all__ = [
@@ -23,15 +28,35 @@ __all__ = [
     'CompleteController',
     'LMStreamController',
     'CompleteStreamController',
+    'AsyncLMController',
+    'AsyncCompleteController',
+    'LMPipeline',
+    'BaseThrottle',
+    'AdaptiveThrottle',
+    'BaseAnswerVerifier',
+    'ActionAnswerVerifier',
+    'PREEMPT_MODES',
 ]
 
-from collections.abc import Callable, Generator
+import time
+import json
+import asyncio
+from contextlib import aclosing
+from collections.abc import Callable, Generator, AsyncGenerator, Iterator
 from . import abc
-from ..abc import BaseModel, BaseStreamModel
+from ..abc import BaseModel, BaseStreamModel, AsyncBaseModel, AsyncBaseStreamModel
 from ..action import Action
 from ..action.cache import SegmentActionCache, CacheEntry
-from ..action.actions import Wait, Inference, Response
-from ..formatter import BaseFormatter
+from ..action.actions import Wait, Inference, Response, Summarize
+from ..formatter import BaseFormatter, ActionStreamParser
+from .throttle import BaseThrottle, AdaptiveThrottle
+from .verifier import BaseAnswerVerifier, ActionAnswerVerifier
+
+# how to handle an inference preempted by new input:
+# - "none": the inference is never preempted
+# - "discard": the partial response is discarded, the prompts are inferred again with the new input
+# - "truncate": the partial response is committed to the cache as a truncated action
+PREEMPT_MODES = ["none", "discard", "truncate"]
 
 class LMController(abc.BaseController):
     """ the LMController::
@@ -40,7 +65,17 @@ class LMController(abc.BaseController):
     - `formatter`: `BaseFormatter`: the formatter for the prompts
     - `infer_model`: `BaseModel`: the model for the inference stage
     - `output_model`: `BaseModel`: the model for the output stage
+    - `hypothesize`: `bool`: not implemented yet, default: `False`
+    - `summarize_len`: `int`: when the number of inferences in the cache exceeds `summarize_len`, the inferences are summarized
+       into one summarize action by the inference model to bound the prompt length. `-1` to disable the summarization. default: `-1`
     - `answer_format`: `str|None`: the format for the answer. The `answer_format` is append to the final prompt at the output stage. default: `None`
+    - `throttle`: `BaseThrottle|None`: the policy to skip inferences that cannot complete in time, the skipped prompts are merged into the next inference. default: `None`
+    - `answer_verifier`: `BaseAnswerVerifier|None`: if the verifier finds the answer in the cached actions at the output stage, its response is returned
+       without calling the output model. default: `None`
+    - `action_cache`: `SegmentActionCache|None`: the action cache, e.g. a `TreeActionCache` to keep the inferences of the edited input. default: a new `SegmentActionCache`
+    - `action_parser`: `ActionStreamParser|None`: if set and the inference model is a `BaseStreamModel`, the inference response is streamed and
+       the generation is stopped once the parser decides a wait action, the response is off-format, or the token cap of the action is reached.
+       A stopped off-format response is written as a wait action. default: `None`
     - `logger`: `logging.Logger|None`: the logger for the controller, default: `None`
     """
 
@@ -53,14 +88,22 @@ class LMController(abc.BaseController):
         hypothesize: bool = False,
         summarize_len: int = -1,
         answer_format: str|None = None,
+        throttle: BaseThrottle|None = None,
+        answer_verifier: BaseAnswerVerifier|None = None,
+        action_cache: SegmentActionCache|None = None,
+        action_parser: ActionStreamParser|None = None,
     ):
-        self.action_cache = SegmentActionCache()
+        self.action_cache = action_cache if action_cache is not None else SegmentActionCache()
         self.segmenter = segmenter
         self.formatter = formatter
         self.infer_model = infer_model
         self.output_model = output_model
         self.answer_format = answer_format
         self.action_types = [Wait, Inference]
+        self.throttle = throttle
+        self.summarize_len = summarize_len
+        self.answer_verifier = answer_verifier
+        self.action_parser = action_parser
 
 
     def  __call__(self, prompt: str, stream_end:bool=False) -> Generator[str, None, None]:
@@ -68,6 +111,8 @@ class LMController(abc.BaseController):
         prompts = self.segmenter(prompt)
         if not stream_end:
             prompts = prompts[:-1]
+        if self.throttle is not None:
+            self.throttle.observe_input(len(prompts))
         cache_entries, new_prompts = self.action_cache.read_action(prompts)
         if not new_prompts:
             return
@@ -84,33 +129,83 @@ class LMController(abc.BaseController):
             yield response
         else:
             actions = []
-            infer_action, response = self._inference(cache_entries, new_prompts)
+            infer_result = self._inference(cache_entries, new_prompts)
+            if infer_result is None:
+                # the inference is skipped by the throttle
+                return
+            infer_action, response = infer_result
             actions.append(infer_action)
-            yield response
             self.action_cache.write_action(actions)
+            # the summarization is part of the step, so it runs before the response is yielded (and timed by the caller)
+            if self._need_summarize():
+                self._summarize()
+            yield response
 
 
-    def _inference(self, cache_entries, new_prompts: list[str]) -> tuple[Action, str]:
-        """ execute the inference stage """
-        msg = self.formatter.format_inference(cache_entries, new_prompts)
+    def _need_summarize(self) -> bool:
+        """ Check if the number of inferences in the cache exceeds `summarize_len` """
+        return _need_summarize(self.action_cache.cached_entries, self.summarize_len)
+
+
+    def _summarize(self):
+        """ execute the summarization stage: replace the cached actions with the summary, the prompts are kept """
+        msg = self.formatter.format_summarize(self.action_cache.cached_entries)
         response = self.infer_model.chat_complete(msg)
-        # if the action is not parsed, write a wait as a placeholder to avoid frequent inference
+        self.action_cache.reset_action([_parse_summary(self.formatter, response),])
+
+
+    def _inference(self, cache_entries, new_prompts: list[str]) -> tuple[Action, str]|None:
+        """ execute the inference stage, return `None` if the inference is skipped by the throttle """
+        msg = self.formatter.format_inference(cache_entries, new_prompts)
+        if self.throttle is not None and not self.throttle.should_infer(msg):
+            return None
+        start_time = time.perf_counter()
+        if self.action_parser is not None and isinstance(self.infer_model, BaseStreamModel):
+            response = "".join(self._parse_stream(self.infer_model.stream(msg)))
+        else:
+            response = self.infer_model.chat_complete(msg)
+        if self.throttle is not None:
+            self.throttle.record(msg, time.perf_counter() - start_time)
+        return self._parse_response(response), response
+
+
+    def _parse_stream(self, response_gen: Iterator[str]) -> Generator[str, None, None]:
+        """ Yield the pieces of the response until the action parser stops the generation,
+        the response stream is closed when the generation is stopped """
+        assert self.action_parser is not None
+        self.action_parser.reset(self.action_types)
+        try:
+            for text in response_gen:
+                yield text
+                if self.action_parser.feed(text):
+                    break
+        finally:
+            close = getattr(response_gen, "close", None)
+            if close is not None:
+                close()
+
+
+    def _parse_response(self, response: str) -> Action:
+        """ Parse the action of the inference response """
+        parser = self.action_parser
+        if parser is not None and parser.stopped and parser.off_format:
+            # the off-format response is stopped early, write a wait as a placeholder
+            return Action(type=Wait)
+        # if the action is not parsed, the response is written as an inference
         action = self.formatter.parse_action(response, self.action_types)
         if action is None:
             action = Action(type=Inference, content=response)
-        return action, response
+        return action
 
 
     def _output(self, cache_entries: list[CacheEntry], new_prompts: list[str]) -> tuple[Action, str]:
         """ execute the output stage """
+        if self.answer_verifier is not None:
+            response = self.answer_verifier.verify(cache_entries, new_prompts)
+            if response is not None:
+                return Action(type=Response, content=response), response
         msg = self.formatter.format_output(cache_entries, new_prompts)
-        if self.answer_format:
-            if msg[-1]['role'] == 'user':
-                msg[-1]['content'] += "\n\n"+self.answer_format
-            elif msg[-2]['role'] == 'user':
-                msg[-2]['content'] += "\n\n"+self.answer_format
-            else:
-                raise ValueError("The last two messages are not from the user.")
+        _add_answer_format(msg, self.answer_format)
         response = self.output_model.chat_complete(msg)
         action = Action(type=Response, content=response)
         return action, response
@@ -119,6 +214,55 @@ class LMController(abc.BaseController):
     def reset(self):
         """ Reset the controller for a new conversation """
         self.action_cache.clear_cache()
+        if self.throttle is not None:
+            self.throttle.reset()
+
+
+    def dumps(self) -> str:
+        """ Serialize the session state (the action cache) to a compact JSON string, which can be restored by `loads`.
+        The state can be saved to disk or sent to another process to resume the session without running the inferences again. """
+        return _dumps_state(self.action_cache)
+
+
+    def loads(self, state: str):
+        """ Restore the session state from a string created by `dumps`, the current state is replaced """
+        self.action_cache.load_dict(json.loads(state), self.action_types)
+
+
+def _dumps_state(action_cache: SegmentActionCache) -> str:
+    return json.dumps(action_cache.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+
+def _add_answer_format(msg: list[dict[str, str]], answer_format: str|None):
+    """ Append the answer format to the last user message """
+    if not answer_format:
+        return
+    if msg[-1]['role'] == 'user':
+        msg[-1]['content'] += "\n\n"+answer_format
+    elif msg[-2]['role'] == 'user':
+        msg[-2]['content'] += "\n\n"+answer_format
+    else:
+        raise ValueError("The last two messages are not from the user.")
+
+
+def _need_summarize(cache_entries: list[CacheEntry], summarize_len: int) -> bool:
+    """ Check if the number of inferences in the cache entries exceeds `summarize_len`, `-1` to disable the summarization """
+    if summarize_len < 0:
+        return False
+    num_inferences = 0
+    for entry in cache_entries:
+        for action in entry.actions:
+            if action.formatted_content:
+                num_inferences += 1
+    return num_inferences > summarize_len
+
+
+def _parse_summary(formatter: BaseFormatter, response: str) -> Action:
+    """ Parse the response of the summarization stage """
+    action = formatter.parse_action(response, [Summarize,])
+    if action is None:
+        action = Action(type=Summarize, content=response)
+    return action
 
 
 class CompleteController(abc.BaseController):
@@ -162,6 +306,10 @@ class LMStreamController(LMController, abc.BaseStreamController):
     The iter_call method returns a generator of TextStreamer, for each yielded TextStreamer, the user should iterate over the TextStreamer
     and to exhauste it to get the response strings. If the TextStreamer is not exhausted, an Exception will be raised. (See the TextStreamer
     class in live_mind/controller/abc.py for more information)
+
+    If new input arrives during an inference, the user can call `close` on the TextStreamer to stop the generation,
+    the partial response is handled according to `preempt` (see `PREEMPT_MODES`) when the generator is resumed.
+    With `action_parser` set (see `LMController`), the response stream of the inference ends once the parser stops the generation.
     """
     def __init__(
         self,
@@ -170,14 +318,26 @@ class LMStreamController(LMController, abc.BaseStreamController):
         infer_model: BaseStreamModel,
         output_model: BaseStreamModel,
         answer_format: str|None = None,
+        preempt: str = "discard",
+        throttle: BaseThrottle|None = None,
+        summarize_len: int = -1,
+        answer_verifier: BaseAnswerVerifier|None = None,
+        action_cache: SegmentActionCache|None = None,
+        action_parser: ActionStreamParser|None = None,
     ):
-        self.action_cache = SegmentActionCache()
+        assert preempt in PREEMPT_MODES
+        self.action_cache = action_cache if action_cache is not None else SegmentActionCache()
         self.segmenter = segmenter
         self.formatter = formatter
         self.infer_model: BaseStreamModel = infer_model
         self.output_model: BaseStreamModel = output_model
         self.answer_format = answer_format
         self.action_types = [Wait, Inference]
+        self.preempt = preempt
+        self.throttle = throttle
+        self.summarize_len = summarize_len
+        self.answer_verifier = answer_verifier
+        self.action_parser = action_parser
 
 
     def iter_call(
@@ -188,6 +348,8 @@ class LMStreamController(LMController, abc.BaseStreamController):
         prompts = self.segmenter(prompt)
         if not stream_end:
             prompts = prompts[:-1]
+        if self.throttle is not None:
+            self.throttle.observe_input(len(prompts))
         cache_entries, new_prompts = self.action_cache.read_action(prompts)
         if not new_prompts:
             return
@@ -206,24 +368,35 @@ class LMStreamController(LMController, abc.BaseStreamController):
         else:
             actions = []
             infer_action = yield from self._iter_inference(cache_entries, new_prompts)
+            if infer_action is None:
+                # the inference is skipped, or preempted and discarded
+                return
             actions.append(infer_action)
             self.action_cache.write_action(actions)
+            if self._need_summarize():
+                self._summarize()
 
 
     def _iter_inference(
         self,
         cache_entries: list[CacheEntry],
         new_prompts: list[str]
-    ) -> Generator[abc.RespnseStreamer, None, Action]:
+    ) -> Generator[abc.RespnseStreamer, None, Action|None]:
         msg = self.formatter.format_inference(cache_entries, new_prompts)
+        if self.throttle is not None and not self.throttle.should_infer(msg):
+            return None
+        start_time = time.perf_counter()
         response_gen = self.infer_model.stream(msg)
+        if self.action_parser is not None:
+            response_gen = self._parse_stream(response_gen)
         text_streamer = abc.RespnseStreamer(response_gen)
         yield text_streamer
         response = text_streamer.text
-        action = self.formatter.parse_action(response, self.action_types)
-        if action is None:
-            action = Action(type=Inference, content=response)
-        return action
+        if self.throttle is not None and not text_streamer.closed:
+            self.throttle.record(msg, time.perf_counter() - start_time)
+        if text_streamer.closed and (self.preempt != "truncate" or not response):
+            return None
+        return self._parse_response(response)
 
 
     def _iter_output(
@@ -231,6 +404,11 @@ class LMStreamController(LMController, abc.BaseStreamController):
         cache_entries: list[CacheEntry],
         new_prompts: list[str]
     ) -> Generator[abc.RespnseStreamer, None, Action]:
+        if self.answer_verifier is not None:
+            response = self.answer_verifier.verify(cache_entries, new_prompts)
+            if response is not None:
+                yield abc.RespnseStreamer(iter([response,]))
+                return Action(type=Response, content=response)
         msg = self.formatter.format_output(cache_entries, new_prompts)
         if self.answer_format:
             msg[-1]['content'] += "\n\n"+self.answer_format
@@ -275,3 +453,212 @@ class CompleteStreamController(abc.BaseStreamController):
 
     def reset(self):
         pass
+
+
+class AsyncLMController(abc.BaseAsyncController):
+    """ The AsyncLMController is the asyncio version of the LMController: `__call__` returns an async generator and the
+    model calls do not block the event loop, so that a single event loop can drive many sessions concurrently.
+    The segmentation, the action cache and the formatter are used the same way as in the LMController.
+
+    Compared to the LMController, the AsyncLMController requires the models to be async models (AsyncBaseModel) with the `achat_complete` method:
+    - async achat_complete(self, message: list[dict[str, str]]) -> str
+    Blocking models can be wrapped with `live_mind.models.ThreadedAsyncModel`.
+
+    Each session should have its own controller, the models and the formatter can be shared among the controllers.
+    Calls to the same controller are executed one after another. The action is written to the cache before the response is yielded.
+
+    With `preempt` set to "discard" or "truncate" (see `PREEMPT_MODES`), a call with new segments or with `stream_end` cancels
+    the in-flight inference of the previous call instead of waiting for it. If the inference model is an AsyncBaseStreamModel,
+    the response stream is closed, and with "truncate" the partial response is committed to the cache and yielded by the preempted call.
+    Steps that are already superseded by a newer call when they start are skipped.
+    """
+    def __init__(
+        self,
+        segmenter: Callable[[str], list[str]],
+        formatter: BaseFormatter,
+        infer_model: AsyncBaseModel,
+        output_model: AsyncBaseModel,
+        answer_format: str|None = None,
+        preempt: str = "none",
+        throttle: BaseThrottle|None = None,
+        summarize_len: int = -1,
+        answer_verifier: BaseAnswerVerifier|None = None,
+        action_cache: SegmentActionCache|None = None,
+    ):
+        assert preempt in PREEMPT_MODES
+        self.action_cache = action_cache if action_cache is not None else SegmentActionCache()
+        self.segmenter = segmenter
+        self.formatter = formatter
+        self.infer_model = infer_model
+        self.output_model = output_model
+        self.answer_format = answer_format
+        self.action_types = [Wait, Inference]
+        self.preempt = preempt
+        self.throttle = throttle
+        self.summarize_len = summarize_len
+        self.answer_verifier = answer_verifier
+        self._lock = asyncio.Lock()
+        self._latest_prompts: list[str] = []
+        self._inference_task: asyncio.Task|None = None
+        self._inference_prompts: list[str] = []
+        self._partial_response: list[str] = []
+        self._preempted = False
+
+
+    async def __call__(self, prompt: str, stream_end: bool=False) -> AsyncGenerator[str, None]:
+        """ Return the async generator of responses from the LLM given the prompt """
+        prompts = self.segmenter(prompt)
+        if not stream_end:
+            prompts = prompts[:-1]
+        self._latest_prompts = prompts
+        if self.throttle is not None:
+            self.throttle.observe_input(len(prompts))
+        if self.preempt != "none" and (stream_end or prompts != self._inference_prompts):
+            self.cancel()
+
+        async with self._lock:
+            if self.preempt != "none" and not stream_end and self._latest_prompts is not prompts:
+                # a newer call has arrived while waiting, the step is superseded
+                return
+            cache_entries, new_prompts = self.action_cache.read_action(prompts)
+            if not new_prompts:
+                return
+            self._inference_prompts = prompts
+            response = await self._step(cache_entries, new_prompts, stream_end)
+        if response is not None:
+            yield response
+
+
+    def cancel(self) -> bool:
+        """ Cancel the in-flight inference, return `True` if an inference is cancelled. """
+        task = self._inference_task
+        if task is None or task.done():
+            return False
+        self._preempted = True
+        task.cancel()
+        return True
+
+
+    async def _step(self, cache_entries: list[CacheEntry], new_prompts: list[str], stream_end: bool=False) -> str|None:
+        """ The main step for the controller, return the response of the LLM for the step.
+        If `stream_end` is `True`, execute the output stage. Otherwise, execute the inference stage.
+        Return `None` if the inference is skipped, or preempted and discarded. """
+        if stream_end:
+            action, response = await self._output(cache_entries, new_prompts)
+        else:
+            infer_result = await self._inference(cache_entries, new_prompts)
+            if infer_result is None:
+                return None
+            action, response = infer_result
+        self.action_cache.write_action([action,])
+        if not stream_end and _need_summarize(self.action_cache.cached_entries, self.summarize_len):
+            await self._summarize()
+        return response
+
+
+    async def _summarize(self):
+        """ execute the summarization stage: replace the cached actions with the summary, the prompts are kept """
+        msg = self.formatter.format_summarize(self.action_cache.cached_entries)
+        response = await self.infer_model.achat_complete(msg)
+        self.action_cache.reset_action([_parse_summary(self.formatter, response),])
+
+
+    async def _inference(self, cache_entries: list[CacheEntry], new_prompts: list[str]) -> tuple[Action, str]|None:
+        """ execute the inference stage, return `None` if the inference is skipped, or preempted and discarded """
+        msg = self.formatter.format_inference(cache_entries, new_prompts)
+        if self.throttle is not None and not self.throttle.should_infer(msg):
+            return None
+        start_time = time.perf_counter()
+        if self.preempt == "none":
+            response = await self.infer_model.achat_complete(msg)
+        else:
+            self._partial_response = []
+            self._preempted = False
+            self._inference_task = asyncio.ensure_future(self._generate(msg))
+            try:
+                response = await self._inference_task
+            except asyncio.CancelledError:
+                if not self._preempted:
+                    raise
+                response = "".join(self._partial_response)
+                if self.preempt == "discard" or not response:
+                    return None
+            finally:
+                self._inference_task = None
+        if self.throttle is not None and not self._preempted:
+            self.throttle.record(msg, time.perf_counter() - start_time)
+
+        action = self.formatter.parse_action(response, self.action_types)
+        if action is None:
+            action = Action(type=Inference, content=response)
+        return action, response
+
+
+    async def _generate(self, msg: list[dict[str, str]]) -> str:
+        """ generate the inference response, the received pieces are recorded to handle preemption """
+        if not isinstance(self.infer_model, AsyncBaseStreamModel):
+            return await self.infer_model.achat_complete(msg)
+        async with aclosing(self.infer_model.astream(msg)) as response_gen:
+            async for text in response_gen:
+                self._partial_response.append(text)
+        return "".join(self._partial_response)
+
+
+    async def _output(self, cache_entries: list[CacheEntry], new_prompts: list[str]) -> tuple[Action, str]:
+        """ execute the output stage """
+        if self.answer_verifier is not None:
+            response = self.answer_verifier.verify(cache_entries, new_prompts)
+            if response is not None:
+                return Action(type=Response, content=response), response
+        msg = self.formatter.format_output(cache_entries, new_prompts)
+        _add_answer_format(msg, self.answer_format)
+        response = await self.output_model.achat_complete(msg)
+        action = Action(type=Response, content=response)
+        return action, response
+
+
+    def reset(self):
+        """ Reset the controller for a new conversation """
+        self.action_cache.clear_cache()
+        if self.throttle is not None:
+            self.throttle.reset()
+
+
+    def dumps(self) -> str:
+        """ Serialize the session state (the action cache) to a compact JSON string, which can be restored by `loads`.
+        Must not be called during a step. """
+        return _dumps_state(self.action_cache)
+
+
+    def loads(self, state: str):
+        """ Restore the session state from a string created by `dumps`, the current state is replaced.
+        Must not be called during a step. """
+        self.action_cache.load_dict(json.loads(state), self.action_types)
+
+
+class AsyncCompleteController(abc.BaseAsyncController):
+    """ The asyncio version of the CompleteController, used as the baseline for the async controllers. """
+    def __init__(
+        self,
+        formatter: BaseFormatter,
+        output_model: AsyncBaseModel,
+        answer_format: str|None = None
+    ) -> None:
+        self.formatter = formatter
+        self.output_model = output_model
+        self.answer_format = answer_format
+
+    async def __call__(self, prompt: str, stream_end: bool=False) -> AsyncGenerator[str, None]:
+        """ Return the async generator for the response of the LLM given the prompt """
+        if not stream_end:
+            return
+        msg = self.formatter.format_output([], [prompt,])
+        if self.answer_format:
+            msg[-1]['content'] += "\n\n"+self.answer_format
+        yield await self.output_model.achat_complete(msg)
+
+    def reset(self):
+        pass
+
+
+from .pipeline import LMPipeline
@@ -1,11 +1,12 @@
 __all__ = [
     'BaseController',
     'BaseStreamController',
+    'BaseAsyncController',
     'RespnseStreamer'
 ]
 
 from abc import ABC, abstractmethod
-from collections.abc import Iterator, Generator
+from collections.abc import Iterator, Generator, AsyncGenerator
 
 class BaseController(ABC):
     """ The base class for the controller in the live_mind framework:
@@ -40,12 +41,30 @@ class BaseStreamController(BaseController):
         pass
 
 
+class BaseAsyncController(ABC):
+    """ The base class for the async controller in the live_mind framework:
+    it is used the same way as the base controller, but the `__call__` method returns an async generator,
+    so that one event loop can drive many controllers (sessions) concurrently.
+
+    methods:
+    - `__call__`: generate the prompts based on the user input, use `stream_end` to indicate the end of the stream, the async generator is empty if no prompt is generated.
+    """
+    @abstractmethod
+    def __call__(self, prompt:str, stream_end:bool=False) -> AsyncGenerator[str, None]:
+        pass
+
+    @abstractmethod
+    def reset(self):
+        pass
+
+
 class RespnseStreamer:
     """ A wrapper for the generator of response strings to record the response text """
     def __init__(self, text_generator: Iterator[str]):
         self.text_generator = text_generator
         self._text = ""
         self._exhausted = False
+        self._closed = False
 
     def __iter__(self):
         return self
@@ -72,3 +91,17 @@ class RespnseStreamer:
     def exhausted(self):
         return self._exhausted
 
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """ Stop the response stream before it is exhausted (e.g. when new input arrives), the text received so far is kept.
+        The underlying generator is closed, which also closes the connection of stream models. """
+        if self._exhausted:
+            return
+        close = getattr(self.text_generator, "close", None)
+        if close is not None:
+            close()
+        self._exhausted = True
+        self._closed = True
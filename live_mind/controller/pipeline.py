@@ -0,0 +1,98 @@
+""" Pipelined inference: the input and the inference stage run concurrently as producer and consumer.
+usage:
+pseudo code:
+
+pipeline = LMPipeline(AsyncLMController(...), on_response=print)
+pipeline.start()
+
+async for text in input_stream: # the text changes as the user types
+    pipeline.push(text) # returns immediately
+
+async for response in pipeline.finish(input_stream.text):
+    print(response)
+"""
+__all__ = ['LMPipeline']
+
+import asyncio
+from collections.abc import Callable, AsyncGenerator
+from . import AsyncLMController
+
+
+class LMPipeline:
+    """ Run the inference stage of an `AsyncLMController` in a background worker.
+    The producer pushes the current input text with `push`, the worker consumes the queue continuously:
+    when the worker is ready, texts that arrived during the last inference are merged and only the latest text is inferred,
+    the actions are written to the action cache as soon as the inferences complete.
+
+    `finish` stops the worker and starts the output stage immediately with the inferences completed so far.
+    If the controller supports preemption (`preempt` is not "none"), the in-flight inference is handled according to the mode,
+    otherwise it is cancelled and discarded.
+    - args:
+        - controller: the controller of the session, the pipeline is used for one session at a time
+        - on_response: called with each response of the inference stage, default: `None`
+    """
+    def __init__(
+        self,
+        controller: AsyncLMController,
+        on_response: Callable[[str], None]|None = None,
+    ):
+        self.controller = controller
+        self.on_response = on_response
+        self._queue: asyncio.Queue[str|None] = asyncio.Queue()
+        self._worker: asyncio.Task|None = None
+
+
+    def start(self):
+        """ Start the worker, must be called in a running event loop """
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+
+
+    def push(self, text: str):
+        """ Push the current input text to the inference stage, does not wait for the inference """
+        self._queue.put_nowait(text)
+
+
+    async def finish(self, text: str) -> AsyncGenerator[str, None]:
+        """ Stop the inference stage and return the async generator of the responses of the output stage """
+        await self.stop()
+        async for response in self.controller(text, stream_end=True):
+            yield response
+
+
+    async def stop(self):
+        """ Stop the worker, texts that are not inferred yet are dropped """
+        worker = self._worker
+        if worker is None:
+            return
+        self._worker = None
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+        if not self.controller.cancel():
+            worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+
+
+    def reset(self):
+        """ Reset the controller for a new conversation, the worker must be stopped """
+        assert self._worker is None, "stop the pipeline before reset"
+        self.controller.reset()
+
+
+    async def _run(self):
+        """ The worker of the inference stage """
+        while True:
+            text = await self._queue.get()
+            # merge the texts arrived during the last inference
+            while text is not None and not self._queue.empty():
+                text = self._queue.get_nowait()
+            if text is None:
+                return
+            async for response in self.controller(text):
+                if self.on_response is not None:
+                    self.on_response(response)
@@ -0,0 +1,152 @@
+""" Throttling policies to decide whether the inference stage is executed for new prompts """
+__all__ = [
+    'BaseThrottle',
+    'AdaptiveThrottle',
+    'LatencyModel',
+]
+
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+
+
+class BaseThrottle(ABC):
+    """ Base class for the throttling policy of the controllers.
+    If the inference of the new prompts is skipped, the prompts are merged into the next inference.
+
+    methods:
+    - `observe_input`: called at every call of the controller with the number of complete prompts
+    - `should_infer`: decide whether to execute the inference stage with the formatted message
+    - `record`: record the generation time of an inference
+    - `reset`: reset the input statistics for a new conversation
+    """
+    @abstractmethod
+    def observe_input(self, num_prompts: int):
+        pass
+
+    @abstractmethod
+    def should_infer(self, message: list[dict[str, str]]) -> bool:
+        pass
+
+    @abstractmethod
+    def record(self, message: list[dict[str, str]], gen_time: float):
+        pass
+
+    @abstractmethod
+    def reset(self):
+        pass
+
+
+class LatencyModel:
+    """ Online linear model of the generation time as a function of the prompt length: `time = a + b * length`.
+    Fitted by least squares with exponential forgetting, so the model follows changes of the backend load.
+    - args:
+        - decay: the weight of the previous observations at each update, default: 0.95
+    """
+    def __init__(self, decay: float=0.95):
+        assert 0 < decay <= 1
+        self.decay = decay
+        self.num_samples = 0
+        self._w = 0.0
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+
+    def update(self, length: float, gen_time: float):
+        d = self.decay
+        self._w = d * self._w + 1
+        self._sx = d * self._sx + length
+        self._sy = d * self._sy + gen_time
+        self._sxx = d * self._sxx + length * length
+        self._sxy = d * self._sxy + length * gen_time
+        self.num_samples += 1
+
+    def predict(self, length: float) -> float|None:
+        """ Predict the generation time, return `None` if there is no observation """
+        if self.num_samples == 0:
+            return None
+        mean_x = self._sx / self._w
+        mean_y = self._sy / self._w
+        var_x = self._sxx / self._w - mean_x * mean_x
+        if var_x <= 1e-9:
+            # all prompts have (almost) the same length
+            return mean_y
+        slope = (self._sxy / self._w - mean_x * mean_y) / var_x
+        slope = max(slope, 0.0) # longer prompts are never faster
+        return mean_y + slope * (length - mean_x)
+
+
+class AdaptiveThrottle(BaseThrottle):
+    """ Skip inferences that cannot complete before the next prompt arrives.
+    The generation time is predicted by a `LatencyModel` of the prompt length (characters of the message) learned online,
+    the inter-arrival time of the prompts is estimated with an exponential moving average.
+    An inference is skipped (and the prompts merged into the next one) if the predicted generation time exceeds
+    `headroom` times the inter-arrival time, at most `max_merge` inferences are skipped in a row.
+    - args:
+        - clock: the clock for the arrival times of the prompts (seconds), default: `time.monotonic`.
+          Set it to the simulated clock when the input is simulated.
+        - headroom: the fraction of the inter-arrival time available for an inference, default: 1.0
+        - max_merge: the maximum number of consecutive skipped inferences, default: 4
+        - min_samples: the number of observations before throttling starts, default: 2
+        - decay: the decay of the latency model and the moving average, default: 0.9
+    """
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        headroom: float = 1.0,
+        max_merge: int = 4,
+        min_samples: int = 2,
+        decay: float = 0.9,
+    ):
+        self.clock = clock
+        self.headroom = headroom
+        self.max_merge = max_merge
+        self.min_samples = min_samples
+        self.decay = decay
+        self.latency_model = LatencyModel(decay)
+        self.num_skipped = 0 # total number of skipped inferences, for statistics
+        self.reset()
+
+    def reset(self):
+        self.interval: float|None = None
+        self._num_arrivals = 0
+        self._num_prompts = 0
+        self._last_arrival: float|None = None
+        self._merged = 0
+
+    def observe_input(self, num_prompts: int):
+        if num_prompts > self._num_prompts:
+            now = self.clock()
+            if self._last_arrival is not None:
+                interval = (now - self._last_arrival) / (num_prompts - self._num_prompts)
+                if self.interval is None:
+                    self.interval = interval
+                else:
+                    self.interval = self.decay * self.interval + (1 - self.decay) * interval
+                self._num_arrivals += 1
+            self._last_arrival = now
+        self._num_prompts = num_prompts
+
+    def should_infer(self, message: list[dict[str, str]]) -> bool:
+        predicted = self.latency_model.predict(_message_len(message))
+        if (
+            predicted is None
+            or self.interval is None
+            or self.latency_model.num_samples < self.min_samples
+            or self._num_arrivals < self.min_samples
+            or self._merged >= self.max_merge
+            or predicted <= self.headroom * self.interval
+        ):
+            self._merged = 0
+            return True
+        self._merged += 1
+        self.num_skipped += 1
+        return False
+
+    def record(self, message: list[dict[str, str]], gen_time: float):
+        self.latency_model.update(_message_len(message), gen_time)
+
+
+def _message_len(message: list[dict[str, str]]) -> int:
+    return sum(len(m["content"]) for m in message)
@@ -0,0 +1,69 @@
+""" Verifiers to answer from the cached actions at the output stage without calling the output model """
+__all__ = [
+    'BaseAnswerVerifier',
+    'ActionAnswerVerifier',
+]
+
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from ..action.abc import CacheEntry
+
+
+class BaseAnswerVerifier(ABC):
+    """ Base class for the answer verifier of the output stage.
+
+    methods:
+    - `verify`: return the response if the cached actions already contain the answer, otherwise return `None`
+    """
+    @abstractmethod
+    def verify(self, cache_entries: list[CacheEntry], new_prompts: list[str]) -> str|None:
+        pass
+
+
+class ActionAnswerVerifier(BaseAnswerVerifier):
+    """ Answer with the latest action that states an answer, e.g. "The answer is (X)".
+    The answer is extracted by `extractor` (e.g. `MMLUProDataset.get_prediction`), which returns `None` if there is no answer.
+    The response is the content of the latest action stating an answer, so it can be verified with the same extractor.
+    - args:
+        - extractor: extract the answer from the content of an action
+        - min_votes: the minimum number of actions stating the latest answer, default: 1
+        - max_new_len: the maximum number of characters of the prompts not seen by the latest action stating an answer
+          (the prompts of the later entries and the new prompts), e.g. the options of a question that arrive after the guess.
+          `None` for no limit, default: `None`
+    """
+    def __init__(
+        self,
+        extractor: Callable[[str], object|None],
+        min_votes: int = 1,
+        max_new_len: int|None = None,
+    ):
+        assert min_votes > 0
+        self.extractor = extractor
+        self.min_votes = min_votes
+        self.max_new_len = max_new_len
+
+    def verify(self, cache_entries: list[CacheEntry], new_prompts: list[str]) -> str|None:
+        # the number of characters of the prompts after the current entry
+        unseen_len = sum(len(prompt) for prompt in new_prompts)
+        answer = None
+        response = None
+        votes = 0
+        for entry in reversed(cache_entries):
+            if answer is None and self.max_new_len is not None and unseen_len > self.max_new_len:
+                # the later answers have not seen too much of the prompt, neither do the earlier ones
+                return None
+            for action in reversed(entry.actions):
+                if not action.content:
+                    continue
+                prediction = self.extractor(action.content)
+                if prediction is None:
+                    continue
+                if answer is None:
+                    answer = prediction
+                    response = action.content
+                if prediction == answer:
+                    votes += 1
+                    if votes >= self.min_votes:
+                        return response
+            unseen_len += sum(len(prompt) for prompt in entry.prompts)
+        return None
@@ -2,25 +2,39 @@
 
 __all__ = [
     'abc',
+    'budget',
     'functions',
+    'incremental',
+    'prefix',
+    'stream',
     'formatter',
     'LMFormatter',
     'CoTFormatter',
     'BaseFormatter',
-    'LMFormat'
+    'LMFormat',
+    'PrefixStats',
+    'ActionStreamParser',
+    'TokenBudget',
 ]
 
-from . import abc, functions
+from . import abc, budget, functions, incremental, prefix, stream
 
 import re
+from collections import OrderedDict
 from collections.abc import Iterable
 from .functions import (
     format_inference_sys,
     format_output_sys,
+    format_summarize_sys,
+    format_summarize_user,
     FORMATTER_MAP,
     LMFormat
 )
 from .abc import BaseFormatter
+from .incremental import RENDERER_MAP
+from .prefix import PrefixStats
+from .stream import ActionStreamParser
+from .budget import TokenBudget
 from ..action.abc import (
     Action,
     ActionType,
@@ -31,13 +45,26 @@ from ..action.abc import (
 class LMFormatter(BaseFormatter):
     """ Default action formatter for problem solving tasks with options
         If the arguments are changed, you need to clear the cached_prompts.
+
+        The rendered cache entries of the recent sessions are kept in `cached_prompts` (keyed by the first cache entry),
+        so a call only renders the entries added since the previous call of the session and the new prompts.
+        The formatter can be shared among sessions, at most `cache_size` sessions are kept.
+
+        If `token_budget` is set, the messages of the inference and output stages that exceed the budget are formatted with
+        reduced cache entries (see `TokenBudget`), the answer format appended by the controller is not counted.
+        The token counts and the reduction of a session are kept with its rendered state.
        """
     def __init__(
         self,
         format_type: LMFormat,
+        cache_size: int = 1024,
+        token_budget: TokenBudget|None = None,
     ):
-        self.cached_prompts: dict[str, str] = {}
+        self.cached_prompts: OrderedDict[int, incremental._Renderer] = OrderedDict()
+        self.cache_size = cache_size
         self.formatter_fn = FORMATTER_MAP[format_type]
+        self.renderer_class = RENDERER_MAP[format_type]
+        self.token_budget = token_budget
 
     def format_inference(
         self,
@@ -45,12 +72,12 @@ class LMFormatter(BaseFormatter):
         new_prompts: list[str]
     ) -> list[dict[str, str]]:
         sys_msg = format_inference_sys()
-        user_msg: list[dict[str, str]] = self.formatter_fn(cache_entries, new_prompts)
+        user_msg: list[dict[str, str]] = self._format_user(cache_entries, new_prompts)
         msg = [
             {"role": "system", "content": sys_msg},
             *user_msg
         ]
-        return msg
+        return self._fit_budget(msg, cache_entries, new_prompts)
 
 
     def format_output(
@@ -59,13 +86,64 @@ class LMFormatter(BaseFormatter):
         new_prompts: list[str]
     ) -> list[dict[str, str]]:
         sys_msg = format_output_sys()
-        user_msg = self.formatter_fn(cache_entries, new_prompts)
+        user_msg = self._format_user(cache_entries, new_prompts)
+        msg = [
+            {"role": "system", "content": sys_msg},
+            *user_msg
+        ]
+        return self._fit_budget(msg, cache_entries, new_prompts)
+
+
+    def format_summarize(
+        self,
+        cache_entries: list[CacheEntry],
+    ) -> list[dict[str, str]]:
+        sys_msg = format_summarize_sys()
+        user_msg = format_summarize_user(cache_entries)
         msg = [
             {"role": "system", "content": sys_msg},
             *user_msg
         ]
         return msg
 
+    def _format_user(self, cache_entries: list[CacheEntry], new_prompts: list[str]) -> list[dict[str, str]]:
+        """ Format the user messages with the rendered state of the session """
+        if not cache_entries:
+            return self.formatter_fn(cache_entries, new_prompts)
+        return self._get_renderer(cache_entries).render(new_prompts)
+
+
+    def _get_renderer(self, cache_entries: list[CacheEntry]) -> incremental._Renderer:
+        """ Return the rendered state of the session synced with the entries """
+        # the rendered state holds the first entry, so its id is not reused while the state is kept
+        key = id(cache_entries[0])
+        renderer = self.cached_prompts.get(key)
+        if renderer is None or renderer.entries[0] is not cache_entries[0]:
+            renderer = self.renderer_class()
+            self.cached_prompts[key] = renderer
+            if len(self.cached_prompts) > self.cache_size:
+                self.cached_prompts.popitem(last=False)
+        else:
+            self.cached_prompts.move_to_end(key)
+        renderer.sync(cache_entries, self.token_budget.count_text if self.token_budget is not None else None)
+        return renderer
+
+
+    def _fit_budget(self, msg: list[dict[str, str]], cache_entries: list[CacheEntry], new_prompts: list[str]) -> list[dict[str, str]]:
+        """ Return the message if it fits the token budget, otherwise format the message with reduced cache entries """
+        # without cache entries, the message holds only the new prompts, which are kept intact
+        if self.token_budget is None or not cache_entries:
+            return msg
+        sys_msg = msg[0]
+        # the reduced entries are new objects on every call, so they are formatted without the rendered state
+        return self.token_budget.fit(
+            msg,
+            self._get_renderer(cache_entries),
+            new_prompts,
+            lambda entries, prompts: [dict(sys_msg), *self.formatter_fn(entries, prompts)],
+        )
+
+
     def parse_action(self, response: str, action_types: Iterable[ActionType]) -> Action|None:
         """ Parse the user response to get the action. Return None if parsing fails.
             format: 'action {'name'/.../...}. {content}'
@@ -104,7 +182,7 @@ class CoTFormatter(BaseFormatter):
             {old_prompt} {new_prompt}
         """
         old_prompts = [prompt for entry in cache_entries for prompt in entry.prompts]
-        return "".join(old_prompts + new_prompts)
+        return "".join(map(str, old_prompts + new_prompts))
 
 
     # The baseline controller does not use the following methods
@@ -112,5 +190,9 @@ class CoTFormatter(BaseFormatter):
         raise NotImplementedError
 
 
+    def format_summarize(self, cache_entries: list[CacheEntry]) -> list[dict[str, str]]:
+        raise NotImplementedError
+
+
     def parse_action(self, response: str, action_types: Iterable[ActionType]) -> Action|None:
         raise NotImplementedError
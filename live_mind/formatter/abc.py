@@ -14,6 +14,7 @@ class BaseFormatter(ABC):
     methods:
     - format_inference: format the prompts for inference stage
     - format_output: format the prompts for inference stage
+    - format_summarize: format the prompts for the summarization stage
     - parse_action: parse the action from the model's response
     """
     @abstractmethod
@@ -32,6 +33,13 @@ class BaseFormatter(ABC):
     ) -> list[dict[str, str]]:
         pass
 
+    @abstractmethod
+    def format_summarize(
+        self,
+        cache_entries: list[CacheEntry],
+    ) -> list[dict[str, str]]:
+        pass
+
     @abstractmethod
     def parse_action(
         self,
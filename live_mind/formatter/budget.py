@@ -0,0 +1,181 @@
+""" Token budget of the messages formatted by `LMFormatter`: the cache entries are reduced by a fixed policy until
+the message fits the budget, so the prompt length (and the time to process the prompt) is bounded. """
+__all__ = [
+    'TokenBudget',
+]
+
+from collections.abc import Callable
+from ..action.abc import Action, CacheEntry
+from ..action.actions import Wait
+from ..text.abc import BaseTokenizer
+from ..text.tokenizer import MESSAGE_TOKENS, RegexTokenizer, count_message_tokens
+from .functions import _join
+from .incremental import _Renderer
+
+
+class TokenBudget():
+    """ The maximum number of tokens of a message and the policy to fit the message into it.
+    If the message exceeds the budget, the cache entries are reduced step by step until it fits the low-water mark:
+    1. the consecutive wait entries are collapsed into the following entry (or one wait entry at the end)
+    2. the oldest inferences are dropped, the fewest that make the message fit
+    3. the oldest prompts of the cache entries are dropped, the fewest that make the message fit
+    The new prompts (the latest prompt) are always kept intact, so the message can exceed the budget if they alone do.
+    The reduction of a session is kept while the message fits the budget with it, so the start of the prompt (and the KV cache
+    of the backend) stays the same until the message grows by the margin between the budget and the low-water mark.
+
+    The message is counted from the token counts kept by the renderer of the session: the entries are counted once when they
+    are added, the whole message is counted once after the entries change, and a call only counts the new prompts.
+    The reduced messages are counted only when the reduction changes, the token counts of the entries bound the search.
+
+    - args:
+        - max_tokens: the budget of the message, including the system message
+        - tokenizer: the local tokenizer to count the tokens, default: `RegexTokenizer` (an approximation of BPE tokenizers)
+        - message_tokens: the tokens added by the chat template for each message, default: 4
+        - low_water: the number of tokens the message is reduced to, default: 3/4 of `max_tokens`
+    """
+    def __init__(
+        self,
+        max_tokens: int,
+        tokenizer: BaseTokenizer|None = None,
+        message_tokens: int = MESSAGE_TOKENS,
+        low_water: int|None = None,
+    ):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer if tokenizer is not None else RegexTokenizer()
+        self.message_tokens = message_tokens
+        self.low_water = low_water if low_water is not None else max_tokens * 3 // 4
+        if self.low_water > max_tokens:
+            raise ValueError(f"the low-water mark {self.low_water} exceeds the budget {max_tokens}")
+        # the token counts of the system messages
+        self._sys_tokens: dict[str, int] = {}
+
+
+    def count_text(self, text: str) -> int:
+        """ Count the tokens of a text """
+        return len(self.tokenizer.tokenize(text))
+
+
+    def count(self, message: list[dict[str, str]]) -> int:
+        """ Count the tokens of the message """
+        return count_message_tokens(message, self.tokenizer, self.message_tokens)
+
+
+    def fits(self, message: list[dict[str, str]]) -> bool:
+        return self.count(message) <= self.max_tokens
+
+
+    def fit(
+        self,
+        message: list[dict[str, str]],
+        renderer: _Renderer,
+        new_prompts: list[str],
+        format_fn: Callable[[list[CacheEntry], list[str]], list[dict[str, str]]],
+    ) -> list[dict[str, str]]:
+        """ Return the message if it fits, otherwise format the message with the reduced cache entries.
+        - args:
+            - message: the message of the system message, the entries and the new prompts rendered by `renderer`
+            - renderer: the rendered state of the session, synced with the counter `count_text`
+            - format_fn: formats the message of the reduced entries and the new prompts
+        """
+        sys_content = message[0]["content"]
+        if sys_content not in self._sys_tokens:
+            self._sys_tokens[sys_content] = self.count(message[:1])
+        new_tokens = self.count_text(_join(new_prompts))
+        if renderer.base_tokens is None:
+            renderer.base_tokens = self.count(message[1:]) - new_tokens
+        num_tokens = self._sys_tokens[sys_content] + renderer.base_tokens + new_tokens
+        if num_tokens <= self.max_tokens:
+            renderer.dropped = (0, 0)
+            return message
+
+        # the items in the order they are dropped: the inferences, then the prompts
+        item_tokens = [n for _, inferences in renderer.entry_tokens for n in inferences]
+        num_inferences = len(item_tokens)
+        item_tokens += [n for prompts, _ in renderer.entry_tokens for n in prompts]
+        entries = _collapse_waits(renderer.entries)
+
+        def reduce(num_dropped: int) -> list[dict[str, str]]:
+            if num_dropped <= num_inferences:
+                return format_fn(_drop_inferences(entries, num_dropped), new_prompts)
+            old_prompts = [prompt for entry in entries for prompt in entry.prompts]
+            return format_fn(_wait_entries(old_prompts[num_dropped - num_inferences:]), new_prompts)
+
+        # keep the reduction while the message fits with it: the tokens saved by the reduction are counted when it is made,
+        # once the prompts are dropped, the inferences added later are dropped as well and save their tokens
+        num_dropped_inferences, num_dropped_prompts = renderer.dropped
+        saved_tokens = renderer.saved_tokens
+        if num_dropped_prompts > 0 and num_dropped_inferences <= num_inferences:
+            saved_tokens += sum(item_tokens[num_dropped_inferences:num_inferences])
+            num_dropped_inferences = num_inferences
+        num_dropped = num_dropped_inferences + num_dropped_prompts
+        if 0 < num_dropped <= len(item_tokens) and num_dropped_inferences <= num_inferences \
+                and num_tokens - saved_tokens <= self.max_tokens:
+            return reduce(num_dropped)
+
+        # drop the fewest items that reduce the message to the low-water mark, dropping an item saves at least its tokens,
+        # so the search is bounded by the items whose tokens sum to the excess
+        excess = num_tokens - self.low_water
+        max_dropped = 0
+        while max_dropped < len(item_tokens) and excess > 0:
+            excess -= item_tokens[max_dropped]
+            max_dropped += 1
+        num_dropped = self._search(reduce, 1, max_dropped, self.low_water)
+        if num_dropped > max_dropped:
+            num_dropped = self._search(reduce, max_dropped + 1, len(item_tokens), self.low_water)
+        num_dropped = min(num_dropped, len(item_tokens))
+        message = reduce(num_dropped)
+        renderer.dropped = (min(num_dropped, num_inferences), max(num_dropped - num_inferences, 0))
+        renderer.saved_tokens = num_tokens - self.count(message)
+        return message
+
+
+    def _search(self, format_fn: Callable[[int], list[dict[str, str]]], min_dropped: int, max_dropped: int, limit: int) -> int:
+        """ Binary search the fewest dropped items in `[min_dropped, max_dropped]` that make the message fit the limit,
+        return `max_dropped + 1` if the message does not fit with all the items dropped """
+        low, high = min_dropped, max_dropped + 1
+        while low < high:
+            mid = (low + high) // 2
+            if self.count(format_fn(mid)) <= limit:
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+
+def _is_wait(entry: CacheEntry) -> bool:
+    return len(entry.actions) == 1 and entry.actions[0].type == Wait
+
+
+def _collapse_waits(cache_entries: list[CacheEntry]) -> list[CacheEntry]:
+    """ Merge the prompts of the consecutive wait entries into the following entry, the trailing wait entries are merged into one """
+    entries: list[CacheEntry] = []
+    wait_prompts: list[str] = []
+    for entry in cache_entries:
+        if _is_wait(entry):
+            wait_prompts += entry.prompts
+        elif wait_prompts:
+            entries.append(CacheEntry(entry.actions, wait_prompts + entry.prompts))
+            wait_prompts = []
+        else:
+            entries.append(entry)
+    return entries + _wait_entries(wait_prompts)
+
+
+def _drop_inferences(cache_entries: list[CacheEntry], num_dropped: int) -> list[CacheEntry]:
+    """ Drop the oldest `num_dropped` inferences (actions with content in the prompt), an entry without actions becomes a wait entry """
+    entries: list[CacheEntry] = []
+    for entry in cache_entries:
+        if num_dropped > 0 and any(action.formatted_content for action in entry.actions):
+            actions: list[Action] = []
+            for action in entry.actions:
+                if num_dropped > 0 and action.formatted_content:
+                    num_dropped -= 1
+                else:
+                    actions.append(action)
+            entry = CacheEntry(actions if actions else [Action(type=Wait)], entry.prompts)
+        entries.append(entry)
+    return _collapse_waits(entries)
+
+
+def _wait_entries(prompts: list[str]) -> list[CacheEntry]:
+    return [CacheEntry([Action(type=Wait)], prompts)] if prompts else []
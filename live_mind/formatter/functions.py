@@ -2,10 +2,11 @@
 __all__  = [
     "FORMATTER_MAP",
     "LMFormat",
+    "format_summarize_user",
 ]
 
 from enum import Enum
-from ..action.abc import CacheEntry
+from ..action.abc import Action, CacheEntry
 from ..action.actions import Wait
 
 class LMFormat(Enum):
@@ -15,6 +16,8 @@ class LMFormat(Enum):
     U_SPI  = "user_sequence_prompt_inference"
     UA_PIL = "user_assistant_prompt_inference_last_prompt"
     UA_SPI = "user_assistant_sequence_prompt_inference"
+    # append-only format: the message of a step is a prefix of the message of the next step
+    UA_SPA = "user_assistant_sequence_prompt_action"
 
 
 def format_inference_sys() -> str:
@@ -38,6 +41,20 @@ You can answer directly if you can obtain the answer in your previous inferences
     return str(format_output_sys.__doc__)
 
 
+def format_summarize_sys() -> str:
+    """The user is currently providing input, and you have made inferences based on the incomplete information available so far. You are given the incomplete problem and your previous inferences on the incomplete problem.
+
+Summarize your previous inferences into a concise summary that keeps all the information and intermediate results useful for solving the problem. The summary will replace your previous inferences.
+
+Respond in the following format: 'action summarize. {content}'."""
+    return str(format_summarize_sys.__doc__)
+
+
+def format_summarize_user(cache_entries: list[CacheEntry]) -> list[dict[str, str]]:
+    """ Format the user prompt for the summarization stage, the same as the user_prompt_inference format without new prompts """
+    return format_u_pi(cache_entries, [])
+
+
 def format_u_pi(cache_entries: list[CacheEntry], new_prompts: list[str]) -> list[dict[str, str]]:
     """Format the user prompt with user_prompt_inference format:
     User:
@@ -49,7 +66,7 @@ def format_u_pi(cache_entries: list[CacheEntry], new_prompts: list[str]) -> list
     msg = []
     if prompts:
         msg.append("Incomplete prompt: ")
-        msg.extend(prompts)
+        msg.append(_join(prompts))
 
     infer_msgs = []
     index = 1
@@ -90,7 +107,7 @@ def format_u_pli(cache_entries: list[CacheEntry], new_prompts: list[str]) -> lis
     msg = []
     if old_prompts:
         msg.append("Previous prompt: ")
-        msg.extend(old_prompts)
+        msg.append(_join(old_prompts))
     infer_msgs = []
     index = 1
     for action in old_actions:
@@ -101,7 +118,7 @@ def format_u_pli(cache_entries: list[CacheEntry], new_prompts: list[str]) -> lis
         if msg:
             msg.append("\n")
         msg.append("New prompt: ")
-        msg.extend(new_prompts)
+        msg.append(_join(new_prompts))
     if infer_msgs:
         if msg:
             msg.append("\n")
@@ -129,7 +146,7 @@ def format_u_spi(cache_entries: list[CacheEntry], new_prompts: list[str]) -> lis
         if infer_msg:
             if msgs:
                 msgs.append("\n")
-            msgs.append(f"Prompt: {''.join(temp_prompts)}")
+            msgs.append(f"Prompt: {_join(temp_prompts)}")
             msgs.append(f"\nInference: {infer_msg}")
             temp_prompts = []
 
@@ -138,7 +155,7 @@ def format_u_spi(cache_entries: list[CacheEntry], new_prompts: list[str]) -> lis
     if msgs:
         msgs.append("\n")
     msgs.append("Prompt: ")
-    msgs.append("".join(new_prompts))
+    msgs.append(_join(new_prompts))
     msg_dict = {
         "role" : "user",
         "content" : "".join(msgs)
@@ -177,7 +194,7 @@ def format_ua_pil(cache_entries: list[CacheEntry], new_prompts: list[str]) -> li
     if has_old:
         user_msg = {
             "role" : "user",
-            "content" : "".join(old_prompts)
+            "content" : _join(old_prompts)
         }
         msg.append(user_msg)
 
@@ -191,7 +208,7 @@ def format_ua_pil(cache_entries: list[CacheEntry], new_prompts: list[str]) -> li
         assert has_new
         user_msg = {
             "role" : "user",
-            "content" : "".join(new_prompts)
+            "content" : _join(new_prompts)
         }
         msg.append(user_msg)
     else:
@@ -200,7 +217,7 @@ def format_ua_pil(cache_entries: list[CacheEntry], new_prompts: list[str]) -> li
         all_prompts = old_prompts + new_prompts
         user_msg = {
             "role" : "user",
-            "content" : "".join(all_prompts)
+            "content" : _join(all_prompts)
         }
         msg.append(user_msg)
     return msg
@@ -228,7 +245,7 @@ def format_ua_spi(cache_entries: list[CacheEntry], new_prompts: list[str]) -> li
         if infer_msg:
             user_msg = {
                 "role" : "user",
-                "content" : "".join(temp_prompts)
+                "content" : _join(temp_prompts)
             }
             msg_dict.append(user_msg)
             temp_prompts = []
@@ -244,12 +261,57 @@ def format_ua_spi(cache_entries: list[CacheEntry], new_prompts: list[str]) -> li
     assert new_prompts
     user_msg = {
         "role" : "user",
-        "content" : "".join(new_prompts)
+        "content" : _join(new_prompts)
     }
     msg_dict.append(user_msg)
 
     return msg_dict
 
+def format_ua_spa(cache_entries: list[CacheEntry], new_prompts: list[str]) -> list[dict[str, str]]:
+    """ Format the user prompt with user_assistant_sequence_prompt_action format:
+    User: prompt 1
+    Assistant: action 1
+    User: prompt 2
+    Assistant: action 2
+    ...
+    User: Last prompt
+
+    Unlike `format_ua_spi`, every cache entry (including the wait actions) is a user/assistant turn with the actions as they are
+    responded by the model, so the messages of a step are a prefix of the messages of the next step.
+    """
+    msg_dict: list[dict] = []
+    for entry in cache_entries:
+        msg_dict.append({
+            "role" : "user",
+            "content" : _join(entry.prompts)
+        })
+        msg_dict.append({
+            "role" : "assistant",
+            "content" : _action_text(entry.actions)
+        })
+
+    assert new_prompts
+    msg_dict.append({
+        "role" : "user",
+        "content" : _join(new_prompts)
+    })
+    return msg_dict
+
+
+def _join(prompts: list) -> str:
+    """ Join the prompts, which can be strings or spans of the input (`live_mind.text.span.Span`) materialized here """
+    return "".join(map(str, prompts))
+
+
+def _action_text(actions: list[Action]) -> str:
+    """ Render the actions in the response format of the inference stage: 'action {name}. {content}' """
+    texts = []
+    for action in actions:
+        if action.content:
+            texts.append(f"action {action.type.name}. {action.content}")
+        else:
+            texts.append(f"action {action.type.name}.")
+    return " ".join(texts)
 
 
 FORMATTER_MAP = {
@@ -258,4 +320,5 @@ FORMATTER_MAP = {
     LMFormat.U_SPI : format_u_spi,
     LMFormat.UA_PIL : format_ua_pil,
     LMFormat.UA_SPI : format_ua_spi,
+    LMFormat.UA_SPA : format_ua_spa,
 }
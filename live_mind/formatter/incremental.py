@@ -0,0 +1,328 @@
+""" Incremental rendering of the prompt formats in `functions`.
+A renderer keeps the rendered text of the cache entries of one session, so a call only renders the entries added since
+the previous call and the new prompts, the rendered history is reused as whole strings.
+The renderers produce the same messages as the functions in `FORMATTER_MAP`.
+
+The entries are compared by identity: the cache entries must not be modified in place (the action caches replace them),
+and the entries before a kept entry are assumed to be kept as well, which holds for the prefixes read from the action caches.
+
+With a token budget (`live_mind.formatter.budget.TokenBudget`), a renderer also keeps the token counts of the entries and
+the reduction of the session, so the budget is checked without tokenizing the rendered entries on every call.
+"""
+__all__ = [
+    'RENDERER_MAP',
+]
+
+from collections.abc import Callable
+from ..action.abc import CacheEntry
+from ..action.actions import Wait
+from .functions import LMFormat, _join, _action_text
+
+
+class _Text():
+    """ Concatenation of the pieces rendered for the entries, `ends[i]` is the end offset of the pieces of the first i+1 entries """
+    def __init__(self):
+        self.text = ""
+        self.ends: list[int] = []
+
+
+    def append(self, piece: str):
+        self.text += piece
+        self.ends.append(len(self.text))
+
+
+    def truncate(self, num_entries: int):
+        del self.ends[num_entries:]
+        self.text = self.text[:self.end(num_entries)]
+
+
+    def end(self, num_entries: int) -> int:
+        """ The end offset of the pieces of the first `num_entries` entries """
+        return self.ends[num_entries - 1] if num_entries > 0 else 0
+
+
+class _Renderer():
+    """ Rendered state of the cache entries of a session, the base class keeps the joined prompts of the entries
+    and the state of the token budget """
+    def __init__(self):
+        self.entries: list[CacheEntry] = []
+        self.prompts = _Text()
+        # the number of prompts of the first i+1 entries
+        self.num_prompts: list[int] = []
+        # the token counts of the prompts and of the inferences of each entry, kept if `sync` is given the counter
+        self.entry_tokens: list[tuple[list[int], list[int]]] = []
+        # the tokens of the user messages without the new prompts, counted on the first check after the entries change
+        self.base_tokens: int|None = None
+        # the numbers of the dropped inferences and prompts of the kept reduction, and the tokens it saved when it was made
+        self.dropped = (0, 0)
+        self.saved_tokens = 0
+
+
+    def sync(self, cache_entries: list[CacheEntry], count_fn: Callable[[str], int]|None = None):
+        """ Render the entries that differ from the rendered entries, `count_fn` counts the tokens of the new entries """
+        num_kept = min(len(cache_entries), len(self.entries))
+        while num_kept > 0 and cache_entries[num_kept - 1] is not self.entries[num_kept - 1]:
+            num_kept -= 1
+        if num_kept == len(self.entries) == len(cache_entries):
+            return
+        self.base_tokens = None
+        if num_kept < len(self.entries):
+            del self.entries[num_kept:]
+            self.prompts.truncate(num_kept)
+            del self.num_prompts[num_kept:]
+            del self.entry_tokens[num_kept:]
+            self._truncate(num_kept)
+        for entry in cache_entries[num_kept:]:
+            self.entries.append(entry)
+            self.prompts.append(_join(entry.prompts))
+            self.num_prompts.append(self._count(len(self.entries) - 1) + len(entry.prompts))
+            if count_fn is not None:
+                self.entry_tokens.append((
+                    [count_fn(str(prompt)) for prompt in entry.prompts],
+                    [count_fn(action.formatted_content) for action in entry.actions if action.formatted_content],
+                ))
+            self._append(entry)
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        """ Format the user messages of the rendered entries and the new prompts """
+        raise NotImplementedError
+
+
+    def _count(self, num_entries: int) -> int:
+        """ The number of prompts of the first `num_entries` entries """
+        return self.num_prompts[num_entries - 1] if num_entries > 0 else 0
+
+
+    def _append(self, entry: CacheEntry):
+        pass
+
+
+    def _truncate(self, num_entries: int):
+        pass
+
+
+def _is_wait(entry: CacheEntry) -> bool:
+    return len(entry.actions) == 1 and entry.actions[0].type == Wait
+
+
+class _PromptInferenceRenderer(_Renderer):
+    """ State of the formats that list the previous inferences after the prompts (U_PI, U_PLI, UA_PIL):
+    the inferences, and the number of the leading entries up to the last entry that is not a single wait action """
+    def __init__(self, numbered: bool):
+        super().__init__()
+        self.numbered = numbered
+        self.inferences = _Text()
+        self.num_inferences: list[int] = []
+        self.num_old: list[int] = []
+
+
+    def _append(self, entry: CacheEntry):
+        count = self.num_inferences[-1] if self.num_inferences else 0
+        pieces = []
+        for action in entry.actions:
+            if action.formatted_content:
+                count += 1
+                separator = " " if count > 1 else ""
+                pieces.append(f"{separator}({count}) {action.formatted_content}" if self.numbered else f"{separator}{action.formatted_content}")
+        self.inferences.append("".join(pieces))
+        self.num_inferences.append(count)
+        if _is_wait(entry):
+            self.num_old.append(self.num_old[-1] if self.num_old else 0)
+        else:
+            self.num_old.append(len(self.entries))
+
+
+    def _truncate(self, num_entries: int):
+        self.inferences.truncate(num_entries)
+        del self.num_inferences[num_entries:]
+        del self.num_old[num_entries:]
+
+
+    def _split(self, new_prompts: list[str]) -> tuple[str, int, str, int]:
+        """ Split the prompts at the last entry that is not a single wait action,
+        return the old prompts, their number, the new prompts and their number """
+        num_old = self.num_old[-1] if self.num_old else 0
+        old_end = self.prompts.end(num_old)
+        old_count = self._count(num_old)
+        new_count = self._count(len(self.entries)) - old_count + len(new_prompts)
+        return self.prompts.text[:old_end], old_count, self.prompts.text[old_end:] + _join(new_prompts), new_count
+
+
+class _UPIRenderer(_PromptInferenceRenderer):
+    def __init__(self):
+        super().__init__(numbered=True)
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        msg = []
+        if self._count(len(self.entries)) + len(new_prompts) > 0:
+            msg.append("Incomplete prompt: ")
+            msg.append(self.prompts.text + _join(new_prompts))
+        if self.inferences.text:
+            if msg:
+                msg.append("\n")
+            msg.append("Previous inferences: ")
+            msg.append(self.inferences.text)
+        return [{"role" : "user", "content" : "".join(msg)}]
+
+
+class _UPLIRenderer(_PromptInferenceRenderer):
+    def __init__(self):
+        super().__init__(numbered=True)
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        old_text, old_count, new_text, new_count = self._split(new_prompts)
+        msg = []
+        if old_count:
+            msg.append("Previous prompt: ")
+            msg.append(old_text)
+        if new_count:
+            if msg:
+                msg.append("\n")
+            msg.append("New prompt: ")
+            msg.append(new_text)
+        if self.inferences.text:
+            if msg:
+                msg.append("\n")
+            msg.append("Previous inferences: ")
+            msg.append(self.inferences.text)
+        return [{"role" : "user", "content" : "".join(msg)}]
+
+
+class _UAPILRenderer(_PromptInferenceRenderer):
+    def __init__(self):
+        super().__init__(numbered=False)
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        old_text, old_count, new_text, new_count = self._split(new_prompts)
+        if old_count:
+            assert self.inferences.text
+            assert new_count
+            return [
+                {"role" : "user", "content" : old_text},
+                {"role" : "assistant", "content" : self.inferences.text},
+                {"role" : "user", "content" : new_text},
+            ]
+        assert not self.inferences.text # if there is no old prompts, there should be no inferences
+        assert new_count
+        return [{"role" : "user", "content" : old_text + new_text}]
+
+
+class _SequenceRenderer(_Renderer):
+    """ State of the formats that render the entries as a sequence of prompts and inferences (U_SPI, UA_SPI):
+    the prompts of the entries without inference are merged into the following prompts """
+    def __init__(self):
+        super().__init__()
+        # the number of leading entries whose prompts are rendered
+        self.num_rendered: list[int] = []
+
+
+    def _append(self, entry: CacheEntry):
+        infer_msg = " ".join(action.formatted_content for action in entry.actions if action.formatted_content)
+        if infer_msg:
+            num_rendered = self.num_rendered[-1] if self.num_rendered else 0
+            self._append_turn(self.prompts.text[self.prompts.end(num_rendered):], infer_msg)
+            self.num_rendered.append(len(self.entries))
+        else:
+            self._append_turn(None, None)
+            self.num_rendered.append(self.num_rendered[-1] if self.num_rendered else 0)
+
+
+    def _truncate(self, num_entries: int):
+        del self.num_rendered[num_entries:]
+
+
+    def _pending(self, new_prompts: list[str]) -> str:
+        """ The prompts after the last inference and the new prompts """
+        num_rendered = self.num_rendered[-1] if self.num_rendered else 0
+        assert self._count(len(self.entries)) - self._count(num_rendered) + len(new_prompts) > 0
+        return self.prompts.text[self.prompts.end(num_rendered):] + _join(new_prompts)
+
+
+    def _append_turn(self, prompt_text: str|None, infer_msg: str|None):
+        """ Render a turn of the entry, the arguments are `None` if the entry is merged into the following prompts """
+        raise NotImplementedError
+
+
+class _USPIRenderer(_SequenceRenderer):
+    def __init__(self):
+        super().__init__()
+        self.turns = _Text()
+
+
+    def _append_turn(self, prompt_text: str|None, infer_msg: str|None):
+        if prompt_text is None:
+            self.turns.append("")
+            return
+        separator = "\n" if self.turns.text else ""
+        self.turns.append(f"{separator}Prompt: {prompt_text}\nInference: {infer_msg}")
+
+
+    def _truncate(self, num_entries: int):
+        super()._truncate(num_entries)
+        self.turns.truncate(num_entries)
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        pending = self._pending(new_prompts)
+        separator = "\n" if self.turns.text else ""
+        return [{"role" : "user", "content" : f"{self.turns.text}{separator}Prompt: {pending}"}]
+
+
+class _UASPIRenderer(_SequenceRenderer):
+    def __init__(self):
+        super().__init__()
+        self.turns: list[dict[str, str]] = []
+        self.num_turns: list[int] = []
+
+
+    def _append_turn(self, prompt_text: str|None, infer_msg: str|None):
+        if prompt_text is not None and infer_msg is not None:
+            self.turns.append({"role" : "user", "content" : prompt_text})
+            self.turns.append({"role" : "assistant", "content" : infer_msg})
+        self.num_turns.append(len(self.turns))
+
+
+    def _truncate(self, num_entries: int):
+        super()._truncate(num_entries)
+        del self.num_turns[num_entries:]
+        del self.turns[self.num_turns[-1] if self.num_turns else 0:]
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        pending = self._pending(new_prompts)
+        # the messages are copied, as the callers may modify the returned messages
+        return [*map(dict, self.turns), {"role" : "user", "content" : pending}]
+
+
+class _UASPARenderer(_Renderer):
+    def __init__(self):
+        super().__init__()
+        self.turns: list[dict[str, str]] = []
+
+
+    def _append(self, entry: CacheEntry):
+        self.turns.append({"role" : "user", "content" : _join(entry.prompts)})
+        self.turns.append({"role" : "assistant", "content" : _action_text(entry.actions)})
+
+
+    def _truncate(self, num_entries: int):
+        del self.turns[2 * num_entries:]
+
+
+    def render(self, new_prompts: list[str]) -> list[dict[str, str]]:
+        assert new_prompts
+        return [*map(dict, self.turns), {"role" : "user", "content" : _join(new_prompts)}]
+
+
+RENDERER_MAP: dict[LMFormat, type[_Renderer]] = {
+    LMFormat.U_PI : _UPIRenderer,
+    LMFormat.U_PLI : _UPLIRenderer,
+    LMFormat.UA_PIL : _UAPILRenderer,
+    LMFormat.U_SPI : _USPIRenderer,
+    LMFormat.UA_SPI : _UASPIRenderer,
+    LMFormat.UA_SPA : _UASPARenderer,
+}
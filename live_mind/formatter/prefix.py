@@ -0,0 +1,74 @@
+""" Measure how much of a message is shared with the previous message, i.e. how much of the KV cache can be reused by the backend """
+__all__ = [
+    'render_messages',
+    'shared_prefix_len',
+    'PrefixStats',
+]
+
+
+def render_messages(message: list[dict[str, str]]) -> str:
+    """ Render the message as a backend would (a generic chat template), the generation prompt is not included """
+    return "".join(f"<|{m['role']}|>\n{m['content']}<|end|>\n" for m in message)
+
+
+def shared_prefix_len(text_1: str, text_2: str) -> int:
+    """ Return the length of the longest common prefix of two strings """
+    n = min(len(text_1), len(text_2))
+    if text_1[:n] == text_2[:n]:
+        return n
+    # binary search the first mismatch, the comparisons of the slices are done in C
+    low, high = 0, n
+    while low < high:
+        mid = (low + high + 1) // 2
+        if text_1[:mid] == text_2[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class PrefixStats:
+    """ Statistics of the shared prefix between consecutive messages sent to a model.
+    For each message (except the first one), the shared-prefix ratio is the length of the prefix shared with the
+    previous message divided by the length of the message: the fraction of the prompt that can be reused from the KV cache.
+    A step is prefix-stable if the whole previous message is a prefix of the message.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Reset the statistics and the previous message, call at the start of a new conversation """
+        self.num_steps = 0
+        self.num_stable = 0
+        self.total_len = 0
+        self.total_shared = 0
+        self._last: str|None = None
+
+    def new_conversation(self):
+        """ Start a new conversation, the statistics are kept """
+        self._last = None
+
+    def update(self, message: list[dict[str, str]]) -> float|None:
+        """ Record a message, return the shared-prefix ratio with the previous message (`None` for the first message) """
+        text = render_messages(message)
+        last = self._last
+        self._last = text
+        if last is None:
+            return None
+        shared = shared_prefix_len(last, text)
+        self.num_steps += 1
+        self.total_len += len(text)
+        self.total_shared += shared
+        if shared == len(last):
+            self.num_stable += 1
+        return shared / len(text) if text else 1.0
+
+    @property
+    def ratio(self) -> float:
+        """ The shared-prefix ratio over all recorded messages (weighted by the message length) """
+        return self.total_shared / self.total_len if self.total_len else 0.0
+
+    @property
+    def stable_ratio(self) -> float:
+        """ The fraction of prefix-stable steps """
+        return self.num_stable / self.num_steps if self.num_steps else 0.0
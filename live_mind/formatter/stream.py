@@ -0,0 +1,95 @@
+""" Streaming parser for the responses of the inference stage: decide the action from the first pieces of the response
+so that the generation can be stopped early """
+__all__ = [
+    'ActionStreamParser',
+]
+
+import re
+from collections.abc import Iterable
+from ..action.abc import ActionType
+from ..action.actions import Wait
+
+_HEADER = "action "
+_NAME = re.compile(r"[a-z]*")
+
+
+class ActionStreamParser():
+    """ Streaming parser for the response format of `LMFormatter`: 'action {name}. {content}'.
+    The pieces of the response are fed one by one, and `feed` returns `True` when the generation can be stopped:
+    - the action is one of `stop_types` (default: wait), whose content is not needed
+    - the response is off-format, i.e. `LMFormatter.parse_action` fails whatever the rest of the response is
+      (only if `stop_off_format` is set)
+    - the number of pieces reaches the cap of the action in `max_tokens`
+    The action decided by the parser is the action `LMFormatter.parse_action` parses from the complete response.
+    The parser is stateful, each controller should have its own parser.
+
+    - args:
+        - stop_types: the action types that stop the generation once the action is decided, default: `[Wait]`
+        - max_tokens: the maximum number of pieces (tokens for most stream models) of the response for each action type,
+            e.g. `{Inference: 128}`, default: no limit
+        - stop_off_format: stop the generation once the response is off-format, default: `True`
+    """
+    def __init__(
+        self,
+        stop_types: Iterable[ActionType] = (Wait,),
+        max_tokens: dict[ActionType, int]|None = None,
+        stop_off_format: bool = True,
+    ):
+        self.stop_types = list(stop_types)
+        self.max_tokens = dict(max_tokens) if max_tokens is not None else {}
+        self.stop_off_format = stop_off_format
+        self.reset([])
+
+
+    def reset(self, action_types: Iterable[ActionType]):
+        """ Start parsing a new response with the accepted action types """
+        self.action_types = {action_type.name: action_type for action_type in action_types}
+        self.text = ""
+        self.num_tokens = 0
+        self.action_type: ActionType|None = None
+        self.off_format = False
+        self.stopped = False
+
+
+    def key(self) -> str:
+        """ The settings of the parser and the accepted action types, the responses stopped with the same key are the same """
+        stop_types = ",".join(sorted(action_type.name for action_type in self.stop_types))
+        max_tokens = ",".join(sorted(f"{action_type.name}:{num}" for action_type, num in self.max_tokens.items()))
+        action_types = ",".join(sorted(self.action_types))
+        return f"stop={stop_types};max={max_tokens};off={int(self.stop_off_format)};types={action_types}"
+
+
+    def feed(self, text: str) -> bool:
+        """ Feed the next piece of the response, return `True` if the generation should be stopped """
+        self.num_tokens += 1
+        if self.action_type is None and not self.off_format:
+            self.text += text
+            self._parse_header()
+        if self.action_type is not None:
+            if self.action_type in self.stop_types:
+                self.stopped = True
+            elif self.action_type in self.max_tokens and self.num_tokens >= self.max_tokens[self.action_type]:
+                self.stopped = True
+        elif self.off_format and self.stop_off_format:
+            self.stopped = True
+        return self.stopped
+
+
+    def _parse_header(self):
+        """ Decide the action from the header, the same as the pattern `^action ([a-z]+).` of `LMFormatter.parse_action` """
+        if not (self.text.startswith(_HEADER) or _HEADER.startswith(self.text)):
+            self.off_format = True
+            return
+        if len(self.text) <= len(_HEADER):
+            return
+        name_end = _NAME.match(self.text, len(_HEADER)).end()
+        if name_end == len(_HEADER):
+            # the name is empty
+            self.off_format = True
+        elif name_end < len(self.text):
+            # the name is followed by another character, so it is complete
+            action_type = self.action_types.get(self.text[len(_HEADER):name_end])
+            if action_type is None:
+                self.off_format = True
+            else:
+                self.action_type = action_type
@@ -0,0 +1,29 @@
+""" Model wrappers and backends implementing the interfaces in `live_mind.abc` """
+__all__ = [
+    'threaded',
+    'batching',
+    'response_cache',
+    'ollama',
+    'simulated',
+    'instrumented',
+    'ThreadedAsyncModel',
+    'BatchScheduler',
+    'CachedModel',
+    'OllamaClient',
+    'OllamaModel',
+    'SimulatedModel',
+    'SimulatedOllamaServer',
+    'CallRecorder',
+    'InstrumentedModel',
+    'InstrumentedAsyncModel',
+    'instrument_model',
+    'instrument_async_model',
+]
+
+from . import threaded, batching, response_cache, ollama, simulated, instrumented
+from .threaded import ThreadedAsyncModel
+from .batching import BatchScheduler
+from .response_cache import CachedModel
+from .ollama import OllamaClient, OllamaModel
+from .simulated import SimulatedModel, SimulatedOllamaServer
+from .instrumented import CallRecorder, InstrumentedModel, InstrumentedAsyncModel, instrument_model, instrument_async_model
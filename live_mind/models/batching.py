@@ -0,0 +1,97 @@
+""" Batch the requests of many sessions into batched model calls """
+__all__ = ['BatchScheduler']
+
+import time
+import asyncio
+import contextvars
+from ..abc import BaseModel, AsyncBaseModel
+from .instrumented import queue_waits, report_queue_wait
+
+
+class BatchScheduler(AsyncBaseModel):
+    """ Collect the requests of many controllers within a small time window and dispatch them as one batched call.
+    The scheduler is an `AsyncBaseModel` and can be used as the inference (or output) model of the async controllers,
+    the results of the batched call are fanned back out to the callers.
+
+    A batch is dispatched when `max_batch_size` requests are collected or `max_wait` seconds after the first request of the batch.
+    Requests cancelled before the dispatch (e.g. preempted inferences) are removed from the batch.
+    The time from the request to the start of the batched call is reported to the instrumented call of the request
+    (see `live_mind.models.instrumented`), it includes the wait for a worker thread if the model is blocking.
+    - args:
+        - model: the model to complete the batches with `batch_chat_complete` (`BaseModel`, executed in a worker thread)
+          or `abatch_chat_complete` (`AsyncBaseModel`)
+        - max_batch_size: the maximum number of requests in a batch, default: 16
+        - max_wait: the maximum time (seconds) to wait for more requests, default: 0.01
+    """
+    def __init__(
+        self,
+        model: BaseModel|AsyncBaseModel,
+        max_batch_size: int = 16,
+        max_wait: float = 0.01,
+    ):
+        assert max_batch_size > 0 and max_wait >= 0
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # the message, the future of the response, and the enqueue time and the queue waits of the request
+        self._pending: list[tuple[list[dict[str, str]], asyncio.Future, float, list[float]|None]] = []
+        self._timer: asyncio.TimerHandle|None = None
+        self._batches: set[asyncio.Task] = set()
+
+
+    async def achat_complete(self, message: list[dict[str, str]]) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future, time.monotonic(), queue_waits()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+
+    def _flush(self):
+        """ Dispatch the pending requests """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            # the batch runs in an empty context, so the queues of the model do not report to the call that flushed it
+            task = contextvars.Context().run(asyncio.ensure_future, self._dispatch(batch))
+            # keep a reference to the task until it is done
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+
+    async def _dispatch(self, batch: list[tuple[list[dict[str, str]], asyncio.Future, float, list[float]|None]]):
+        """ Complete a batch and set the results of the futures """
+        batch = [request for request in batch if not request[1].done()]
+        if not batch:
+            return
+        messages = [message for message, *_ in batch]
+
+        def report():
+            for _, _, enqueued, waits in batch:
+                report_queue_wait(waits, enqueued)
+
+        try:
+            if isinstance(self.model, AsyncBaseModel):
+                report()
+                responses = await self.model.abatch_chat_complete(messages)
+            else:
+                def call():
+                    report()
+                    return self.model.batch_chat_complete(messages)
+                responses = await asyncio.to_thread(call)
+            if len(responses) != len(messages):
+                raise ValueError(f"Expect {len(messages)} responses from the batched call, got {len(responses)}.")
+        except Exception as e:
+            for _, future, *_ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, *_), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
@@ -0,0 +1,322 @@
+""" Instrumentation of the model calls: queue wait, time to first token, decode rate, prompt and completion sizes """
+__all__ = [
+    'CallRecorder',
+    'InstrumentedModel',
+    'InstrumentedStreamModel',
+    'InstrumentedAsyncModel',
+    'InstrumentedAsyncStreamModel',
+    'instrument_model',
+    'instrument_async_model',
+    'queue_waits',
+    'report_queue_wait',
+    'summarize_calls',
+]
+
+import time
+import threading
+from contextvars import ContextVar
+from collections.abc import AsyncGenerator, Callable, Generator
+import numpy
+from ..abc import BaseModel, BaseStreamModel, AsyncBaseModel, AsyncBaseStreamModel
+from ..formatter.functions import format_summarize_sys
+from ..text.abc import BaseTokenizer
+from ..text.tokenizer import RegexTokenizer, count_message_tokens
+
+# the queue waits of the async instrumented call running in the context, reported by the queues the call passes
+# (`BatchScheduler`, the worker threads of `ThreadedAsyncModel`)
+_queue_waits: ContextVar[list[float]|None] = ContextVar("queue_waits", default=None)
+
+
+def queue_waits() -> list[float]|None:
+    """ The queue waits of the instrumented call in the current context, `None` if the call is not instrumented.
+    A queue takes the list when the request is enqueued and reports the wait with `report_queue_wait` on the dispatch. """
+    return _queue_waits.get()
+
+
+def report_queue_wait(waits: list[float]|None, enqueued: float):
+    """ Report the wait of a request dispatched now and enqueued at `enqueued` (`time.monotonic`) """
+    if waits is not None:
+        waits.append(time.monotonic() - enqueued)
+
+
+class CallRecorder():
+    """ Collect the records of the instrumented calls, the models of all the stages share one recorder.
+    A record is a dict with the following keys (times in seconds, measured with `clock`):
+        - stage: the stage of the call, "inference", "output" or "summarize" (recognized by the system message)
+        - start: the time of the request since the recorder is created
+        - queue_wait: the time the request waits in the queues of the async models (the batch window of `BatchScheduler`,
+          a free worker thread of `ThreadedAsyncModel`) before it is dispatched, 0 for the blocking calls
+        - ttft: the time from the request to the first piece of the response (including the queue wait), the whole duration
+          if the call is not streamed
+        - duration: the time from the request to the end of the response
+        - prompt_tokens, completion_tokens: the sizes of the message and the response, counted with `tokenizer`
+          (the message with the chat template tokens, as `TokenBudget` counts it, the completion of a streamed call
+          in pieces, one token per piece for most backends)
+        - decode_rate: the pieces per second after the first piece, `None` if the call is not streamed or has a single piece
+        - streamed: whether the response is streamed
+        - stopped: whether the stream is closed before the end of the response (e.g. early stop)
+    - args:
+        - tokenizer: the tokenizer to count the tokens, default: `RegexTokenizer` (an approximation of BPE tokenizers)
+        - clock: the monotonic clock of the times, default: `time.monotonic`
+    """
+    def __init__(
+        self,
+        tokenizer: BaseTokenizer|None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.tokenizer = tokenizer if tokenizer is not None else RegexTokenizer()
+        self.clock = clock
+        self.epoch = clock()
+        self.records: list[dict] = []
+        self._lock = threading.Lock()
+
+
+    def drain(self) -> list[dict]:
+        """ Return the records since the previous call and remove them from the recorder """
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.tokenize(text))
+
+
+    def count_message(self, message: list[dict[str, str]]) -> int:
+        return count_message_tokens(message, self.tokenizer)
+
+
+    def record(
+        self,
+        stage: str,
+        requested: float,
+        first: float|None,
+        end: float,
+        prompt_tokens: int,
+        completion_tokens: int,
+        streamed: bool,
+        stopped: bool = False,
+        queue_wait: float = 0.0,
+    ):
+        """ Record a call from its times: the request, the first piece (`None` if there is none) and the end """
+        decode_rate = None
+        if streamed and first is not None and completion_tokens > 1 and end > first:
+            decode_rate = (completion_tokens - 1) / (end - first)
+        record = {
+            "stage": stage,
+            "start": requested - self.epoch,
+            "queue_wait": queue_wait,
+            "ttft": (first if first is not None else end) - requested,
+            "duration": end - requested,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "decode_rate": decode_rate,
+            "streamed": streamed,
+            "stopped": stopped,
+        }
+        with self._lock:
+            self.records.append(record)
+
+
+class _Instrumented():
+    """ The stage and the recorder of an instrumented model """
+    def __init__(self, model: BaseModel|AsyncBaseModel, stage: str, recorder: CallRecorder):
+        self.model = model
+        self.stage = stage
+        self.recorder = recorder
+        self._summarize_sys = format_summarize_sys()
+
+
+    def _stage(self, message: list[dict[str, str]]) -> str:
+        if message and message[0]["role"] == "system" and message[0]["content"] == self._summarize_sys:
+            return "summarize"
+        return self.stage
+
+
+class InstrumentedModel(_Instrumented, BaseModel):
+    """ Wrap a model to record every call in a `CallRecorder`, use `instrument_model` to keep the stream interface.
+    - args:
+        - model: the model to be instrumented
+        - stage: the stage of the calls, e.g. "inference" or "output", the calls with the summarize system message are
+          recorded as "summarize"
+        - recorder: the recorder of the calls
+    """
+    def __init__(self, model: BaseModel, stage: str, recorder: CallRecorder):
+        super().__init__(model, stage, recorder)
+        self.model: BaseModel = model
+
+
+    def chat_complete(self, message: list[dict[str, str]]) -> str:
+        recorder = self.recorder
+        requested = recorder.clock()
+        response = self.model.chat_complete(message)
+        end = recorder.clock()
+        recorder.record(self._stage(message), requested, None, end, recorder.count_message(message), recorder.count(response), False)
+        return response
+
+
+    def batch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        """ Complete a batch of messages as one call, every message is recorded with the times of the batch """
+        recorder = self.recorder
+        requested = recorder.clock()
+        responses = self.model.batch_chat_complete(messages)
+        end = recorder.clock()
+        for message, response in zip(messages, responses):
+            recorder.record(self._stage(message), requested, None, end, recorder.count_message(message), recorder.count(response), False)
+        return responses
+
+
+class InstrumentedStreamModel(InstrumentedModel, BaseStreamModel):
+    """ `InstrumentedModel` of a stream model, the streamed calls record the arrival of the first piece """
+    def __init__(self, model: BaseStreamModel, stage: str, recorder: CallRecorder):
+        super().__init__(model, stage, recorder)
+        self.model: BaseStreamModel = model
+
+
+    def stream(self, message: list[dict[str, str]]) -> Generator[str, None, None]:
+        # the request is sent on the first `next`, when the body of the generator runs
+        recorder = self.recorder
+        requested = recorder.clock()
+        first = None
+        num_pieces = 0
+        stopped = True
+        response_gen = self.model.stream(message)
+        try:
+            for text in response_gen:
+                if first is None:
+                    first = recorder.clock()
+                num_pieces += 1
+                yield text
+            stopped = False
+        finally:
+            close = getattr(response_gen, "close", None)
+            if close is not None:
+                close()
+            end = recorder.clock()
+            recorder.record(self._stage(message), requested, first, end, recorder.count_message(message), num_pieces, True, stopped)
+
+
+def instrument_model(model: BaseModel, stage: str, recorder: CallRecorder) -> InstrumentedModel:
+    """ Instrument the model, the instrumented model is a `BaseStreamModel` if the model is """
+    if isinstance(model, BaseStreamModel):
+        return InstrumentedStreamModel(model, stage, recorder)
+    return InstrumentedModel(model, stage, recorder)
+
+
+class InstrumentedAsyncModel(_Instrumented, AsyncBaseModel):
+    """ `InstrumentedModel` of an async model (e.g. `ThreadedAsyncModel` or `BatchScheduler`), the time the request waits in
+    the queues of the model is recorded as the queue wait, use `instrument_async_model` to keep the stream interface.
+    - args:
+        - model: the async model to be instrumented
+        - stage: the stage of the calls, see `InstrumentedModel`
+        - recorder: the recorder of the calls
+    """
+    def __init__(self, model: AsyncBaseModel, stage: str, recorder: CallRecorder):
+        super().__init__(model, stage, recorder)
+        self.model: AsyncBaseModel = model
+
+
+    async def achat_complete(self, message: list[dict[str, str]]) -> str:
+        recorder = self.recorder
+        waits: list[float] = []
+        requested = recorder.clock()
+        token = _queue_waits.set(waits)
+        try:
+            response = await self.model.achat_complete(message)
+        finally:
+            _queue_waits.reset(token)
+        end = recorder.clock()
+        recorder.record(
+            self._stage(message), requested, None, end, recorder.count_message(message), recorder.count(response), False,
+            queue_wait=sum(waits),
+        )
+        return response
+
+
+    async def abatch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        """ Complete a batch of messages as one call, every message is recorded with the times of the batch """
+        recorder = self.recorder
+        waits: list[float] = []
+        requested = recorder.clock()
+        token = _queue_waits.set(waits)
+        try:
+            responses = await self.model.abatch_chat_complete(messages)
+        finally:
+            _queue_waits.reset(token)
+        end = recorder.clock()
+        for message, response in zip(messages, responses):
+            recorder.record(
+                self._stage(message), requested, None, end, recorder.count_message(message), recorder.count(response), False,
+                queue_wait=sum(waits),
+            )
+        return responses
+
+
+_STREAM_END = object()
+
+
+class InstrumentedAsyncStreamModel(InstrumentedAsyncModel, AsyncBaseStreamModel):
+    """ `InstrumentedAsyncModel` of an async stream model, the streamed calls record the arrival of the first piece """
+    def __init__(self, model: AsyncBaseStreamModel, stage: str, recorder: CallRecorder):
+        super().__init__(model, stage, recorder)
+        self.model: AsyncBaseStreamModel = model
+
+
+    async def astream(self, message: list[dict[str, str]]) -> AsyncGenerator[str, None]:
+        recorder = self.recorder
+        waits: list[float] = []
+        requested = recorder.clock()
+        first = None
+        num_pieces = 0
+        stopped = True
+        response_gen = aiter(self.model.astream(message))
+        try:
+            # the request is queued before the first piece, the queues take the waits when the stream starts
+            token = _queue_waits.set(waits)
+            try:
+                text = await anext(response_gen, _STREAM_END)
+            finally:
+                _queue_waits.reset(token)
+            while text is not _STREAM_END:
+                if first is None:
+                    first = recorder.clock()
+                num_pieces += 1
+                yield text
+                text = await anext(response_gen, _STREAM_END)
+            stopped = False
+        finally:
+            aclose = getattr(response_gen, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            end = recorder.clock()
+            recorder.record(
+                self._stage(message), requested, first, end, recorder.count_message(message), num_pieces, True, stopped,
+                queue_wait=sum(waits),
+            )
+
+
+def instrument_async_model(model: AsyncBaseModel, stage: str, recorder: CallRecorder) -> InstrumentedAsyncModel:
+    """ Instrument the async model, the instrumented model is an `AsyncBaseStreamModel` if the model is """
+    if isinstance(model, AsyncBaseStreamModel):
+        return InstrumentedAsyncStreamModel(model, stage, recorder)
+    return InstrumentedAsyncModel(model, stage, recorder)
+
+
+def summarize_calls(records: list[dict]) -> dict[str, dict[str, float]]:
+    """ Summarize the records by stage: the number of calls, the mean queue wait, the mean and p95 of the time to first token,
+    the mean decode rate of the streamed calls, and the mean prompt and completion tokens """
+    summary: dict[str, dict[str, float]] = {}
+    for stage in sorted({record["stage"] for record in records}):
+        stage_records = [record for record in records if record["stage"] == stage]
+        ttfts = [record["ttft"] for record in stage_records]
+        rates = [record["decode_rate"] for record in stage_records if record["decode_rate"] is not None]
+        summary[stage] = {
+            "calls": len(stage_records),
+            "queue_wait": float(numpy.mean([record["queue_wait"] for record in stage_records])),
+            "ttft": float(numpy.mean(ttfts)),
+            "ttft_p95": float(numpy.percentile(ttfts, 95)),
+            "decode_rate": float(numpy.mean(rates)) if rates else float("nan"),
+            "prompt_tokens": float(numpy.mean([record["prompt_tokens"] for record in stage_records])),
+            "completion_tokens": float(numpy.mean([record["completion_tokens"] for record in stage_records])),
+        }
+    return summary
@@ -0,0 +1,212 @@
+""" Client for the Ollama REST API with a shared keep-alive connection pool """
+__all__ = [
+    'OllamaClient',
+    'OllamaModel',
+    'get_client',
+    'iter_ndjson',
+]
+
+import os
+import json
+import threading
+from collections.abc import Generator, Iterable, Iterator
+from ..abc import BaseStreamModel
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# the status codes of the responses that are retried (the server is overloaded or restarting), a 500 is an error of the
+# request (e.g. an unknown model) and is not retried
+_RETRY_STATUS = (429, 502, 503, 504)
+
+
+def _base_url(url: str) -> str:
+    """ The base url of the server, the url can also be the chat endpoint (e.g. "http://localhost:11434/api/chat") """
+    return url.rstrip("/").removesuffix("/api/chat")
+
+
+class OllamaClient():
+    """ HTTP client of an Ollama server. The requests share one `requests.Session`, so the connections are kept alive
+    and reused by the following requests instead of a new TCP connection per request.
+    The failed connections and the responses with a retried status are retried with exponential backoff, a streamed
+    response is only retried before it starts. A read error is not retried, as the server may have processed the request.
+    - args:
+        - url: the base url (or the chat endpoint) of the server, default: `$OLLAMA_URL` or "http://localhost:11434"
+        - pool_size: the maximum number of kept-alive connections, i.e. the concurrent requests without a new connection, default: 16
+        - retries: the number of retries of a request, default: 3
+        - backoff: the backoff factor (seconds) of the retries, the n-th retry waits `backoff * 2 ** (n - 1)`, default: 0.5
+        - connect_timeout: the timeout (seconds) to connect to the server, default: 5
+        - read_timeout: the timeout (seconds) between the received bytes, default: 300
+    """
+    def __init__(
+        self,
+        url: str = OLLAMA_URL,
+        pool_size: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 300.0,
+    ):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url = _base_url(url)
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            read=0,
+            backoff_factor=backoff,
+            status_forcelist=_RETRY_STATUS,
+            allowed_methods=["POST"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+
+    def chat(self, payload: dict, timeout: float|None = None) -> dict:
+        """ POST the payload to /api/chat without streaming and return the JSON response.
+        `timeout` overrides the read timeout of the request. """
+        payload = {**payload, "stream": False}
+        with self.session.post(f"{self.url}/api/chat", json=payload, timeout=self._timeout(timeout)) as response:
+            response.raise_for_status()
+            return _loads(response.content)
+
+
+    def stream_chat(self, payload: dict, timeout: float|None = None) -> Generator[dict, None, None]:
+        """ POST the payload to /api/chat with streaming and yield the decoded chunks.
+        The connection is returned to the pool when the generator is exhausted or closed. """
+        payload = {**payload, "stream": True}
+        with self.session.post(f"{self.url}/api/chat", json=payload, stream=True, timeout=self._timeout(timeout)) as response:
+            response.raise_for_status()
+            for chunk in iter_ndjson(response.iter_content(chunk_size=None)):
+                yield chunk
+                if chunk.get("done"):
+                    break
+
+
+    def close(self):
+        self.session.close()
+
+
+    def _timeout(self, timeout: float|None) -> tuple[float, float]:
+        return self.timeout if timeout is None else (self.timeout[0], timeout)
+
+
+_clients: dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url: str = OLLAMA_URL) -> OllamaClient:
+    """ Return the shared client of the server, created with the default settings on the first call """
+    url = _base_url(url)
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = OllamaClient(url)
+        return _clients[url]
+
+
+def iter_ndjson(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """ Decode a stream of newline-delimited JSON objects from the received byte chunks.
+    The lines are split on the bytes and decoded without copying each line through a text decoder,
+    empty lines, SSE-style "data:" prefixes and lines that are not JSON objects are skipped. """
+    buffer = b""
+    for data in chunks:
+        if not data:
+            continue
+        buffer += data
+        if b"\n" not in data:
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            chunk = _decode_line(line)
+            if chunk is not None:
+                yield chunk
+    chunk = _decode_line(buffer)
+    if chunk is not None:
+        yield chunk
+
+
+def _decode_line(line: bytes) -> dict|None:
+    line = line.strip()
+    if line.startswith(b"data:"):
+        line = line[5:].strip()
+    if not line:
+        return None
+    try:
+        chunk = _loads(line)
+    except ValueError:
+        return None
+    return chunk if isinstance(chunk, dict) else None
+
+
+def _chunk_text(chunk: dict) -> str:
+    """ The text of a response or a streamed chunk of /api/chat (or /api/generate) """
+    message = chunk.get("message")
+    if isinstance(message, dict):
+        content = message.get("content")
+        return content if isinstance(content, str) else ""
+    response = chunk.get("response")
+    return response if isinstance(response, str) else ""
+
+
+class OllamaModel(BaseStreamModel):
+    """ A model served by Ollama, the requests are sent with the shared client of the server.
+    Failed requests are logged and return an empty response (an empty stream), like the other adapters.
+    - args:
+        - model: the name of the model in Ollama, e.g. "llama3.2:1b"
+        - options: the model options of the requests, e.g. `{"temperature": 0.0, "num_ctx": 8192}`
+        - client: the client of the server, default: the shared client of `$OLLAMA_URL`
+        - timeout: the read timeout (seconds) of the requests, default: the timeout of the client
+        - keep_alive: how long the server keeps the model loaded after a request, e.g. "30m", default: the server setting
+    """
+    def __init__(
+        self,
+        model: str,
+        options: dict|None = None,
+        client: OllamaClient|None = None,
+        timeout: float|None = None,
+        keep_alive: str|None = None,
+    ):
+        self.model = model
+        self.options = dict(options) if options is not None else {}
+        self.client = client if client is not None else get_client()
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+
+
+    def chat_complete(self, message: list[dict[str, str]]) -> str:
+        try:
+            return _chunk_text(self.client.chat(self._payload(message), timeout=self.timeout))
+        except Exception as e:
+            print(f"[OllamaModel.chat_complete] {e.__class__.__name__}: {e}")
+            return ""
+
+
+    def stream(self, message: list[dict[str, str]]) -> Generator[str, None, None]:
+        chunks = self.client.stream_chat(self._payload(message), timeout=self.timeout)
+        try:
+            for chunk in chunks:
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+        except Exception as e:
+            print(f"[OllamaModel.stream] {e.__class__.__name__}: {e}")
+        finally:
+            chunks.close()
+
+
+    def _payload(self, message: list[dict[str, str]]) -> dict:
+        payload: dict = {"model": self.model, "messages": message}
+        if self.options:
+            payload["options"] = self.options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
@@ -1,17 +1,19 @@
 # file: live_mind/models/ollama_adapter.py
-import requests
 import json
-from typing import List, Dict, Iterable
+from typing import List, Dict, Callable
+from .ollama import get_client, _chunk_text
 
 class OllamaAdapter:
     """
     Minimal adapter to call Ollama REST /api/chat.
-    Methods below are minimal; adapt names to LiveMind's BaseModel interface if needed.
+    The requests are sent with the shared client of the server (`live_mind.models.ollama`), so the connections are reused.
+    For the BaseModel/BaseStreamModel interface, use `live_mind.models.ollama.OllamaModel`.
     """
 
     def __init__(self, model_name: str = "llama3.2:1b", url: str = "http://localhost:11434/api/chat"):
         self.model_name = model_name
         self.url = url
+        self.client = get_client(url.removesuffix("/api/chat"))
 
     def chat(self, messages: List[Dict[str,str]], **kwargs) -> Dict:
         """
@@ -23,34 +25,26 @@ class OllamaAdapter:
             "messages": messages,
         }
         payload.update(kwargs or {})
-        r = requests.post(self.url, json=payload, timeout=120)
-        r.raise_for_status()
-        return r.json()
+        return self.client.chat(payload, timeout=120)
 
     def generate_text(self, prompt: str, **kwargs) -> str:
         """Convenience: one-shot prompt -> text"""
         messages = [{"role": "user", "content": prompt}]
         j = self.chat(messages, **kwargs)
-        # Ollama returns `choices` / content depending on version; adjust accordingly:
-        # Try to extract assistant content if present.
-        try:
-            # common shape: {"choices":[{"message":{"content":"..."}}, ...]}
-            return j["choices"][0]["message"]["content"]
-        except Exception:
-            # fallback: return raw json
-            return json.dumps(j)
+        # /api/chat returns {"message": {"role": "assistant", "content": "..."}, ...}
+        text = _chunk_text(j)
+        if text:
+            return text
+        # fallback: return raw json
+        return json.dumps(j)
 
-    def stream_chat(self, messages: List[Dict[str,str]], chunk_handler):
+    def stream_chat(self, messages: List[Dict[str,str]], chunk_handler: Callable[[str], None]):
         """
-        Minimal chunked/streaming example — if you want to stream output into LiveMind UI.
-        chunk_handler should be callable(chunk_str)
-        Ollama supports chunked responses; here we do a simple requests iter_lines approach.
+        Minimal streaming example — if you want to stream output into LiveMind UI.
+        chunk_handler should be callable(chunk_str), it is called with the text of each streamed chunk.
         """
         payload = {"model": self.model_name, "messages": messages}
-        with requests.post(self.url, json=payload, stream=True) as r:
-            r.raise_for_status()
-            for line in r.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                # server may send JSON chunks or text lines; pass to handler
-                chunk_handler(line)
+        for chunk in self.client.stream_chat(payload):
+            text = _chunk_text(chunk)
+            if text:
+                chunk_handler(text)
@@ -0,0 +1,240 @@
+""" Content-addressed cache of model responses """
+__all__ = ['CachedModel']
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Generator
+from ..abc import BaseModel, BaseStreamModel
+from ..formatter.stream import ActionStreamParser
+
+# the number of memory hits whose access times are written to the database at once
+_ACCESS_BATCH = 64
+
+
+class CachedModel(BaseStreamModel):
+    """ Cache the responses of a model by the content of the messages.
+    The key is the hash of the model id and the canonicalized messages. The responses are kept in an in-memory LRU
+    of `max_entries` entries, and optionally in an SQLite database at `path`, which is shared by runs and processes.
+    The database is limited to about `max_disk_bytes` bytes of responses, the least recently used responses are evicted.
+    The access times of the memory hits are written to the database in batches (at the latest before an eviction or on `close`),
+    so the hot responses served from the memory are not evicted first.
+
+    Cached responses are replayed by `stream` as a single piece, streamed responses are cached if the stream is exhausted,
+    or if it is stopped by `stop_parser` (the early stop of the inference stage, see `ActionStreamParser`). A stopped response
+    is keyed by the message and the settings of the parser, so it is only replayed to a parser that stops at the same piece.
+    Empty responses (e.g. failed requests) are not cached.
+    - args:
+        - model: the model to be cached
+        - model_id: the name of the model, part of the key (different models must not share a cache entry)
+        - max_entries: the maximum number of responses in memory, default: 1024
+        - path: the path to the SQLite database, `None` for the in-memory cache only, default: `None`
+        - max_disk_bytes: the maximum size of the responses in the database, default: 256 MiB
+        - stop_parser: the action parser of the controller that consumes the streams (one session only), whose state tells
+          whether a closed stream is stopped by it, default: `None` (the stopped streams are not cached)
+    """
+    def __init__(
+        self,
+        model: BaseModel,
+        model_id: str,
+        max_entries: int = 1024,
+        path: str|None = None,
+        max_disk_bytes: int = 256 * 2**20,
+        stop_parser: ActionStreamParser|None = None,
+    ):
+        assert max_entries > 0 and max_disk_bytes > 0
+        self.model = model
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stop_parser = stop_parser
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        # access times of the memory hits not yet written to the database
+        self._accessed: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection|None = None
+        self._disk_bytes = 0
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+    def key(self, message: list[dict[str, str]]) -> str:
+        """ The key of the message: the hash of the model id and the canonicalized message """
+        canonical = json.dumps([self.model_id, message], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+    def chat_complete(self, message: list[dict[str, str]]) -> str:
+        key = self.key(message)
+        response = self.get(key)
+        if response is None:
+            response = self.model.chat_complete(message)
+            self.put(key, response)
+        return response
+
+
+    def batch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        """ Complete a batch of messages, only the messages not in the cache are sent to the model (as one batch) """
+        keys = [self.key(message) for message in messages]
+        responses = [self.get(key) for key in keys]
+        missed = [i for i, response in enumerate(responses) if response is None]
+        if missed:
+            new_responses = self.model.batch_chat_complete([messages[i] for i in missed])
+            for i, response in zip(missed, new_responses):
+                responses[i] = response
+                self.put(keys[i], response)
+        return responses # type: ignore
+
+
+    def stream(self, message: list[dict[str, str]]) -> Generator[str, None, None]:
+        key = self.key(message)
+        # the parser is reset for this response before the stream starts
+        stop_key = None
+        if self.stop_parser is not None:
+            stop_key = hashlib.sha256(f"{key}:{self.stop_parser.key()}".encode("utf-8")).hexdigest()
+        # a response stopped by the parser is preferred, as a stream not stopped by it is the complete response
+        response = self.get(stop_key, key) if stop_key is not None else self.get(key)
+        if response is not None:
+            yield response
+            return
+        if not isinstance(self.model, BaseStreamModel):
+            response = self.model.chat_complete(message)
+            self.put(key, response)
+            yield response
+            return
+        pieces = []
+        response_gen = self.model.stream(message)
+        try:
+            for text in response_gen:
+                pieces.append(text)
+                yield text
+        except GeneratorExit:
+            # the stream is closed before it is exhausted, cache it only if the parser stopped it
+            if stop_key is not None and self.stop_parser is not None and self.stop_parser.stopped:
+                self.put(stop_key, "".join(pieces))
+            raise
+        finally:
+            response_gen.close()
+        self.put(key, "".join(pieces))
+
+
+    def get(self, key: str, *fallback_keys: str|None) -> str|None:
+        """ Get the response from the memory or the database, the fallback keys are tried in order if the key is not cached,
+        return `None` if none of the keys is cached """
+        with self._lock:
+            response = None
+            for cache_key in (key, *fallback_keys):
+                if cache_key is not None:
+                    response = self._get(cache_key)
+                    if response is not None:
+                        break
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+
+    def _get(self, key: str) -> str|None:
+        response = self._memory.get(key)
+        if response is not None:
+            self._memory.move_to_end(key)
+            if self._db is not None:
+                self._accessed[key] = time.time()
+                if len(self._accessed) >= _ACCESS_BATCH:
+                    self._write_accessed()
+                    self._db.commit()
+        elif self._db is not None:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                response = row[0]
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+                self._put_memory(key, response)
+        return response
+
+
+    def put(self, key: str, response: str):
+        """ Put the response to the memory and the database """
+        if not response:
+            return
+        with self._lock:
+            self._put_memory(key, response)
+            if self._db is not None:
+                size = len(response.encode("utf-8"))
+                row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._disk_bytes -= row[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, response, size, time.time())
+                )
+                self._disk_bytes += size
+                self._accessed.pop(key, None)
+                self._evict_disk()
+                self._db.commit()
+
+
+    def clear(self):
+        """ Remove all responses from the memory and the database """
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_bytes = 0
+
+
+    def close(self):
+        """ Close the database """
+        with self._lock:
+            if self._db is not None:
+                self._write_accessed()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+    def _put_memory(self, key: str, response: str):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+    def _write_accessed(self):
+        """ Write the access times of the memory hits to the database """
+        assert self._db is not None
+        if self._accessed:
+            self._db.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(t, k) for k, t in self._accessed.items()])
+            self._accessed.clear()
+
+
+    def _evict_disk(self):
+        """ Evict the least recently used responses until the size of the database is within the limit """
+        assert self._db is not None
+        if self._disk_bytes > self.max_disk_bytes:
+            self._write_accessed()
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk_bytes -= size
@@ -0,0 +1,325 @@
+""" Simulated model with a configurable latency model, to benchmark the controllers without model weights.
+The model runs in-process, or behind a local HTTP server speaking the Ollama /api/chat protocol (`SimulatedOllamaServer`),
+e.g. to benchmark `run_solver.py` through `OllamaModel` (see `run_simulated.py`).
+"""
+__all__ = [
+    'SimulatedModel',
+    'SimulatedOllamaServer',
+]
+
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections.abc import AsyncGenerator, Generator
+from ..abc import BaseStreamModel, AsyncBaseStreamModel
+from ..formatter.functions import format_inference_sys, format_summarize_sys
+from ..text.abc import BaseTokenizer
+from ..text.tokenizer import RegexTokenizer, count_message_tokens
+
+# the words of the simulated contents
+_WORDS = (
+    "the problem asks for a value of each option so we compare the given terms and check "
+    "which one satisfies all conditions then the result follows from this step"
+).split()
+
+
+class _Plan():
+    """ The simulated response of a message: the pieces (tokens) and the jitter factor of the timings """
+    def __init__(self, input_tokens: int, pieces: list[str], factor: float):
+        self.input_tokens = input_tokens
+        self.pieces = pieces
+        self.factor = factor
+
+
+class SimulatedModel(BaseStreamModel, AsyncBaseStreamModel):
+    """ A model that responds in the formats of `LMFormatter` with simulated timings.
+    The stage is recognized by the system message: the inference stage responds with an action drawn from `action_weights`,
+    the summarize stage with a summary, and the other messages (the output stage) with a content and 'the answer is (X)'.
+
+    The first piece arrives after `ttft + prefill_per_token * input_tokens` seconds, the following pieces every `1 / decode_rate`
+    seconds, all scaled by a log-normal jitter factor of the request. `chat_complete` returns at the arrival time of the last piece.
+    A batch is prefilled as one prompt of all the input tokens and decoded together.
+
+    The responses and the timings are deterministic: they are drawn from a generator seeded by `seed` and the message,
+    so they do not depend on the order or the concurrency of the requests.
+    - args:
+        - ttft: the time to first token of an empty prompt (seconds), default: 0.05
+        - prefill_per_token: the prefill time per input token (seconds), default: 0.0002
+        - decode_rate: the decoded tokens per second, default: 50
+        - jitter: the sigma of the log-normal jitter factor, 0 for exact timings, default: 0.1
+        - action_weights: the weights of the actions of the inference stage by name, default: `{"inference": 1, "wait": 1}`
+        - content_tokens: the mean number of tokens of a content, default: 24
+        - answers: the choices of the answers, default: "ABCD"
+        - seed: the seed of the responses, default: 0
+        - tokenizer: the tokenizer to count the input tokens, default: `RegexTokenizer`
+        - realtime: wait for the simulated timings, otherwise respond immediately, default: `True`
+    """
+    def __init__(
+        self,
+        ttft: float = 0.05,
+        prefill_per_token: float = 0.0002,
+        decode_rate: float = 50.0,
+        jitter: float = 0.1,
+        action_weights: dict[str, float]|None = None,
+        content_tokens: int = 24,
+        answers: str = "ABCD",
+        seed: int = 0,
+        tokenizer: BaseTokenizer|None = None,
+        realtime: bool = True,
+    ):
+        assert decode_rate > 0 and content_tokens > 0 and answers
+        self.ttft = ttft
+        self.prefill_per_token = prefill_per_token
+        self.decode_rate = decode_rate
+        self.jitter = jitter
+        self.action_weights = dict(action_weights) if action_weights is not None else {"inference": 1.0, "wait": 1.0}
+        self.content_tokens = content_tokens
+        self.answers = answers
+        self.seed = seed
+        self.tokenizer = tokenizer if tokenizer is not None else RegexTokenizer()
+        self.realtime = realtime
+        self._inference_sys = format_inference_sys()
+        self._summarize_sys = format_summarize_sys()
+
+
+    def count_tokens(self, message: list[dict[str, str]]) -> int:
+        """ The number of input tokens of the message, with the tokens of the chat template per message """
+        return count_message_tokens(message, self.tokenizer)
+
+
+    def response_times(self, input_tokens: int, num_pieces: int, factor: float = 1.0) -> list[float]:
+        """ The arrival times (seconds after the request) of the pieces of a response """
+        first = self.ttft + self.prefill_per_token * input_tokens
+        return [factor * (first + i / self.decode_rate) for i in range(num_pieces)]
+
+
+    def chat_complete(self, message: list[dict[str, str]]) -> str:
+        plan = self._plan(message)
+        self._wait(time.monotonic(), self.response_times(plan.input_tokens, len(plan.pieces), plan.factor)[-1])
+        return "".join(plan.pieces)
+
+
+    def batch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        start = time.monotonic()
+        plans = [self._plan(message) for message in messages]
+        if plans:
+            self._wait(start, self._batch_time(plans))
+        return ["".join(plan.pieces) for plan in plans]
+
+
+    def stream(self, message: list[dict[str, str]], max_tokens: int|None = None) -> Generator[str, None, None]:
+        """ Stream the pieces of the response at their arrival times, at most `max_tokens` pieces """
+        start = time.monotonic()
+        plan = self._plan(message)
+        pieces = plan.pieces[:max_tokens]
+        for piece, arrival in zip(pieces, self.response_times(plan.input_tokens, len(pieces), plan.factor)):
+            self._wait(start, arrival)
+            yield piece
+
+
+    async def achat_complete(self, message: list[dict[str, str]]) -> str:
+        plan = self._plan(message)
+        await self._async_wait(time.monotonic(), self.response_times(plan.input_tokens, len(plan.pieces), plan.factor)[-1])
+        return "".join(plan.pieces)
+
+
+    async def abatch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        start = time.monotonic()
+        plans = [self._plan(message) for message in messages]
+        if plans:
+            await self._async_wait(start, self._batch_time(plans))
+        return ["".join(plan.pieces) for plan in plans]
+
+
+    async def astream(self, message: list[dict[str, str]]) -> AsyncGenerator[str, None]:
+        start = time.monotonic()
+        plan = self._plan(message)
+        for piece, arrival in zip(plan.pieces, self.response_times(plan.input_tokens, len(plan.pieces), plan.factor)):
+            await self._async_wait(start, arrival)
+            yield piece
+
+
+    def _plan(self, message: list[dict[str, str]]) -> _Plan:
+        canonical = json.dumps([self.seed, message], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        rng = random.Random(hashlib.sha256(canonical.encode("utf-8")).digest())
+        # drawn even without jitter, so the responses do not depend on the timing settings
+        factor = rng.lognormvariate(0, self.jitter)
+        sys_msg = message[0]["content"] if message and message[0]["role"] == "system" else ""
+        if sys_msg == self._inference_sys:
+            names = list(self.action_weights)
+            name = rng.choices(names, weights=[self.action_weights[n] for n in names])[0]
+            pieces = ["action", f" {name}", "."]
+            if name != "wait":
+                pieces += self._content(rng)
+        elif sys_msg == self._summarize_sys:
+            pieces = ["action", " summarize", "."] + self._content(rng)
+        else:
+            content = self._content(rng)
+            content[0] = content[0].lstrip().capitalize()
+            pieces = content + [".", " The", " answer", " is", f" ({rng.choice(self.answers)})", "."]
+        return _Plan(self.count_tokens(message), pieces, factor)
+
+
+    def _content(self, rng: random.Random) -> list[str]:
+        num_tokens = max(1, round(rng.gauss(self.content_tokens, self.content_tokens / 4)))
+        return [f" {rng.choice(_WORDS)}" for _ in range(num_tokens)]
+
+
+    def _batch_time(self, plans: list[_Plan]) -> float:
+        """ The completion time of a batch: the prompts are prefilled together, then the responses are decoded together """
+        input_tokens = sum(plan.input_tokens for plan in plans)
+        return max(self.response_times(input_tokens, len(plan.pieces), plan.factor)[-1] for plan in plans)
+
+
+    def _wait(self, start: float, arrival: float):
+        if self.realtime:
+            delay = start + arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+    async def _async_wait(self, start: float, arrival: float):
+        if self.realtime:
+            delay = start + arrival - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+class SimulatedOllamaServer():
+    """ Local HTTP server of a simulated model, speaking the Ollama /api/chat protocol (streamed and not streamed),
+    so the HTTP clients (e.g. `OllamaModel`) can be benchmarked end to end. Each request is served in its own thread,
+    a streamed response stops when the client closes the connection. The model names of the requests are ignored.
+    The option "num_predict" of a request limits the number of tokens of the response.
+    - args:
+        - model: the simulated model, default: `SimulatedModel()`
+        - host: the host to bind, default: "127.0.0.1"
+        - port: the port to bind, 0 for a free port, default: 0
+    """
+    def __init__(self, model: SimulatedModel|None = None, host: str = "127.0.0.1", port: int = 0):
+        self.model = model if model is not None else SimulatedModel()
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self.model))
+        self.server.daemon_threads = True
+        self._thread: threading.Thread|None = None
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def start(self) -> 'SimulatedOllamaServer':
+        """ Serve the requests in a background thread """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+
+    def stop(self):
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+
+    def __enter__(self) -> 'SimulatedOllamaServer':
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _make_handler(model: SimulatedModel) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        # keep the connections alive, as the Ollama server does
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+
+        def do_GET(self):
+            if self.path in ("/", "/api/version"):
+                self._send_json({"version": "simulated"})
+            elif self.path == "/api/tags":
+                self._send_json({"models": []})
+            else:
+                self._send_json({"error": "not found"}, status=404)
+
+
+        def do_POST(self):
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                message = payload["messages"]
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json({"error": f"invalid request: {e}"}, status=400)
+                return
+            if self.path != "/api/chat":
+                self._send_json({"error": "not found"}, status=404)
+                return
+            max_tokens = (payload.get("options") or {}).get("num_predict")
+            max_tokens = max_tokens if isinstance(max_tokens, int) and max_tokens > 0 else None
+            start = time.monotonic()
+            if payload.get("stream", True):
+                self._stream(payload, message, max_tokens, start)
+            else:
+                pieces = list(model.stream(message, max_tokens))
+                self._send_json(_chat_chunk(payload, "".join(pieces), True, start, model.count_tokens(message), len(pieces)))
+
+
+        def _stream(self, payload: dict, message: list[dict[str, str]], max_tokens: int|None, start: float):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            num_pieces = 0
+            try:
+                for piece in model.stream(message, max_tokens):
+                    num_pieces += 1
+                    self._send_chunk(_chat_chunk(payload, piece, False, start))
+                self._send_chunk(_chat_chunk(payload, "", True, start, model.count_tokens(message), num_pieces))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # the client stopped the generation
+                self.close_connection = True
+
+
+        def _send_chunk(self, chunk: dict):
+            data = json.dumps(chunk).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+
+        def _send_json(self, body: dict, status: int = 200):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def _chat_chunk(payload: dict, text: str, done: bool, start: float, prompt_tokens: int = 0, eval_tokens: int = 0) -> dict:
+    chunk = {
+        "model": payload.get("model", "simulated"),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "message": {"role": "assistant", "content": text},
+        "done": done,
+    }
+    if done:
+        chunk["done_reason"] = "stop"
+        chunk["total_duration"] = int((time.monotonic() - start) * 1e9)
+        chunk["prompt_eval_count"] = prompt_tokens
+        chunk["eval_count"] = eval_tokens
+    return chunk
+
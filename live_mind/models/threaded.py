@@ -0,0 +1,66 @@
+""" Run blocking models in worker threads to use them with the async controllers """
+__all__ = ['ThreadedAsyncModel']
+
+import time
+import asyncio
+from collections.abc import AsyncGenerator, Callable
+from ..abc import BaseModel, BaseStreamModel, AsyncBaseStreamModel
+from .instrumented import queue_waits, report_queue_wait
+
+_STREAM_END = object()
+
+
+def _queued(fn: Callable, waits: list[float]|None) -> Callable:
+    """ Wrap the function submitted to the executor to report the time it waits for a worker thread """
+    enqueued = time.monotonic()
+    def call(*args):
+        report_queue_wait(waits, enqueued)
+        return fn(*args)
+    return call
+
+
+class ThreadedAsyncModel(AsyncBaseStreamModel):
+    """ Wrap a blocking `BaseModel` as an `AsyncBaseStreamModel`.
+    The blocking calls are executed in the default executor of the event loop, so the event loop is not blocked.
+    If the wrapped model is not a `BaseStreamModel`, `astream` yields the complete response at once.
+    The time a call waits for a free worker thread is reported to the instrumented call (see `live_mind.models.instrumented`),
+    for a stream only the wait of the first piece.
+    - args:
+        - model: the blocking model to be wrapped
+    """
+    def __init__(self, model: BaseModel):
+        self.model = model
+
+    async def achat_complete(self, message: list[dict[str, str]]) -> str:
+        return await asyncio.to_thread(_queued(self.model.chat_complete, queue_waits()), message)
+
+    async def abatch_chat_complete(self, messages: list[list[dict[str, str]]]) -> list[str]:
+        return await asyncio.to_thread(_queued(self.model.batch_chat_complete, queue_waits()), messages)
+
+    async def astream(self, message: list[dict[str, str]]) -> AsyncGenerator[str, None]:
+        if not isinstance(self.model, BaseStreamModel):
+            yield await self.achat_complete(message)
+            return
+
+        loop = asyncio.get_running_loop()
+        text_gen = iter(self.model.stream(message))
+        pending: asyncio.Future|None = None
+        # the request is sent by the first `next`
+        waits = queue_waits()
+        try:
+            while True:
+                pending = loop.run_in_executor(None, _queued(next, waits), text_gen, _STREAM_END)
+                waits = None
+                # shield the future: the worker thread cannot be interrupted, so it must finish before the generator is closed
+                text = await asyncio.shield(pending)
+                pending = None
+                if text is _STREAM_END:
+                    break
+                yield text
+        finally:
+            if pending is not None:
+                await asyncio.wait([pending])
+            # close the generator (and the underlying connection) if the stream is not exhausted
+            close = getattr(text_gen, "close", None)
+            if close is not None:
+                await loop.run_in_executor(None, close)
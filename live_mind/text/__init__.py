@@ -2,14 +2,24 @@
 __all__ = [
     'streamer',
     'segmenter',
+    'regex_tokenizer',
+    'span',
+    'tokenizer',
+    'typing_models',
     'TextStreamer',
+    'RealTimeTextStreamer',
     'nltk_sent_segmenter',
     'nltk_comma_segmenter',
     'chunk_segmenter',
     'char_segmenter',
-    'get_segmenter'
+    'get_segmenter',
+    'IncrementalSegmenter',
+    'get_tokenizer',
+    'get_typing_model',
 ]
 
-from . import streamer, segmenter
-from .streamer import TextStreamer
-from .segmenter import get_segmenter
+from . import streamer, segmenter, regex_tokenizer, span, tokenizer, typing_models
+from .streamer import TextStreamer, RealTimeTextStreamer
+from .segmenter import get_segmenter, IncrementalSegmenter
+from .tokenizer import get_tokenizer
+from .typing_models import get_typing_model
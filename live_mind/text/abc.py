@@ -16,3 +16,19 @@ class BaseTextStreamer(ABC):
     def empty(self) -> bool:
         """ Check if the streamer is empty """
         pass
+
+
+class BaseTokenizer(ABC):
+    """ Abstract class for the tokenizer of the token granularity """
+    @abstractmethod
+    def tokenize(self, text: str) -> list[str]:
+        """ Split the text into tokens, the concatenation of the tokens is the text """
+        pass
+
+
+class BaseTypingModel(ABC):
+    """ Abstract class for the typing model of the text streamer """
+    @abstractmethod
+    def delays(self, pieces: list[str]) -> list[float]:
+        """ Return the time required to type each piece, the pieces are typed in order as one text """
+        pass
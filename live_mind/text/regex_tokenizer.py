@@ -0,0 +1,87 @@
+""" A dependency-free sentence tokenizer built on precompiled regexes, used by the "sent-fast" and "clause-fast" segmenters.
+It follows the decisions of the NLTK Punkt tokenizer for English on the common cases (abbreviations, initials, numbers,
+ellipses and closing quotes) without loading the Punkt model.
+"""
+__all__ = [
+    'regex_sent_tokenize',
+    'regex_sent_boundaries',
+]
+
+import re
+
+# abbreviations that are not followed by a sentence break, e.g. "Dr. Smith", "e.g. The"
+_NO_BREAK_ABBREVS = frozenset([
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "ft", "gen", "gov", "sen", "rep", "rev",
+    "col", "lt", "sgt", "capt", "cmdr", "adm", "vs", "cf", "e.g", "i.e", "fig", "figs", "no", "nos",
+    "pp", "vol", "vols", "ch", "sec", "approx", "al", "ca", "viz",
+])
+# abbreviations that end the sentence if the next word is capitalized, e.g. "etc. The"
+_ABBREVS = frozenset([
+    "etc", "inc", "ltd", "co", "corp", "bros", "dept", "est", "jan", "feb", "mar", "apr", "jun", "jul",
+    "aug", "sep", "sept", "oct", "nov", "dec", "mon", "tue", "wed", "thu", "fri", "sat", "sun",
+    "u.s", "u.k", "u.n", "a.m", "p.m", "d.c", "ph.d",
+])
+
+# sentence-ending punctuation with optional closing quotes or brackets, followed by whitespace
+_BOUNDARY = re.compile(r"""(?P<end>[.?!]+)["'”’)\]}]*(?=\s)""")
+_NEXT_WORD = re.compile(r"\s+(\S+)")
+# single-letter initials and words with inner periods (e.g. "U.S")
+_INITIAL = re.compile(r"[^\W\d_]")
+_DOTTED = re.compile(r"(?:[^\W\d_]\.)+[^\W\d_]")
+_NUMBER = re.compile(r"[$#]?[\d,.:/-]*\d%?")
+
+
+def regex_sent_tokenize(text: str) -> list[str]:
+    """ Split the text into sentences, the sentences are stripped slices of the text like `nltk.tokenize.sent_tokenize` """
+    sents = []
+    start = 0
+    for end in regex_sent_boundaries(text):
+        sent = text[start:end].strip()
+        if sent:
+            sents.append(sent)
+        start = end
+    last_sent = text[start:].strip()
+    if last_sent:
+        sents.append(last_sent)
+    return sents
+
+
+def regex_sent_boundaries(text: str, pos: int = 0) -> list[int]:
+    """ Return the end offsets of the sentences in `text[pos:]` except the last sentence,
+    the sentences are `text[pos:ends[0]], text[ends[0]:ends[1]], ..., text[ends[-1]:]` """
+    ends = []
+    for matched in _BOUNDARY.finditer(text, pos):
+        next_word = _NEXT_WORD.match(text, matched.end())
+        if next_word is None:
+            # the end of the text
+            break
+        end_start = matched.start()
+        word_start = max(text.rfind(" ", pos, end_start), text.rfind("\n", pos, end_start), text.rfind("\t", pos, end_start), pos - 1) + 1
+        word = text[word_start:end_start]
+        if _is_break(word, matched.group("end"), next_word.group(1)):
+            ends.append(matched.end())
+    return ends
+
+
+def _is_break(word: str, end: str, next_word: str) -> bool:
+    """ Check if the punctuation after the word ends the sentence, based on the word and the next word """
+    if "?" in end or "!" in end:
+        return True
+    next_upper = next_word.lstrip("\"'“‘([{")[:1].isupper()
+    if len(end) > 1:
+        # ellipsis
+        return next_upper
+    # strip the opening quotes or brackets of the word
+    word = word.lstrip("\"'“‘([{")
+    lower_word = word.lower()
+    if lower_word in _NO_BREAK_ABBREVS:
+        return False
+    if lower_word in _ABBREVS or _DOTTED.fullmatch(word):
+        return next_upper
+    if _INITIAL.fullmatch(word):
+        # initials of a name, e.g. "J. Smith"
+        return False
+    if _NUMBER.fullmatch(word):
+        # numbered items and numbers are followed by a sentence break only if the next word is capitalized
+        return not next_word[:1].islower()
+    return True
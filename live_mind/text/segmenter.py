@@ -1,13 +1,31 @@
 """ segmenters are functions that take a string and return a list of strings """
 __all__ = [
     'get_segmenter',
+    'IncrementalSegmenter',
 ]
 
-from nltk.tokenize import sent_tokenize, word_tokenize
+import re
 from typing import Callable
+from .regex_tokenizer import regex_sent_tokenize
+
+# NLTK is imported on the first call of the NLTK segmenters, the "-fast" segmenters do not load it
+
+SEGMENTER_NAMES = ["char", "word", "sent", "clause", "sent-fast", "clause-fast"]
 
 
 def get_segmenter(name: str, **kwargs) -> Callable[[str], list[str]]:
+    """ Return the segmenter by name, with `incremental=True` a stateful `IncrementalSegmenter` is returned,
+    and with `spans=True` a stateful `SpanSegmenter` (see `live_mind.text.span`, "sent-fast" and "clause-fast" only),
+    which should be used by one session only.
+    The "token" segmenter is always a stateful `TokenSegmenter`, its tokenizer is set with `tokenizer=...`. """
+    if name == "token":
+        from .tokenizer import TokenSegmenter
+        return TokenSegmenter(kwargs.get("tokenizer"))
+    if kwargs.get("spans", False):
+        from .span import SpanSegmenter
+        return SpanSegmenter(name, kwargs.get("min_len", 10))
+    if kwargs.get("incremental", False):
+        return IncrementalSegmenter(name, kwargs.get("min_len", 10))
     match name:
         case "char":
             return char_segmenter
@@ -28,6 +46,18 @@ def get_segmenter(name: str, **kwargs) -> Callable[[str], list[str]]:
             def segmenter(text: str) -> list[str]:
                 return nltk_comma_segmenter(text, min_len)
             return segmenter
+
+        case "sent-fast":
+            min_len = kwargs.get("min_len", 10)
+            def segmenter(text: str) -> list[str]:
+                return regex_sent_segmenter(text, min_len)
+            return segmenter
+
+        case "clause-fast":
+            min_len = kwargs.get("min_len", 10)
+            def segmenter(text: str) -> list[str]:
+                return regex_comma_segmenter(text, min_len)
+            return segmenter
         case _:
             raise ValueError(f"Unknown segmenter name: {name}")
 
@@ -37,6 +67,7 @@ def char_segmenter(text: str) -> list[str]:
 
 
 def nltk_word_segmenter(text):
+    from nltk.tokenize import word_tokenize
     words = word_tokenize(text, preserve_line=True)
 
     if not words:
@@ -61,20 +92,41 @@ def nltk_word_segmenter(text):
 
 
 def nltk_sent_segmenter(text: str, min_len: int=10) -> list[str]:
+    from nltk.tokenize import sent_tokenize
     sents = sent_tokenize(text)
     
     if not sents:
         return []
 
+    merged_sents, _ = _merge_sents(sents, min_len)
+    return merged_sents
+
+
+def regex_sent_segmenter(text: str, min_len: int=10) -> list[str]:
+    """ The same as `nltk_sent_segmenter` with the regex sentence tokenizer """
+    sents = regex_sent_tokenize(text)
+
+    if not sents:
+        return []
+
+    merged_sents, _ = _merge_sents(sents, min_len)
+    return merged_sents
+
+
+def _merge_sents(sents: list[str], min_len: int=10, prefix: str="") -> tuple[list[str], list[int]]:
+    """ Merge the short sentences, return the merged sentences and the index of the first sentence of each merged sentence.
+    `prefix` is added to the first merged sentence, e.g. " " if the sentences follow other sentences. """
     # Add a space to the start of each sentence, except the first one
     # merge short sentences into one
     merged_sents = []
+    starts = []
 
-    temp_sent = ""
+    temp_sent = prefix
     num_merged_sent = 0
-    for sent in sents[:-1]:
+    for index, sent in enumerate(sents[:-1]):
         if num_merged_sent == 0:
             temp_sent += sent
+            starts.append(index)
         else:
             temp_sent += " " + sent
         num_merged_sent += 1
@@ -85,10 +137,11 @@ def nltk_sent_segmenter(text: str, min_len: int=10) -> list[str]:
 
     if num_merged_sent == 0:
         last_sent = temp_sent + sents[-1]
+        starts.append(len(sents) - 1)
     else:
         last_sent = temp_sent + " " + sents[-1]
     merged_sents.append(last_sent)
-    return merged_sents
+    return merged_sents, starts
 
 
 def nltk_comma_segmenter(text: str, min_len: int=10) -> list[str]:
@@ -100,6 +153,14 @@ def nltk_comma_segmenter(text: str, min_len: int=10) -> list[str]:
     return segs
 
 
+def regex_comma_segmenter(text: str, min_len: int=10) -> list[str]:
+    """ The same as `nltk_comma_segmenter` with the regex sentence tokenizer """
+    segs = []
+    for sent in regex_sent_segmenter(text, min_len=min_len):
+        segs += _split_by_commas(sent, min_len)
+    return segs
+
+
 def _split_by_commas(text: str, min_len:int=10) -> list[str]:
     clauses = text.split(",")
     last_is_comma = False
@@ -133,3 +194,128 @@ def _check_num_chars(text_1: str, text_2: str) -> bool:
         return False
     
     return text_1[-1].isdigit() and text_2[0].isdigit()
+
+
+# whitespace-separated chunk with a letter or digit
+_WORD_CHUNK = re.compile(r"\S*[^\W_]\S*")
+
+
+class IncrementalSegmenter():
+    """ Stateful segmenter for a growing input, gives the same segments as `get_segmenter(name)` without segmenting
+    the whole input on every call.
+
+    The segments that can no longer change are committed, and only the tail after them is segmented again:
+    - "word": the words before the last whitespace-separated chunk with a letter or digit
+    - "sent"/"clause": the merged sentences that are followed by at least two sentences
+
+    If the appended text and the last character of the previous input are letters or digits, the appended text is added
+    to the last segment without segmenting (the fast path). The few decisions that depend on the complete last word
+    (e.g. "cannot" split into "can" and "not", an abbreviation followed by a partial word) are updated at the next boundary character.
+    If the input is not an extension of the previous input (e.g. edited), it is segmented from the start.
+
+    - args:
+        - `name`: the granularity, can be "char", "word", "sent", "clause", "sent-fast", "clause-fast"
+        - `min_len`: minimum length of the segment if using sent or clause granularity
+    """
+    def __init__(self, name: str, min_len: int = 10):
+        if name not in SEGMENTER_NAMES:
+            raise ValueError(f"Unknown segmenter name: {name}")
+        self.name = name
+        self.min_len = min_len
+        if name.endswith("-fast"):
+            self._sent_tokenize = regex_sent_tokenize
+        elif name != "char":
+            from nltk.tokenize import sent_tokenize
+            self._sent_tokenize = sent_tokenize
+        self.reset()
+
+
+    def reset(self):
+        """ Reset the state for a new input """
+        self._text = ""
+        self._segments: list[str] = []
+        # the committed segments and the offset of the tail
+        self._committed: list[str] = []
+        self._cut = 0
+
+
+    def __call__(self, text: str) -> list[str]:
+        if text == self._text:
+            return list(self._segments)
+        if not text.startswith(self._text):
+            self.reset()
+
+        appended = text[len(self._text):]
+        if self.name == "char":
+            self._segments.extend(appended)
+        elif self._segments and self._text[-1].isalnum() and appended.isalnum() \
+                and (self.name != "word" or self._segments[-1].lstrip().isalnum()):
+            self._segments[-1] += appended
+        elif self.name == "word":
+            self._segments = self._committed + self._segment_words(text)
+        else:
+            self._segments = self._committed + self._segment_sents(text)
+        self._text = text
+        return list(self._segments)
+
+
+    def _segment_words(self, text: str) -> list[str]:
+        """ Segment the tail into words and commit the words before the last chunk with a letter or digit,
+        since the trailing punctuation (e.g. quotes) changes how the words before are segmented """
+        from nltk.tokenize import word_tokenize
+        words = _space_words(word_tokenize(text[self._cut:], preserve_line=True), bool(self._committed))
+        last_start = self._cut
+        for matched in _WORD_CHUNK.finditer(text, self._cut):
+            last_start = matched.start()
+        if last_start == self._cut:
+            return words
+        # the words from the last chunk are the same when they are segmented alone
+        num_last = len(word_tokenize(text[last_start:], preserve_line=True))
+        num_committed = len(words) - num_last
+        self._committed += words[:num_committed]
+        self._cut = last_start
+        return words[num_committed:]
+
+
+    def _segment_sents(self, text: str) -> list[str]:
+        """ Segment the tail into merged sentences (or clauses) and commit the stable merged sentences """
+        tail = text[self._cut:]
+        sents = self._sent_tokenize(tail)
+        if not sents:
+            return []
+        merged_sents, starts = _merge_sents(sents, self.min_len, " " if self._committed else "")
+        segments = [self._split(sent) for sent in merged_sents]
+
+        # commit the merged sentences followed by at least two sentences, except the last one
+        num_committed = 0
+        while num_committed + 1 < len(merged_sents) and starts[num_committed + 1] <= len(sents) - 2:
+            num_committed += 1
+        if num_committed > 0:
+            # the sentences are slices of the tail, find the offset of the first uncommitted sentence
+            offset = 0
+            for sent in sents[:starts[num_committed]]:
+                offset = tail.find(sent, offset) + len(sent)
+            offset = tail.find(sents[starts[num_committed]], offset)
+            for segment in segments[:num_committed]:
+                self._committed += segment
+            self._cut += offset
+        return [seg for segment in segments[num_committed:] for seg in segment]
+
+
+    def _split(self, sent: str) -> list[str]:
+        if self.name in ["clause", "clause-fast"]:
+            return _split_by_commas(sent, self.min_len)
+        return [sent]
+
+
+def _space_words(words: list[str], follows: bool) -> list[str]:
+    """ Add a space to the start of each word starting with number or letter, except the first one if it does not follow other words """
+    new_words = []
+    for word in words:
+        if len(word) == 0:
+            continue
+        if (new_words or follows) and word[0].isalnum():
+            new_words.append(" " + word)
+        else:
+            new_words.append(word)
+    return new_words
@@ -0,0 +1,171 @@
+""" Span-based segments: the segments are `(start, end)` offsets into an append-only text buffer instead of string copies.
+The action cache compares and stores the spans, and the formatter materializes them with `str(span)`.
+"""
+__all__ = [
+    'Span',
+    'TextBuffer',
+    'SpanSegmenter',
+]
+
+from .regex_tokenizer import regex_sent_boundaries
+from .segmenter import _split_by_commas
+
+
+class TextBuffer():
+    """ Append-only text buffer of a session, the text before `len(text)` never changes """
+    def __init__(self):
+        self.text = ""
+
+
+    def extend(self, text: str) -> bool:
+        """ Replace the text with its extension, return `False` if `text` does not extend the buffer """
+        if not text.startswith(self.text):
+            return False
+        self.text = text
+        return True
+
+
+class Span():
+    """ The segment `buffer.text[start:end]`. Spans compare by content like strings, so they match the strings of a
+    restored cache and the spans of a previous buffer; the spans of the same buffer with the same offsets are equal without
+    materializing the content. """
+    __slots__ = ("buffer", "start", "end")
+
+    def __init__(self, buffer: TextBuffer, start: int, end: int):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    def __str__(self) -> str:
+        return self.buffer.text[self.start:self.end]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Span):
+            if self.buffer is other.buffer and self.start == other.start and self.end == other.end:
+                return True
+            return self.end - self.start == other.end - other.start and str(self) == str(other)
+        if isinstance(other, str):
+            return self.end - self.start == len(other) and str(self) == other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        # equal to the hash of the content, as the spans are equal to their strings
+        return hash(str(self))
+
+    def __repr__(self) -> str:
+        return f"Span({self.start}, {self.end}, {str(self)!r})"
+
+
+class SpanSegmenter():
+    """ Stateful segmenter that returns the segments as spans of its `TextBuffer`, used by one session only.
+
+    The spans are contiguous slices of the input, so the materialized segments keep the whitespace of the input.
+    Like `IncrementalSegmenter`, the committed spans are kept and only the tail is segmented again.
+    As the spans are contiguous, the text appended to a word of the last span (letters, digits and whitespace, after a
+    letter or digit) only moves the end of the last span without segmenting: a sentence or clause boundary needs punctuation.
+    If the input is not an extension of the previous input (e.g. edited), a new buffer is started, the spans of the previous
+    buffer still match the new spans by content.
+    The char granularity is not supported: the one-character strings are shared by CPython, so spans cannot save anything.
+
+    - args:
+        - `name`: the granularity, can be "sent-fast", "clause-fast"
+        - `min_len`: minimum length of the segment if using sent-fast or clause-fast granularity
+    """
+    def __init__(self, name: str, min_len: int = 10):
+        if name not in ["sent-fast", "clause-fast"]:
+            raise ValueError(f"Unknown span segmenter name: {name}")
+        self.name = name
+        self.min_len = min_len
+        self.reset()
+
+
+    def reset(self):
+        """ Start a new buffer """
+        self.buffer = TextBuffer()
+        self._segments: list[Span] = []
+        self._committed: list[Span] = []
+        self._cut = 0
+        self._reuse: dict[tuple[int, int], Span] = {}
+
+
+    def __call__(self, text: str) -> list[Span]:
+        if text == self.buffer.text:
+            return list(self._segments)
+        prev_len = len(self.buffer.text)
+        if not self.buffer.extend(text):
+            self.reset()
+            self.buffer.extend(text)
+            prev_len = 0
+
+        if self._segments and _extends_word(text, prev_len):
+            # fast path: the appended text is added to the last segment
+            self._segments[-1] = Span(self.buffer, self._segments[-1].start, len(text))
+        else:
+            # the spans of the previous tail are reused, so the cache compares them by identity
+            self._reuse = {(span.start, span.end): span for span in self._segments[len(self._committed):]}
+            self._segments = self._committed + self._segment_sents(text)
+            self._reuse = {}
+        return list(self._segments)
+
+
+    def _segment_sents(self, text: str) -> list[Span]:
+        """ Segment the tail into merged sentences (or clauses) and commit the stable merged sentences """
+        if not text[self._cut:].strip():
+            return []
+        ends = regex_sent_boundaries(text, self._cut) + [len(text)]
+        # merge the short sentences, `merged` has the end offset and the number of sentences of each merged sentence
+        merged: list[tuple[int, int]] = []
+        start = self._cut
+        for index, end in enumerate(ends):
+            if end - start >= self.min_len or index == len(ends) - 1:
+                merged.append((end, index + 1))
+                start = end
+
+        # commit the merged sentences followed by at least two sentences, except the last one
+        spans: list[Span] = []
+        start = self._cut
+        for index, (end, num_sents) in enumerate(merged):
+            sent_spans = self._split(start, end)
+            if index + 1 < len(merged) and num_sents <= len(ends) - 2:
+                self._committed += sent_spans
+                self._cut = end
+            else:
+                spans += sent_spans
+            start = end
+        return spans
+
+
+    def _split(self, start: int, end: int) -> list[Span]:
+        if self.name != "clause-fast":
+            return [self._span(start, end)]
+        clauses = _split_by_commas(self.buffer.text[start:end], self.min_len)
+        if len(clauses) > 1 and not clauses[-1].strip():
+            # the trailing whitespace belongs to the last clause, as the sentences are stripped by the string segmenters
+            clauses[-2:] = [clauses[-2] + clauses[-1]]
+        spans = []
+        for clause in clauses:
+            spans.append(self._span(start, start + len(clause)))
+            start += len(clause)
+        return spans
+
+
+    def _span(self, start: int, end: int) -> Span:
+        span = self._reuse.get((start, end))
+        if span is None:
+            span = Span(self.buffer, start, end)
+        return span
+
+
+def _extends_word(text: str, prev_len: int) -> bool:
+    """ Check if `text[prev_len:]` has only letters, digits and whitespace, and the last non-whitespace character
+    before it is a letter or digit, so no sentence or clause boundary is added or decided by the appended text """
+    appended = text[prev_len:]
+    if not (appended.isalnum() or not appended.strip() or "".join(appended.split()).isalnum()):
+        return False
+    index = prev_len - 1
+    while index >= 0 and text[index].isspace():
+        index -= 1
+    return index >= 0 and text[index].isalnum()
@@ -1,28 +1,35 @@
 """ text streamers are classes to simulate the streaming input of text data
 To use a text streamer, the texts to be streamed should be provided in advance.
 """
-__all__ = ["TextStreamer"]
+__all__ = ["TextStreamer", "RealTimeTextStreamer"]
 
+import time
+import asyncio
 from collections.abc import Callable
 from typing import Optional
-from .abc import BaseTextStreamer
+import numpy
+from .abc import BaseTextStreamer, BaseTypingModel
+from .tokenizer import RegexTokenizer
 
 class TextStreamer(BaseTextStreamer):
     """ Simulator for typing of text data. The texts will be generated based on `current_time` in the simulation.
     - args:
         - text: the text to be streamed
-        - delay_fn: a function that takes a text and returns the time required to type the text
+        - delay_fn: a function that takes a text and returns the time required to type the text,
+            it is called once for each piece of the text when the streamer is created
         - granularity: how the text is typed. Default is "char". 
         - final_text: the final text attached to the end of the text stream. The final text does not have delay.
         - config: additional configuration for the generator
+        - typing_model: the typing model (see `live_mind.text.typing_models`), replaces `delay_fn` if set
     """
     def __init__(
         self,
         text: str,
-        delay_fn: Callable[[str], float],
+        delay_fn: Callable[[str], float]|None,
         granularity: str = "char",
         final_text: Optional[str] = None,
         config: dict = {}, # additional configuration for the generator
+        typing_model: BaseTypingModel|None = None,
     ):
         assert granularity in ["char", "chunk", "token"]
         self.delay_fn = delay_fn
@@ -33,6 +40,13 @@ class TextStreamer(BaseTextStreamer):
         self.last_gen_time = 0.0 # when the last text was generated
         # 0 <= current_time - last_gen_time < delay_fn(next_text) always hold
         self.max_index = len(self.text)
+        # arrival_times[i] is the time when the i-th piece of the text is generated
+        if typing_model is not None:
+            delays = typing_model.delays(self.text)
+        else:
+            assert delay_fn is not None, "either delay_fn or typing_model should be set"
+            delays = [delay_fn(piece) for piece in self.text]
+        self.arrival_times = numpy.cumsum(delays, dtype=float)
 
 
     def next(self) -> str|None:
@@ -44,14 +58,12 @@ class TextStreamer(BaseTextStreamer):
             return None
 
         next_text = self.text[self.index]
-        delay = self.delay_fn(next_text)
+        self.last_gen_time = float(self.arrival_times[self.index])
+        self.current_time = self.last_gen_time
         self.index += 1
 
         if self.index == self.max_index and self.final_text:
             next_text += self.final_text
-
-        self.last_gen_time += delay
-        self.current_time = self.last_gen_time
         return next_text
 
 
@@ -60,32 +72,18 @@ class TextStreamer(BaseTextStreamer):
         No matter if any text is generated, the current time will be updated by the delay time.
         """
         assert delay >= 0
-        texts = []
-        while True:
-            # if the streamer reaches the end of the text
-            if self.index >= self.max_index:
-                break
-            next_text = self.text[self.index]
-            # time required to generate the next text
-            next_time = self.last_gen_time - self.current_time + self.delay_fn(next_text)
-            if delay < next_time:
-                # time is not enough to generate the next text
-                break
-            # update delay, current time and last generation time
-            self.index += 1
-            delay -= next_time
-            self.current_time += next_time
-            self.last_gen_time = self.current_time
-
-            if self.index == self.max_index and self.final_text:
-                next_text += self.final_text
-            texts.append(next_text)
-
-        self.current_time += delay # add the remaining delay time to the current time
-
-        if texts:
-            return "".join(texts)
-        return None
+        self.current_time += delay
+        # the pieces generated before the current time
+        end_index = int(self.arrival_times.searchsorted(self.current_time, side="right"))
+        if end_index <= self.index:
+            return None
+
+        text = "".join(self.text[self.index:end_index])
+        self.last_gen_time = float(self.arrival_times[end_index - 1])
+        self.index = end_index
+        if self.index == self.max_index and self.final_text:
+            text += self.final_text
+        return text
 
 
     def empty(self) -> bool:
@@ -99,11 +97,9 @@ class TextStreamer(BaseTextStreamer):
         if self.index >= self.max_index:
             return None
 
-        remaining_texts = self.text[self.index:]
-        remaining_text = "".join(remaining_texts)
+        remaining_text = "".join(self.text[self.index:])
         self.index = self.max_index
-        delay = self.delay_fn(remaining_text)
-        self.last_gen_time += delay
+        self.last_gen_time = float(self.arrival_times[-1])
         self.current_time = self.last_gen_time
 
         if self.final_text:
@@ -123,6 +119,61 @@ class TextStreamer(BaseTextStreamer):
                     raise ValueError("set config['chunk_size'] to specify the chunk size for the chunk granularity.")
                 return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
             case "token":
-                raise NotImplementedError("token granularity is not implemented yet.")
+                # set config['tokenizer'] to a BaseTokenizer (e.g. loaded from a tokenizer.json file), default: RegexTokenizer
+                tokenizer = kwargs.get("tokenizer")
+                if tokenizer is None:
+                    tokenizer = RegexTokenizer()
+                return tokenizer.tokenize(text)
             case _:
                 raise ValueError(f"granularity {granularity} is not supported.")
+
+
+class RealTimeTextStreamer(TextStreamer):
+    """ Text streamer in wall-clock time, used to put real load on a running backend (see `run_loadtest.py`).
+    The texts arrive at the same arrival times as the `TextStreamer`, counted from `start()` with the clock.
+    `current_time` and `last_gen_time` are the elapsed times since the start, so the latency of the session is
+    `elapsed() - last_gen_time` when the response of the final text is received.
+
+    - args: the same as `TextStreamer`, and
+        - clock: the wall clock in seconds, default: `time.monotonic` (the clock of the asyncio event loop)
+    """
+    def __init__(
+        self,
+        text: str,
+        delay_fn: Callable[[str], float]|None,
+        granularity: str = "char",
+        final_text: Optional[str] = None,
+        config: dict = {},
+        typing_model: BaseTypingModel|None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(text, delay_fn, granularity, final_text, config, typing_model)
+        self.clock = clock
+        self.start_time: float|None = None
+
+
+    def start(self):
+        """ Start typing the text """
+        self.start_time = self.clock()
+
+
+    def elapsed(self) -> float:
+        """ The time since the start """
+        assert self.start_time is not None, "the streamer is not started"
+        return self.clock() - self.start_time
+
+
+    def poll(self) -> str|None:
+        """ Return the text arrived since the last call without waiting, return `None` if no text has arrived """
+        return self.wait(max(self.elapsed() - self.current_time, 0.0))
+
+
+    async def anext(self) -> str|None:
+        """ Wait until new text arrives and return all the text arrived since the last call,
+        return `None` if the streamer reaches the end of the text """
+        while not self.empty():
+            text = self.poll()
+            if text is not None:
+                return text
+            await asyncio.sleep(max(float(self.arrival_times[self.index]) - self.elapsed(), 0.0))
+        return None
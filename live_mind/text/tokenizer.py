@@ -0,0 +1,120 @@
+""" Tokenizers for the token granularity of the text streamer and the segmenter.
+The tokens are returned as text pieces whose concatenation is the input text.
+"""
+__all__ = [
+    'HFTokenizer',
+    'RegexTokenizer',
+    'MESSAGE_TOKENS',
+    'TokenSegmenter',
+    'count_message_tokens',
+    'get_tokenizer',
+]
+
+import os
+import re
+from collections import OrderedDict
+from .abc import BaseTokenizer
+
+# pre-tokenization of the byte-level BPE tokenizers (e.g. Llama 3): contractions, words and numbers with a leading space,
+# punctuation, and whitespace
+_PRE_TOKEN = re.compile(r"""'(?i:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+|_+""")
+
+
+class RegexTokenizer(BaseTokenizer):
+    """ Dependency-free approximation of a BPE tokenizer: the text is split with the pre-tokenization rules only,
+    so a token is a word, a number of up to 3 digits or a run of punctuation. """
+    def tokenize(self, text: str) -> list[str]:
+        return _PRE_TOKEN.findall(text)
+
+
+class HFTokenizer(BaseTokenizer):
+    """ Tokenizer loaded from a local `tokenizer.json` file with the `tokenizers` package.
+    The encodings of the recent texts are cached.
+    - args:
+        - path: the `tokenizer.json` file or the model directory containing it
+        - cache_size: the number of cached encodings
+    """
+    def __init__(self, path: str, cache_size: int = 128):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("the `tokenizers` package is required to load a tokenizer.json file") from e
+        if os.path.isdir(path):
+            path = os.path.join(path, "tokenizer.json")
+        self._tokenizer = Tokenizer.from_file(path)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, list[str]] = OrderedDict()
+
+
+    def tokenize(self, text: str) -> list[str]:
+        if text in self._cache:
+            self._cache.move_to_end(text)
+            return list(self._cache[text])
+        encoding = self._tokenizer.encode(text, add_special_tokens=False)
+        # each token takes the text from its start to the start of the next token, so that the whitespace
+        # trimmed from the offsets is kept, tokens of the same character (e.g. bytes of an emoji) are merged
+        starts = sorted({start for start, end in encoding.offsets if end > start} | {0})
+        tokens = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)]) if end > start]
+        self._cache[text] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return list(tokens)
+
+
+# the tokens added by the chat template for each message (the role header and the end of the turn)
+MESSAGE_TOKENS = 4
+
+
+def count_message_tokens(message: list[dict[str, str]], tokenizer: BaseTokenizer, message_tokens: int = MESSAGE_TOKENS) -> int:
+    """ The number of input tokens of a chat message: the tokens of the contents and `message_tokens` per message.
+    The token budget, the simulated models and the instrumented calls count the messages with this function. """
+    return sum(len(tokenizer.tokenize(m["content"])) + message_tokens for m in message)
+
+
+def get_tokenizer(path: str|None = None) -> BaseTokenizer:
+    """ Return the tokenizer of the `tokenizer.json` file (or the model directory) at `path`,
+    or the `RegexTokenizer` if `path` is `None` """
+    if path is None:
+        return RegexTokenizer()
+    return HFTokenizer(path)
+
+
+class TokenSegmenter():
+    """ Stateful segmenter for the token granularity, used by one session only.
+    The tokens before the last word are kept, and only the last word and the appended text are tokenized again,
+    since a BPE token does not cross the start of a word (a token starting with whitespace).
+    If the input is not an extension of the previous input (e.g. edited), it is tokenized from the start.
+
+    - args:
+        - tokenizer: the tokenizer, default: `RegexTokenizer`
+    """
+    def __init__(self, tokenizer: BaseTokenizer|None = None):
+        self.tokenizer = tokenizer if tokenizer is not None else RegexTokenizer()
+        self.reset()
+
+
+    def reset(self):
+        self._text = ""
+        self._tokens: list[str] = []
+        # the committed tokens and the length of their text
+        self._committed: list[str] = []
+        self._cut = 0
+
+
+    def __call__(self, text: str) -> list[str]:
+        if text == self._text:
+            return list(self._tokens)
+        if not text.startswith(self._text):
+            self.reset()
+        tokens = self.tokenizer.tokenize(text[self._cut:])
+        # commit the tokens before the last token starting with whitespace
+        last_word = len(tokens) - 1
+        while last_word > 0 and not tokens[last_word][:1].isspace():
+            last_word -= 1
+        if last_word > 0:
+            self._committed += tokens[:last_word]
+            self._cut += sum(len(token) for token in tokens[:last_word])
+            tokens = tokens[last_word:]
+        self._text = text
+        self._tokens = self._committed + tokens
+        return list(self._tokens)
@@ -0,0 +1,120 @@
+""" Typing models for the text streamer: the time required to type each piece of the text.
+`ConstantTypingModel` types at a constant speed, `LogNormalTypingModel` draws the inter-key intervals from a log-normal
+distribution and adds pauses at the word boundaries and think time at the sentence ends, the bursts and pauses of real typing.
+"""
+__all__ = [
+    'TYPING_MODELS',
+    'ConstantTypingModel',
+    'LogNormalTypingModel',
+    'get_typing_model',
+]
+
+import math
+import re
+import numpy
+from .abc import BaseTypingModel
+
+TYPING_MODELS = ["constant", "lognormal", "bursty"]
+
+# the whitespace before a word, the word is typed after a pause
+_WORD_GAP = re.compile(r"\s+(?=\S)")
+# sentence-ending punctuation with optional closing quotes or brackets
+_SENT_END = re.compile(r"""[.?!]["'”’)\]}]*$""")
+
+
+class ConstantTypingModel(BaseTypingModel):
+    """ Type at a constant speed.
+    - args:
+        - speed: the typing speed in characters per minute
+    """
+    def __init__(self, speed: float):
+        self.speed = speed
+
+
+    def delays(self, pieces: list[str]) -> list[float]:
+        return [len(piece) / self.speed * 60 for piece in pieces]
+
+
+class LogNormalTypingModel(BaseTypingModel):
+    """ Type with log-normal inter-key intervals, pauses before the words and think time before the sentences.
+    The random numbers are drawn from a generator seeded once, so the delays of a sequence of texts are reproducible.
+
+    - args:
+        - speed: the typing speed in characters per minute within a burst, the mean inter-key interval is `60 / speed`.
+            The pauses are added to the intervals, so the average speed over a text is lower.
+        - sigma: the shape of the log-normal inter-key intervals, larger for burstier typing
+        - word_pause: the mean pause before a word (seconds), 0 to disable
+        - sentence_pause: the mean think time before a sentence (seconds), replaces the word pause, 0 to disable
+        - pause_sigma: the shape of the log-normal pauses
+        - seed: the seed of the random generator
+    """
+    def __init__(
+        self,
+        speed: float,
+        sigma: float = 0.5,
+        word_pause: float = 0.0,
+        sentence_pause: float = 0.0,
+        pause_sigma: float = 1.0,
+        seed: int|None = None,
+    ):
+        self.speed = speed
+        self.sigma = sigma
+        self.word_pause = word_pause
+        self.sentence_pause = sentence_pause
+        self.pause_sigma = pause_sigma
+        self.rng = numpy.random.default_rng(seed)
+
+
+    def delays(self, pieces: list[str]) -> list[float]:
+        text = "".join(pieces)
+        if not text:
+            return [0.0] * len(pieces)
+        intervals = self._lognormal(60 / self.speed, self.sigma, len(text))
+
+        # the indices of the first characters of the words and of the sentences
+        word_starts = []
+        sent_starts = []
+        for matched in _WORD_GAP.finditer(text):
+            if _SENT_END.search(text, max(matched.start() - 8, 0), matched.start()):
+                sent_starts.append(matched.end())
+            else:
+                word_starts.append(matched.end())
+        if self.sentence_pause <= 0:
+            word_starts += sent_starts
+            sent_starts = []
+        if self.word_pause > 0 and word_starts:
+            intervals[word_starts] += self._lognormal(self.word_pause, self.pause_sigma, len(word_starts))
+        if sent_starts:
+            intervals[sent_starts] += self._lognormal(self.sentence_pause, self.pause_sigma, len(sent_starts))
+
+        # the time of a piece is the sum of the intervals of its characters
+        times = numpy.concatenate(([0.0], numpy.cumsum(intervals)))
+        ends = numpy.cumsum([len(piece) for piece in pieces])
+        starts = ends - [len(piece) for piece in pieces]
+        return (times[ends] - times[starts]).tolist()
+
+
+    def _lognormal(self, mean: float, sigma: float, size: int) -> numpy.ndarray:
+        """ Draw from the log-normal distribution with the given mean """
+        return self.rng.lognormal(math.log(mean) - sigma ** 2 / 2, sigma, size)
+
+
+def get_typing_model(name: str, speed: float, seed: int|None = None) -> BaseTypingModel:
+    """ Return the typing model by name:
+        - "constant": type at the constant speed
+        - "lognormal": log-normal inter-key intervals at the speed, without pauses
+        - "bursty": log-normal inter-key intervals with pauses before the words and think time before the sentences
+    - args:
+        - name: the name of the typing model, can be "constant", "lognormal", "bursty"
+        - speed: the typing speed in characters per minute
+        - seed: the seed of the random typing models
+    """
+    match name:
+        case "constant":
+            return ConstantTypingModel(speed)
+        case "lognormal":
+            return LogNormalTypingModel(speed, seed=seed)
+        case "bursty":
+            return LogNormalTypingModel(speed, word_pause=0.25, sentence_pause=2.0, seed=seed)
+        case _:
+            raise ValueError(f"Unknown typing model: {name}")
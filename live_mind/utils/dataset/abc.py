@@ -1,5 +1,6 @@
 __all__ = ['BaseDataset']
 
+import logging
 from abc import ABC, abstractmethod
 
 class BaseDataset(ABC):
@@ -21,6 +22,12 @@ class BaseDataset(ABC):
     def add_str(self, entry: dict) -> str|None:
         pass
 
+    @staticmethod
+    @abstractmethod
+    def get_prediction(output: str, guess: bool=False, logger: logging.Logger|None=None) -> object|None:
+        """ Extract the prediction from the model output, return `None` if the extraction fails and `guess` is not set """
+        pass
+
     @property
     @abstractmethod
     def selected_questions(self) -> list:
@@ -0,0 +1,245 @@
+""" This script is used to run a load test against running model backends: many sessions type the questions concurrently
+in wall-clock time, each with its own async controller, and the observed latency of every session is recorded. """
+import json
+import pathlib
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+from live_mind import AsyncLMController
+from live_mind.controller import AsyncCompleteController, PREEMPT_MODES
+from live_mind.controller.abc import BaseAsyncController
+from live_mind.abc import AsyncBaseModel
+from live_mind.models import ThreadedAsyncModel, BatchScheduler
+from live_mind.models.instrumented import CallRecorder, instrument_async_model, summarize_calls
+from live_mind.formatter import LMFormatter, CoTFormatter
+from live_mind.text import RealTimeTextStreamer, get_segmenter, get_typing_model
+from live_mind.text.typing_models import TYPING_MODELS
+from live_mind.utils.dataset import BaseDataset
+from config import get_model
+from run_solver import FORMAT_MAP, GRAUNLARITIES, DATASET_MAP, DEFAULT_MIN_LEN, DEFAULT_INPUT_SPEED, SEED
+
+
+def load_model(name: str, batch_size: int = 0) -> AsyncBaseModel:
+    """ Load the model, the blocking models are run in the worker threads.
+    With `batch_size`, the requests of the sessions are batched into calls of at most `batch_size` messages. """
+    model = get_model(name)
+    if batch_size > 0:
+        return BatchScheduler(model, max_batch_size=batch_size)
+    # the models with non-blocking calls (e.g. the simulated models) are used directly
+    return model if isinstance(model, AsyncBaseModel) else ThreadedAsyncModel(model)
+
+
+async def run_session(
+    session_id: int,
+    controller: BaseAsyncController,
+    streamer: RealTimeTextStreamer,
+    start_delay: float,
+    overlap: bool = False,
+) -> dict:
+    """ Type the text of the streamer to the controller in wall-clock time, return the record of the session.
+    Without `overlap`, the controller is called with all the text arrived during the previous step, like `run_solver.main`.
+    With `overlap`, the controller is called on every arrival while the previous steps are still running, so the new input
+    preempts the running inference (the controller must be created with `preempt` other than "none").
+    """
+    await asyncio.sleep(start_delay)
+    streamer.start()
+    input_text = ""
+    num_steps = 0
+    num_responses = 0
+
+    async def run_step(text: str, stream_end: bool) -> str|None:
+        nonlocal num_responses
+        last_response = None
+        async for last_response in controller(text, stream_end=stream_end):
+            num_responses += 1
+        return last_response
+
+    steps: list[asyncio.Task] = []
+    final_step: asyncio.Task|None = None
+    final_seen_time = 0.0
+    while True:
+        next_text = await streamer.anext()
+        if next_text is None:
+            break
+        input_text += next_text
+        stream_end = streamer.empty()
+        if stream_end:
+            final_seen_time = streamer.elapsed()
+        num_steps += 1
+        step = asyncio.ensure_future(run_step(input_text, stream_end))
+        if stream_end:
+            final_step = step
+        if overlap:
+            steps.append(step)
+        else:
+            await step
+        if stream_end:
+            break
+    # the superseded steps return once the final step is scheduled
+    await asyncio.gather(*steps)
+    response = (final_step.result() if final_step is not None else None) or ""
+    end_time = streamer.elapsed()
+    controller.reset()
+    return {
+        "session": session_id,
+        "start_delay": start_delay,
+        "typing_time": streamer.last_gen_time,
+        # the time between the arrival of the final text and the response
+        "latency": end_time - streamer.last_gen_time,
+        # the time between the arrival of the final text and the call of the output stage (waiting for the running step
+        # without overlap, the preempted step is awaited by the controller with overlap)
+        "lag": final_seen_time - streamer.last_gen_time,
+        "num_steps": num_steps,
+        "num_responses": num_responses,
+        "response": response,
+    }
+
+
+async def run_loadtest(
+    new_controller,
+    dataset: BaseDataset,
+    num_sessions: int,
+    ramp_time: float,
+    streamer_kwargs: dict,
+    seed: int = SEED,
+    overlap: bool = False,
+) -> list[dict]:
+    """ Run `num_sessions` sessions concurrently on the selected questions of the dataset (repeated if there are fewer questions).
+    The start times of the sessions are drawn uniformly from `[0, ramp_time)`.
+    - args:
+        - new_controller: a function that returns a new controller for a session
+        - streamer_kwargs: the keyword arguments of the `RealTimeTextStreamer` besides the text and the final text
+        - overlap: call the controllers on every arrival without waiting for the running steps (see `run_session`)
+    """
+    rng = random.Random(seed)
+    questions = dataset.selected_questions
+    tasks = []
+    for session_id in range(num_sessions):
+        entry = questions[session_id % len(questions)]
+        streamer = RealTimeTextStreamer(entry["question"], final_text=dataset.add_str(entry), **streamer_kwargs)
+        tasks.append(run_session(session_id, new_controller(), streamer, rng.uniform(0, ramp_time), overlap))
+    records = await asyncio.gather(*tasks)
+    for record in records:
+        entry = questions[record["session"] % len(questions)]
+        record["question_id"] = entry.get("question_id")
+        record["correct"] = dataset.verify_answer(record["response"], entry["answer"])
+    return list(records)
+
+
+def summarize(records: list[dict], duration: float) -> dict:
+    """ The latency percentiles and the throughput of the load test """
+    latencies = [record["latency"] for record in records]
+    lags = [record["lag"] for record in records]
+    p50, p95, p99 = numpy.percentile(latencies, [50, 95, 99])
+    return {
+        "sessions": len(records),
+        "duration": duration,
+        "sessions_per_min": len(records) / duration * 60,
+        "latency_mean": float(numpy.mean(latencies)),
+        "latency_p50": float(p50),
+        "latency_p95": float(p95),
+        "latency_p99": float(p99),
+        "latency_max": float(numpy.max(latencies)),
+        "lag_p95": float(numpy.percentile(lags, 95)),
+        "accuracy": sum(record["correct"] for record in records) / len(records),
+    }
+
+
+DEFAULT_NUM_SESSIONS = 16
+DEFAULT_NUM_QUESTIONS = 16
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test: concurrent sessions typing in wall-clock time against the model backends")
+    parser.add_argument("-i",  "--infer-model",   metavar="M",    type=str, default=None, help="inference model")
+    parser.add_argument("-o",  "--out-model",     metavar="M",    type=str, default=None, help="output model, default: the inference model")
+    parser.add_argument("-pf", "--prompt-format", metavar="FMT",  type=str, default="ua-spi", choices=FORMAT_MAP.keys(), help=f"prompt format, can be {', '.join(FORMAT_MAP.keys())}, default: ua-spi")
+    parser.add_argument("-g",  "--granularity",   metavar="G",    type=str, default="clause-fast", choices=GRAUNLARITIES, help=f"granularity of the segmenter, can be {', '.join(GRAUNLARITIES)}, default: clause-fast")
+    parser.add_argument("-d",  "--dataset",       metavar="D",    type=str, default="mmlu-pro", choices=DATASET_MAP.keys(), help=f"dataset of the questions, can be {', '.join(DATASET_MAP.keys())}, default: mmlu-pro")
+    parser.add_argument("-f",  "--output-file",   metavar="File", type=str, default=None, help="output the session records and the summary to a json file")
+    parser.add_argument("-is", "--input-speed",   metavar="S",    type=int, default=DEFAULT_INPUT_SPEED, help=f"input speed in characters per minute, default: {DEFAULT_INPUT_SPEED}")
+    parser.add_argument("--typing",              metavar="T",    type=str, default="constant", choices=TYPING_MODELS, help=f"typing model of the input, can be {', '.join(TYPING_MODELS)}, default: constant")
+    parser.add_argument("-n", "--num-questions", metavar="N", type=int, default=DEFAULT_NUM_QUESTIONS, help=f"number of questions per category, default: {DEFAULT_NUM_QUESTIONS}")
+    parser.add_argument("-s", "--sessions",      metavar="N", type=int, default=DEFAULT_NUM_SESSIONS, help=f"number of concurrent sessions, default: {DEFAULT_NUM_SESSIONS}")
+    parser.add_argument("--ramp",                metavar="S", type=float, default=0.0, help="the sessions start at random times within S seconds, default: 0 (all at once)")
+    parser.add_argument("--min-len",             metavar="N", type=int, default=DEFAULT_MIN_LEN, help=f"minimum length of the segment if using sent or clause granularity (or the -fast versions), default: {DEFAULT_MIN_LEN}")
+    parser.add_argument("--preempt",             metavar="P", type=str, default="none", choices=PREEMPT_MODES, help=f"preemption of the running inference by new input, the controller is called on every arrival while the steps run if set, can be {', '.join(PREEMPT_MODES)}, default: none")
+    parser.add_argument("--workers",             metavar="N", type=int, default=None, help="number of threads for the blocking model calls, default: 2 per session")
+    parser.add_argument("--batch",               metavar="N", type=int, default=0, help="batch the inference requests of the sessions into calls of at most N messages (non-streamed), 0 to disable, default: 0")
+    parser.add_argument("--no-lm", action="store_false", dest="lm", default=True, help="disable LiveMind framework, use baseline solver instead")
+    args = parser.parse_args()
+
+    dataset_class, dataset_path = DATASET_MAP[args.dataset]
+    if not dataset_path:
+        raise ValueError(f"Please set the path to the {args.dataset} dataset in config.py")
+    dataset = dataset_class(dataset_path)
+    dataset.select(args.num_questions, randomize=True, seed=SEED, split='test')
+
+    infer_model_name: str|None = args.infer_model
+    out_model_name: str|None = args.out_model or infer_model_name
+    if out_model_name is None:
+        raise ValueError("Please specify the inference model or the output model")
+    # record the queue wait, time to first token, decode rate and sizes of every model call
+    recorder = CallRecorder()
+    model = load_model(out_model_name)
+    output_model = instrument_async_model(model, "output", recorder)
+    if args.lm:
+        if infer_model_name is None:
+            raise ValueError("Please specify the inference model")
+        if args.batch > 0:
+            model = load_model(infer_model_name, args.batch)
+        elif infer_model_name != out_model_name:
+            model = load_model(infer_model_name)
+        # the stages are recorded by separate wrappers, even if they share the model
+        inference_model = instrument_async_model(model, "inference", recorder)
+        formatter = LMFormatter(FORMAT_MAP[args.prompt_format])
+        seg_kwargs = {"min_len": args.min_len} if args.granularity in ["sent", "clause", "sent-fast", "clause-fast"] else {}
+
+        def new_controller() -> BaseAsyncController:
+            # the segmenters can be stateful, every session has its own segmenter
+            return AsyncLMController(
+                get_segmenter(args.granularity, **seg_kwargs),
+                formatter,
+                inference_model,
+                output_model,
+                answer_format=dataset.answer_format,
+                preempt=args.preempt,
+            )
+    else:
+        formatter = CoTFormatter()
+
+        def new_controller() -> BaseAsyncController:
+            return AsyncCompleteController(formatter, output_model, answer_format=dataset.answer_format)
+
+    def delay_fn(text: str) -> float:
+        return len(text) / args.input_speed * 60
+    streamer_kwargs = {"delay_fn": delay_fn}
+    if args.typing != "constant":
+        streamer_kwargs["typing_model"] = get_typing_model(args.typing, args.input_speed, seed=SEED)
+
+    async def main() -> tuple[list[dict], float]:
+        # the blocking model calls run in threads, one in-flight call per stage and session
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.workers or 2 * args.sessions))
+        start = time.monotonic()
+        # the new input preempts the running inference only if the steps overlap
+        overlap = args.lm and args.preempt != "none"
+        records = await run_loadtest(new_controller, dataset, args.sessions, args.ramp, streamer_kwargs, overlap=overlap)
+        return records, time.monotonic() - start
+
+    records, duration = asyncio.run(main())
+    summary = summarize(records, duration)
+    for key, value in summary.items():
+        print(f"{key:<17} {value:.3f}" if isinstance(value, float) else f"{key:<17} {value}")
+    call_summary = summarize_calls(recorder.drain())
+    for stage, stats in call_summary.items():
+        print(
+            f"Model calls ({stage}): {stats['calls']} calls, queue wait {stats['queue_wait']:.3f}s, "
+            f"TTFT mean {stats['ttft']:.3f}s, p95 {stats['ttft_p95']:.3f}s, decode {stats['decode_rate']:.1f} tok/s"
+        )
+    if args.output_file:
+        print(f"Writing results to {args.output_file}")
+        pathlib.Path(args.output_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output_file, "w", encoding='utf-8') as file:
+            json.dump({"args": vars(args), "summary": summary, "model_calls": call_summary, "sessions": records}, file, indent=4)
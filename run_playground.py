@@ -3,7 +3,8 @@ from playground import get_stream_model, SUPPORTED_MODELS
 from playground.gradio import LMGradioInterface
 from live_mind.formatter import LMFormat, LMFormatter, CoTFormatter
 from live_mind import LMStreamController, CompleteStreamController
-from live_mind.text import get_segmenter
+from live_mind.text import get_segmenter, get_tokenizer
+from live_mind.action.cache import TreeActionCache
 
 FORMAT_MAP = {
     "u-pi"  : LMFormat.U_PI,
@@ -11,8 +12,9 @@ FORMAT_MAP = {
     "ua-pil": LMFormat.UA_PIL,
     "u-spi" : LMFormat.U_SPI,
     "ua-spi": LMFormat.UA_SPI,
+    "ua-spa": LMFormat.UA_SPA,
 }
-GRAUNLARITIES = ["char", "word", "sent", "clause"]
+GRAUNLARITIES = ["char", "word", "sent", "clause", "sent-fast", "clause-fast", "token"]
 DEFAULT_MIN_LEN = 3
 
 if __name__ == "__main__":
@@ -22,7 +24,10 @@ if __name__ == "__main__":
     parser.add_argument("-pf", "--prompt-format", metavar="FMT",  type=str, default="ua-spi", choices=FORMAT_MAP.keys(), help=f"prompt format, can be {', '.join(FORMAT_MAP.keys())}")
     parser.add_argument("-g",  "--granularity",   metavar="G",    type=str, default="clause", choices=GRAUNLARITIES, help=f"granularity of the text streamer, can be {', '.join(GRAUNLARITIES)}")
     parser.add_argument("--log",     action="store_false",  dest="log",  default=False, help="log the results")
-    parser.add_argument("--min-len",             metavar="N", type=int, default=DEFAULT_MIN_LEN, help=f"minimum length of the segment if using sent or clause granularity, default: {DEFAULT_MIN_LEN}")
+    parser.add_argument("--min-len",             metavar="N", type=int, default=DEFAULT_MIN_LEN, help=f"minimum length of the segment if using sent or clause granularity (or the -fast versions), default: {DEFAULT_MIN_LEN}")
+    parser.add_argument("--tokenizer", metavar="Path", type=str, default=None, help="tokenizer.json file (or model directory) for the token granularity, default: regex approximation")
+    parser.add_argument("--incremental-seg", action="store_true", help="segment only the new input on each keystroke (IncrementalSegmenter) instead of the whole input")
+    parser.add_argument("--tree-cache",          metavar="N", type=int, default=0, help="keep the inferences of the edited input in a branching action cache with at most N entries, default: 0 (disabled)")
 
     args = parser.parse_args()
 
@@ -43,16 +48,19 @@ if __name__ == "__main__":
 
     prompt_format = FORMAT_MAP[args.prompt_format]
     formatter = LMFormatter(prompt_format)
-    if args.granularity in ["sent", "clause"]:
+    if args.granularity in ["sent", "clause", "sent-fast", "clause-fast"]:
         seg_kwargs = {"min_len": args.min_len}
+    elif args.granularity == "token":
+        seg_kwargs = {"tokenizer": get_tokenizer(args.tokenizer)}
     else:
         seg_kwargs = {}
-    segmenter = get_segmenter(args.granularity, **seg_kwargs)
+    segmenter = get_segmenter(args.granularity, incremental=args.incremental_seg, **seg_kwargs)
     lm_controller = LMStreamController(
         segmenter=segmenter,
         formatter=formatter,
         infer_model=infer_model,
         output_model=out_model,
+        action_cache=TreeActionCache(args.tree_cache) if args.tree_cache > 0 else None,
     )
     base_controller = CompleteStreamController(CoTFormatter(), out_model)
 
@@ -0,0 +1,37 @@
+""" This script serves a simulated model with the Ollama /api/chat protocol, to benchmark the clients and the controllers
+end to end without model weights, e.g. `OLLAMA_URL=http://127.0.0.1:11434 python run_solver.py -i llama3.2:1b ...` """
+import argparse
+from live_mind.models import SimulatedModel, SimulatedOllamaServer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a simulated model with the Ollama /api/chat protocol")
+    parser.add_argument("--host",              metavar="H", type=str,   default="127.0.0.1", help="host to bind, default: 127.0.0.1")
+    parser.add_argument("--port",              metavar="P", type=int,   default=11434, help="port to bind, default: 11434")
+    parser.add_argument("--ttft",              metavar="S", type=float, default=0.05, help="time to first token of an empty prompt (seconds), default: 0.05")
+    parser.add_argument("--prefill-per-token", metavar="S", type=float, default=0.0002, help="prefill time per input token (seconds), default: 0.0002")
+    parser.add_argument("--decode-rate",       metavar="R", type=float, default=50.0, help="decoded tokens per second, default: 50")
+    parser.add_argument("--jitter",            metavar="S", type=float, default=0.1, help="sigma of the log-normal jitter of the timings, default: 0.1")
+    parser.add_argument("--wait-weight",       metavar="W", type=float, default=1.0, help="weight of the wait action against the inference action (weight 1), default: 1")
+    parser.add_argument("--content-tokens",    metavar="N", type=int,   default=24, help="mean number of tokens of a content, default: 24")
+    parser.add_argument("--answers",           metavar="C", type=str,   default="ABCD", help="choices of the answers, default: ABCD")
+    parser.add_argument("--seed",              metavar="S", type=int,   default=0, help="seed of the responses, default: 0")
+    args = parser.parse_args()
+
+    simulated = SimulatedModel(
+        ttft=args.ttft,
+        prefill_per_token=args.prefill_per_token,
+        decode_rate=args.decode_rate,
+        jitter=args.jitter,
+        action_weights={"inference": 1.0, "wait": args.wait_weight},
+        content_tokens=args.content_tokens,
+        answers=args.answers,
+        seed=args.seed,
+    )
+    server = SimulatedOllamaServer(simulated, args.host, args.port)
+    print(f"Serving the simulated model at {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
@@ -4,14 +4,24 @@ import logging
 import pathlib
 import argparse
 import time
+import numpy
 from tqdm import tqdm
 from live_mind import LMController, CompleteController
+from live_mind.controller import AdaptiveThrottle, ActionAnswerVerifier
+from live_mind.models import CachedModel
+from live_mind.models.instrumented import CallRecorder, instrument_model, summarize_calls
 from live_mind.controller.abc import BaseController
-from live_mind.formatter import LMFormatter, CoTFormatter, LMFormat
+from live_mind.formatter import LMFormatter, CoTFormatter, LMFormat, ActionStreamParser, TokenBudget
+from live_mind.action.actions import Inference
+from live_mind.abc import BaseStreamModel
 from live_mind.text import (
     TextStreamer,
     get_segmenter,
+    get_tokenizer,
+    get_typing_model,
 )
+from live_mind.text.abc import BaseTokenizer, BaseTypingModel
+from live_mind.text.typing_models import TYPING_MODELS
 from live_mind.utils.dataset import MMLUProDataset, BaseDataset, MMLUDataset
 from config import BaseModel, MMLU_PRO_PATH, MMLU_PATH, get_model
 
@@ -23,10 +33,28 @@ def main(
     dataset: BaseDataset,
     input_speed: int, # characters per minute
     output_file: str|None=None,
+    pipeline: bool=False,
+    input_tokenizer: BaseTokenizer|None=None,
+    typing_model: BaseTypingModel|None=None,
+    recorder: CallRecorder|None=None,
 ):
+    """ Run the solver on the selected questions of the dataset.
+    If `input_tokenizer` is set, the question is streamed token by token instead of character by character.
+    If `typing_model` is set, the question is typed with the typing model instead of the constant `input_speed`.
+    If `recorder` is set (the recorder of the instrumented models, see `live_mind.models.instrumented`), the records of
+    the model calls are saved in `model_calls` of the entries: `model_calls[i]` are the calls of the steps of `actions[i]`.
+    If `pipeline` is set, the inference stage is simulated as a background stage (see `live_mind.LMPipeline`):
+    the inference running when the final text arrives is preempted and discarded, and the output stage starts immediately.
+    """
+    if pipeline:
+        assert isinstance(controller, LMController), "pipeline mode requires the LiveMind controller"
     # warm up the models
     inference_model.chat_complete([{"role": "user", "content": "Hello"}])
     output_model.chat_complete([{"role": "user", "content": "Hello"}])
+    if recorder is not None:
+        # drop the records of the warm-up calls
+        recorder.drain()
+    call_list: list[dict] = []
     entry_list = []
     num_correct = 0
     num_total = 0
@@ -35,6 +63,10 @@ def main(
     def delay_fn(text: str) -> float: # delay function to simulate the typing speed (seconds)
         return len(text) / input_speed * 60
 
+    if isinstance(controller, LMController) and isinstance(controller.throttle, AdaptiveThrottle):
+        # the arrival times of the prompts are measured with the simulated clock of the current streamer
+        controller.throttle.clock = lambda: streamer.current_time
+
     tqdm_bar = tqdm(dataset.selected_questions)
     for entry in tqdm_bar:
         question = entry["question"]
@@ -42,18 +74,27 @@ def main(
         streamer = TextStreamer(
             question,
             delay_fn=delay_fn,
-            final_text=final_text
+            granularity="char" if input_tokenizer is None else "token",
+            final_text=final_text,
+            config={} if input_tokenizer is None else {"tokenizer": input_tokenizer},
+            typing_model=typing_model,
         )
         # Initialize the information to be recorded
         total_gen_time: float = 0  # the total time for the model to generate the responses
         # actions consists of the new prompt and actions taken by the model at each step
         # each list in the `actions` list is composed of the new prompt (the first item) and the actions taken by the model (the rest of the items)
         actions: list[list[str]] = []
+        # the records of the model calls, aligned with `actions`, and the records of the steps without actions
+        model_calls: list[list[dict]] = []
+        step_calls: list[dict] = []
 
         # current input text
         input_text = ""
         gen_time = 0.0
         new_prompt = ""
+        # the cache before the last step and whether the last step produced actions (pipeline mode)
+        snapshot = None
+        last_step_actions = False
         while True:
             # the streamers is waiting for the LLM's response
             next_text = streamer.wait(gen_time)
@@ -65,28 +106,47 @@ def main(
                     break
             input_text += next_text
             stream_end = streamer.empty() # This is the last text
+            if pipeline and stream_end and snapshot is not None and streamer.current_time > streamer.last_gen_time:
+                # the last inference is still running when the final text arrives: preempt it
+                # and start the output stage when the final text arrives
+                controller.action_cache.restore(snapshot)
+                if last_step_actions:
+                    new_prompt = actions.pop()[0] + new_prompt
+                    if recorder is not None:
+                        step_calls = model_calls.pop() + step_calls
+                streamer.current_time = streamer.last_gen_time
+            if pipeline:
+                snapshot = controller.action_cache.snapshot()
             resp_gen = controller(input_text, stream_end=stream_end)
 
             new_prompt += next_text
             gen_time = 0.0
             step_actions = []
-            start_time = time.time()
+            start_time = time.perf_counter()
             response = ""
             try:
                 for response in resp_gen:
-                    step_gen_time = time.time() - start_time
+                    step_gen_time = time.perf_counter() - start_time
                     step_actions.append(response)
                     gen_time += step_gen_time
-                    start_time = time.time()
+                    start_time = time.perf_counter()
+                # the work after the last response (e.g. the summarization of the stream controllers) is part of the step
+                gen_time += time.perf_counter() - start_time
             except ValueError:
                 streamer.flush()
                 stream_end = True
                 total_gen_time += gen_time
                 gen_time =  0.0
 
+            last_step_actions = bool(step_actions)
+            if recorder is not None:
+                step_calls += recorder.drain()
             if step_actions:
                 actions.append([new_prompt]+step_actions)
                 new_prompt = ""
+                if recorder is not None:
+                    model_calls.append(step_calls)
+                    step_calls = []
 
             total_gen_time += gen_time
 
@@ -102,6 +162,9 @@ def main(
         latency = streamer.current_time - streamer.last_gen_time
         if new_prompt:
             actions.append([new_prompt])
+            model_calls.append(step_calls)
+        elif step_calls and model_calls:
+            model_calls[-1] += step_calls
 
         is_correct: bool = dataset.verify_answer(response, entry["answer"])
         if is_correct:
@@ -117,6 +180,9 @@ def main(
         # save info to the entry
         entry["actions"] = actions
         entry["time_info"] = time_info
+        if recorder is not None:
+            entry["model_calls"] = model_calls
+            call_list += [call for calls in model_calls for call in calls]
         entry["correct"] = is_correct
         entry_list.append(entry)
 
@@ -124,6 +190,15 @@ def main(
         tqdm_bar.set_description(f"Accuracy: {num_correct/num_total:.2f}")
 
     print(f"Accuracy: {num_correct/num_total:.2f}")
+    latencies = [entry["time_info"]["latency"] for entry in entry_list]
+    p50, p95, p99 = numpy.percentile(latencies, [50, 95, 99])
+    print(f"Latency: mean {numpy.mean(latencies):.2f}s, p50 {p50:.2f}s, p95 {p95:.2f}s, p99 {p99:.2f}s")
+    for stage, stats in summarize_calls(call_list).items():
+        print(
+            f"Model calls ({stage}): {stats['calls']} calls, TTFT mean {stats['ttft']:.3f}s, p95 {stats['ttft_p95']:.3f}s, "
+            f"decode {stats['decode_rate']:.1f} tok/s, queue wait {stats['queue_wait']:.3f}s, "
+            f"prompt {stats['prompt_tokens']:.0f} tok, completion {stats['completion_tokens']:.0f} tok"
+        )
     if output_file:
         print(f"Writing results to {output_file}")
         pathlib.Path(output_file).parent.mkdir(parents=True, exist_ok=True)
@@ -137,8 +212,9 @@ FORMAT_MAP = {
     "ua-pil": LMFormat.UA_PIL,
     "u-spi" : LMFormat.U_SPI,
     "ua-spi": LMFormat.UA_SPI,
+    "ua-spa": LMFormat.UA_SPA,
 }
-GRAUNLARITIES = ["char", "word", "sent", "clause"]
+GRAUNLARITIES = ["char", "word", "sent", "clause", "sent-fast", "clause-fast", "token"]
 DATASET_MAP = {
     "mmlu-pro": (MMLUProDataset, MMLU_PRO_PATH),
     "mmlu": (MMLUDataset, MMLU_PATH),
@@ -158,11 +234,24 @@ if __name__ == "__main__":
     parser.add_argument("-d",  "--dataset",       metavar="D",    type=str, default=None, choices=DATASET_MAP.keys(), help=f"dataset to run the solver on, can be {', '.join(DATASET_MAP.keys())}")
     parser.add_argument("-f",  "--output-file",   metavar="File", type=str, nargs="?", default=False, const=True, help="output results to a json file")
     parser.add_argument("-is", "--input-speed",   metavar="S",    type=int, default=DEFAULT_INPUT_SPEED, help=f"input speed in characters per minute, default: {DEFAULT_INPUT_SPEED}")
+    parser.add_argument("--typing",              metavar="T",    type=str, default="constant", choices=TYPING_MODELS, help=f"typing model of the input, can be {', '.join(TYPING_MODELS)} (log-normal inter-key intervals, with word pauses and sentence think time for bursty), default: constant")
     parser.add_argument("--no-lm",   action="store_false",  dest="lm",   default=True,  help="disable LiveMind framework, use baseline solver instead")
     parser.add_argument("--log",     action="store_false",  dest="log",  default=False, help="log the results")
     parser.add_argument("-n", "--num-questions", metavar="N", type=int, default=DEFAULT_NUM_QUESTIONS, help=f"number of questions per category, -1 for all questions, default: {DEFAULT_NUM_QUESTIONS}")
-    parser.add_argument("--min-len",             metavar="N", type=int, default=DEFAULT_MIN_LEN, help=f"minimum length of the segment if using sent or clause granularity, default: {DEFAULT_MIN_LEN}")
+    parser.add_argument("--min-len",             metavar="N", type=int, default=DEFAULT_MIN_LEN, help=f"minimum length of the segment if using sent or clause granularity (or the -fast versions), default: {DEFAULT_MIN_LEN}")
     parser.add_argument("--overwrite", action="store_true", help="overwrite the output file if it exists")
+    parser.add_argument("--summarize-len", metavar="N", type=int, default=-1, help="summarize the inferences when their number exceeds N, -1 to disable, default: -1")
+    parser.add_argument("--early-answer", action="store_true", help="skip the output model if a cached inference already states the answer")
+    parser.add_argument("--early-answer-max-new", metavar="N", type=int, default=DEFAULT_MIN_LEN, help=f"skip the output model only if the answering inference has seen all but at most N characters of the input (e.g. not the options of the final text), default: {DEFAULT_MIN_LEN}")
+    parser.add_argument("--throttle", action="store_true", help="skip inferences that cannot complete before the next segment arrives (adaptive throttling)")
+    parser.add_argument("--response-cache", metavar="File", type=str, default=None, help="cache the model responses in an SQLite database, reruns with the same prompts are served from the cache")
+    parser.add_argument("--pipeline", action="store_true", help="simulate the pipelined inference stage: preempt the running inference when the final text arrives")
+    parser.add_argument("--incremental-seg", action="store_true", help="segment only the new input on each step (IncrementalSegmenter) instead of the whole input")
+    parser.add_argument("--tokenizer", metavar="Path", type=str, default=None, help="tokenizer.json file (or model directory) for the token granularity and --token-input, default: regex approximation")
+    parser.add_argument("--token-input", action="store_true", help="stream the questions token by token instead of character by character")
+    parser.add_argument("--token-budget", metavar="N", type=int, default=-1, help="reduce the cached prompts and inferences to fit the messages into N tokens (counted with --tokenizer), -1 to disable, default: -1")
+    parser.add_argument("--early-stop", action="store_true", help="stream the inference responses and stop the generation once 'action wait.' or an off-format response is recognized (stream models only)")
+    parser.add_argument("--max-infer-tokens", metavar="N", type=int, default=-1, help="with --early-stop, stop the inference responses after N tokens, -1 to disable, default: -1")
     args = parser.parse_args()
 
     # check arguments
@@ -197,7 +286,7 @@ if __name__ == "__main__":
         if out_model_name is None:
             print("Warning: --out-model is not set, use the inference model as output model")
             out_model_name = infer_model_name
-        if args.granularity not in ["sent", "clause"] and args.min_len != DEFAULT_MIN_LEN:
+        if args.granularity not in ["sent", "clause", "sent-fast", "clause-fast"] and args.min_len != DEFAULT_MIN_LEN:
             print("Warning: --granularity is not 'sent' or 'clause', the minimum length will be ignored")
     else: # baseline
         if out_model_name is None:
@@ -210,6 +299,22 @@ if __name__ == "__main__":
             print("Warning: --no-lm is set, the granularity will be ignored")
         if args.min_len != DEFAULT_MIN_LEN:
             print("Warning: --no-lm is set, the minimum length will be ignored")
+        if args.pipeline:
+            print("Warning: --no-lm is set, the pipeline mode will be ignored")
+            args.pipeline = False
+        if args.summarize_len >= 0:
+            print("Warning: --no-lm is set, the summarization will be ignored")
+        if args.early_answer:
+            print("Warning: --no-lm is set, the early answer will be ignored")
+        if args.throttle:
+            print("Warning: --no-lm is set, the throttling will be ignored")
+            args.throttle = False
+        if args.incremental_seg:
+            print("Warning: --no-lm is set, the incremental segmentation will be ignored")
+        if args.early_stop:
+            print("Warning: --no-lm is set, the early stop will be ignored")
+        if args.token_budget > 0:
+            print("Warning: --no-lm is set, the token budget will be ignored")
 
     # logger configuration
     logger: logging.Logger|None = None
@@ -222,31 +327,64 @@ if __name__ == "__main__":
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
 
+    def load_model(name: str, stop_parser: ActionStreamParser|None = None) -> BaseModel:
+        model = get_model(name)
+        if args.response_cache:
+            model = CachedModel(model, model_id=name, path=args.response_cache, stop_parser=stop_parser)
+        return model
+
+    tokenizer = get_tokenizer(args.tokenizer)
+    # record the time to first token, decode rate and sizes of every model call
+    recorder = CallRecorder(tokenizer)
+    typing_model = get_typing_model(args.typing, args.input_speed, seed=SEED)
+
     # set the solver
     if use_lm: # LiveMind framework
         assert infer_model_name
-        inference_model = get_model(infer_model_name)
+        action_parser = None
+        if args.early_stop:
+            max_tokens = {Inference: args.max_infer_tokens} if args.max_infer_tokens > 0 else None
+            action_parser = ActionStreamParser(max_tokens=max_tokens)
+        # the responses stopped by the parser are cached with its settings
+        inference_model = load_model(infer_model_name, action_parser)
+        if action_parser is not None:
+            # the cache is a stream model, it streams only if the cached model does
+            base_model = inference_model.model if isinstance(inference_model, CachedModel) else inference_model
+            if not isinstance(base_model, BaseStreamModel):
+                print("Warning: the inference model is not a stream model, the early stop will be ignored")
         if out_model_name != infer_model_name:
-            output_model = get_model(out_model_name)
+            output_model = load_model(out_model_name)
         else:
             output_model = inference_model
-        if args.granularity in ["sent", "clause"]:
+        # the stages are recorded by separate wrappers, even if they share the model
+        output_model = instrument_model(output_model, "output", recorder)
+        inference_model = instrument_model(inference_model, "inference", recorder)
+        if args.granularity in ["sent", "clause", "sent-fast", "clause-fast"]:
             seg_kwargs = {"min_len": args.min_len}
         else:
             seg_kwargs = {}
-        segmenter = get_segmenter(args.granularity, **seg_kwargs)
+        if args.granularity == "token":
+            seg_kwargs = {"tokenizer": tokenizer}
+        segmenter = get_segmenter(args.granularity, incremental=args.incremental_seg, **seg_kwargs)
         format = FORMAT_MAP[args.prompt_format]
-        formmatter = LMFormatter(format)
+        formmatter = LMFormatter(format, token_budget=TokenBudget(args.token_budget, tokenizer) if args.token_budget > 0 else None)
 
+        if args.early_answer and all(len(dataset.add_str(entry)) > args.early_answer_max_new for entry in dataset.selected_questions):
+            # e.g. the options of MMLU(-Pro), a guess before the options must not skip the output model
+            print(f"Warning: the final text of every question exceeds {args.early_answer_max_new} characters, the early answer will never apply")
         controller: BaseController = LMController(
             segmenter,
             formmatter,
             inference_model,
             output_model,
             answer_format=dataset.answer_format,
+            throttle=AdaptiveThrottle() if args.throttle else None,
+            summarize_len=args.summarize_len,
+            answer_verifier=ActionAnswerVerifier(dataset.get_prediction, max_new_len=args.early_answer_max_new) if args.early_answer else None,
+            action_parser=action_parser,
         )
     else: # baseline
-        output_model = get_model(out_model_name)
+        output_model = instrument_model(load_model(out_model_name), "output", recorder)
         inference_model = output_model
         controller = CompleteController(
             CoTFormatter(),
@@ -261,6 +399,24 @@ if __name__ == "__main__":
                 g_str = args.granularity
                 num_q_str = f"{args.num_questions}q"
                 input_speed_str = f"{args.input_speed}cpm"
+                if args.typing != "constant":
+                    input_speed_str += f"_{args.typing}"
+                if args.summarize_len >= 0:
+                    num_q_str += f"_sum{args.summarize_len}"
+                if args.early_answer:
+                    num_q_str += "_early"
+                if args.throttle:
+                    num_q_str += "_throttle"
+                if args.pipeline:
+                    num_q_str += "_pipeline"
+                if args.token_input:
+                    num_q_str += "_tokin"
+                if args.token_budget > 0:
+                    num_q_str += f"_budget{args.token_budget}"
+                if args.early_stop:
+                    num_q_str += "_estop"
+                    if args.max_infer_tokens > 0:
+                        num_q_str += f"{args.max_infer_tokens}"
                 output_file: str|None = f"./output/{dataset_name}/lm_{infer_model_name}_{out_model_name}_{args.prompt_format}_{g_str}_{input_speed_str}_{num_q_str}.json"
             else:
                 output_file = f"./output/{dataset_name}/base_{out_model_name}_{args.num_questions}q.json"
@@ -284,4 +440,8 @@ if __name__ == "__main__":
         input_speed=args.input_speed,
         dataset=dataset,
         output_file=output_file,
+        pipeline=args.pipeline,
+        input_tokenizer=tokenizer if args.token_input else None,
+        typing_model=typing_model if args.typing != "constant" else None,
+        recorder=recorder,
     )